@@ -0,0 +1,129 @@
+"""Benchmark of the web indexer fetcher against local stand-in HTTP servers.
+
+Each stand-in server plays one host: it answers every request after a fixed
+latency with a page of a fixed size, and records the highest number of
+requests it served at the same time. The benchmark fetches the same URLs with
+a new session per request (the previous behaviour) and with ``HttpFetcher``
+under several limits, and reports pages per second and the peak per-host
+concurrency.
+
+Usage:
+    python evaluation/benchmark_fetcher.py --hosts 4 --pages 400 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+import aiohttp
+from aiohttp import web
+
+from retrieval_agents.utils.fetcher import HttpFetcher
+
+
+class StandInHost:
+    """Local HTTP server standing in for one documentation host."""
+
+    def __init__(self, latency: float, page_bytes: int) -> None:
+        """Initialize the server."""
+        self.latency = latency
+        self.body = ("x" * page_bytes).encode()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.url = ""
+        self._runner: web.AppRunner
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """Serve a page after the configured latency."""
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            return web.Response(body=self.body, content_type="text/html")
+        finally:
+            self.in_flight -= 1
+
+    async def start(self) -> None:
+        """Listen on a free local port."""
+        app = web.Application()
+        app.router.add_get("/{path:.*}", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]  # type: ignore[union-attr]
+        self.url = f"http://127.0.0.1:{port}"
+
+    async def stop(self) -> None:
+        """Stop the server."""
+        await self._runner.cleanup()
+
+
+async def session_per_request(urls: list[str], concurrency: int) -> None:
+    """Fetch every URL with its own session, as a loader without reuse does."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(url: str) -> None:
+        async with semaphore, aiohttp.ClientSession() as session:
+            async with session.get(url) as response:
+                await response.read()
+
+    await asyncio.gather(*(fetch(url) for url in urls))
+
+
+def with_fetcher(**kwargs: float) -> Callable[[list[str], int], Awaitable[None]]:
+    """Return a runner fetching the URLs with a shared ``HttpFetcher``."""
+
+    async def run(urls: list[str], concurrency: int) -> None:
+        async with HttpFetcher(max_concurrency=concurrency, **kwargs) as fetcher:  # type: ignore[arg-type]
+            await asyncio.gather(*(fetcher.fetch(url) for url in urls))
+
+    return run
+
+
+async def main(args: argparse.Namespace) -> None:
+    """Run every scenario and print a report."""
+    hosts = [StandInHost(args.latency, args.page_bytes) for _ in range(args.hosts)]
+    for host in hosts:
+        await host.start()
+    urls = [f"{hosts[i % len(hosts)].url}/page/{i}" for i in range(args.pages)]
+    scenarios: dict[str, Callable[[list[str], int], Awaitable[None]]] = {
+        "session per request": session_per_request,
+        "fetcher, 1 per host": with_fetcher(per_host_concurrency=1),
+        "fetcher, 4 per host": with_fetcher(per_host_concurrency=4),
+        f"fetcher, {args.concurrency} per host": with_fetcher(
+            per_host_concurrency=args.concurrency
+        ),
+        f"fetcher, 4 per host, {args.rate:g} req/s": with_fetcher(
+            per_host_concurrency=4, per_host_rate=args.rate
+        ),
+    }
+    print(  # noqa: T201
+        f"{args.pages} pages of {args.page_bytes} bytes on {args.hosts} hosts, "
+        f"{args.latency * 1000:.0f} ms latency, global concurrency {args.concurrency}"
+    )
+    print(f"{'scenario':<36}{'seconds':>10}{'pages/s':>10}{'peak/host':>11}")  # noqa: T201
+    try:
+        for name, run in scenarios.items():
+            for host in hosts:
+                host.max_in_flight = 0
+            started_at = time.perf_counter()
+            await run(urls, args.concurrency)
+            seconds = time.perf_counter() - started_at
+            peak = max(host.max_in_flight for host in hosts)
+            print(f"{name:<36}{seconds:>10.2f}{args.pages / seconds:>10.1f}{peak:>11}")  # noqa: T201
+    finally:
+        for host in hosts:
+            await host.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hosts", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--page-bytes", type=int, default=50_000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--rate", type=float, default=20.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,144 @@
+"""Benchmark of hybrid retrieval against vector-only retrieval.
+
+The benchmark indexes synthetic chunks in a temporary local vector store and
+lexical index, searched through the retrievers the agents build. One chunk in
+ten mentions an error code; the queries ask for one of those codes. Query
+embedding goes through a stand-in encoder that waits a fixed latency, as a
+remote embedding API does, and every mode starts without remembered query
+embeddings. The benchmark reports the latency of the vector search alone, of
+the BM25 search alone and of the fused hybrid search, together with how often
+the chunk that mentions the code is in the top ``k`` (random embeddings cannot
+find it, so this only shows what the lexical side adds).
+
+Usage:
+    python evaluation/benchmark_hybrid.py --chunks 20000 --queries 200 --latency 0.02
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import Awaitable, Callable, cast
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from retrieval_agents.configurations import IndexerConfiguration
+from retrieval_agents.modules.retrieval import (
+    close_pools,
+    make_hybrid_retriever,
+    make_local_retriever,
+    with_chunk_ids,
+)
+from retrieval_agents.utils import scored_search
+from retrieval_agents.utils.blocking import run_blocking
+from retrieval_agents.utils.local_vectorstore import LocalVectorStore
+
+WORDS = "index shard query cache replica node disk timeout retry quota".split()
+
+
+class SlowEmbedding(DeterministicFakeEmbedding):
+    """Fake encoder that waits before embedding a query, like a remote API."""
+
+    latency: float = 0.0
+
+    def embed_query(self, text: str) -> list[float]:
+        """Embed a query after the configured latency."""
+        time.sleep(self.latency)
+        return super().embed_query(text)
+
+
+def make_chunks(n: int, rng: random.Random) -> list[Document]:
+    """Return ``n`` chunks of random words, one in ten mentioning an error code."""
+    return with_chunk_ids(
+        [
+            Document(
+                page_content=" ".join(rng.choices(WORDS, k=40))
+                + (f" error E{i:06d}" if i % 10 == 0 else ""),
+                metadata={"user_id": "bench", "source": "bench"},
+            )
+            for i in range(n)
+        ],
+        "bench",
+    )
+
+
+async def measure(
+    search: Callable[[str], Awaitable[list[Document]]], queries: list[str]
+) -> tuple[list[float], float]:
+    """Return the latency of every query in seconds and the top-k hit rate."""
+    latencies, hits = [], 0
+    for query in queries:
+        started_at = time.perf_counter()
+        found = await search(query)
+        latencies.append(time.perf_counter() - started_at)
+        hits += any(query in doc.page_content for doc in found)
+    return latencies, hits / len(queries)
+
+
+async def main(args: argparse.Namespace) -> None:
+    """Index the chunks, run every mode and print a report."""
+    rng = random.Random(args.seed)
+    chunks = make_chunks(args.chunks, rng)
+    codes = [f"E{i:06d}" for i in range(0, args.chunks, 10)]
+    queries = [rng.choice(codes) for _ in range(args.queries)]
+    embedding = SlowEmbedding(size=args.dim, latency=args.latency)
+    with tempfile.TemporaryDirectory() as path:
+        os.environ["LOCAL_VECTORSTORE_DIR"] = path
+        os.environ["LEXICAL_INDEX_DIR"] = path
+        configuration = IndexerConfiguration(
+            user_id="bench",
+            retriever_provider="local",
+            search_kwargs={"k": args.k},
+            fetch_k=args.fetch_k,
+        )
+        with (
+            make_local_retriever(configuration, embedding) as vector,
+            make_hybrid_retriever(configuration, vector) as hybrid,
+        ):
+            store = cast(LocalVectorStore, vector.vectorstore)
+            store.add_vectors(
+                [str(c.id) for c in chunks],
+                embedding.embed_documents([c.page_content for c in chunks]),
+                [c.page_content for c in chunks],
+                [c.metadata for c in chunks],
+            )
+            assert hybrid.lexical_index is not None
+            hybrid.lexical_index.upsert(chunks)
+            modes: dict[str, Callable[[str], Awaitable[list[Document]]]] = {
+                "vector only": vector.ainvoke,
+                "BM25 only": lambda q: run_blocking(hybrid.lexical_search, q, args.k),
+                "hybrid (RRF)": hybrid.ainvoke,
+            }
+            print(  # noqa: T201
+                f"{args.chunks} chunks, {args.queries} queries, k={args.k}, "
+                f"fetch_k={args.fetch_k}, {args.latency * 1000:.0f} ms embedding latency"
+            )
+            print(  # noqa: T201
+                f"{'mode':<16}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'hit@k':>8}"
+            )
+            for name, search in modes.items():
+                scored_search._query_embeddings.clear()
+                latencies, hit_rate = await measure(search, queries)
+                ms = sorted(1000 * s for s in latencies)
+                p95 = ms[min(len(ms) - 1, int(0.95 * len(ms)))]
+                print(  # noqa: T201
+                    f"{name:<16}{statistics.mean(ms):>10.2f}"
+                    f"{statistics.median(ms):>10.2f}{p95:>10.2f}{hit_rate:>8.2f}"
+                )
+        close_pools()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=20_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--fetch-k", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
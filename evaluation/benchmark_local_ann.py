@@ -0,0 +1,100 @@
+"""Benchmark of the IVF-PQ index of the local vector store on synthetic vectors.
+
+The benchmark fills a temporary ``ivfpq`` store with clustered random vectors,
+as embeddings of a corpus on a few topics are, then runs the same queries with
+an exact scan and with the index under several ``nprobe`` and ``refine``
+settings. It reports the recall@k of every setting against the exact results
+and the queries per second.
+
+Usage:
+    python evaluation/benchmark_local_ann.py --rows 200000 --dim 384 --k 10
+"""
+
+import argparse
+import tempfile
+import time
+from typing import Any
+
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from retrieval_agents.utils.local_vectorstore import LocalVectorStore
+
+
+def clustered_vectors(
+    n: int, dim: int, clusters: int, rng: np.random.Generator
+) -> np.ndarray:
+    """Return ``n`` vectors drawn around ``clusters`` random centers."""
+    centers = rng.normal(size=(clusters, dim))
+    noise = rng.normal(scale=0.5, size=(n, dim))
+    return (centers[rng.integers(clusters, size=n)] + noise).astype(np.float32)
+
+
+def search(
+    store: LocalVectorStore, queries: np.ndarray, k: int, **kwargs: Any
+) -> tuple[list[set[str]], float]:
+    """Return the IDs found for every query and the queries per second."""
+    started_at = time.perf_counter()
+    found = [
+        {
+            str(doc.id)
+            for doc in store.similarity_search_by_vector(query.tolist(), k, **kwargs)
+        }
+        for query in queries
+    ]
+    return found, len(queries) / (time.perf_counter() - started_at)
+
+
+def main(args: argparse.Namespace) -> None:
+    """Fill a store, run every setting and print a report."""
+    rng = np.random.default_rng(args.seed)
+    vectors = clustered_vectors(args.rows, args.dim, args.clusters, rng)
+    queries = clustered_vectors(args.queries, args.dim, args.clusters, rng)
+    with tempfile.TemporaryDirectory() as path:
+        store = LocalVectorStore(
+            path, DeterministicFakeEmbedding(size=args.dim), args.dtype, "ivfpq"
+        )
+        started_at = time.perf_counter()
+        for start in range(0, args.rows, args.batch_size):
+            stop = min(args.rows, start + args.batch_size)
+            store.add_vectors(
+                [str(i) for i in range(start, stop)],
+                vectors[start:stop],  # type: ignore[arg-type]
+                [""] * (stop - start),
+            )
+        build_seconds = time.perf_counter() - started_at
+        if store._ivf is None:
+            store.build_index()
+        assert store._ivf is not None
+        print(  # noqa: T201
+            f"{args.rows} {args.dtype} vectors of dimension {args.dim} in "
+            f"{args.clusters} clusters, added in {build_seconds:.1f} s; "
+            f"{store._ivf.nlist} lists, {store._ivf.m} bytes per code"
+        )
+        exact, qps = search(store, queries, args.k, exact=True)
+        print(f"{'setting':<28}{f'recall@{args.k}':>10}{'QPS':>10}")  # noqa: T201
+        print(f"{'exact':<28}{1:>10.3f}{qps:>10.1f}")  # noqa: T201
+        for nprobe in args.nprobe:
+            for refine in args.refine:
+                found, qps = search(
+                    store, queries, args.k, nprobe=nprobe, refine=refine
+                )
+                recall = np.mean([len(f & e) / args.k for f, e in zip(found, exact)])
+                name = f"nprobe={nprobe}, refine={refine}"
+                print(f"{name:<28}{recall:>10.3f}{qps:>10.1f}")  # noqa: T201
+        store.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--dtype", default="float32")
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 16, 64])
+    parser.add_argument("--refine", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
@@ -0,0 +1,102 @@
+"""Benchmark of the latency the local rerankers add to a query.
+
+The benchmark reranks synthetic candidate sets of several sizes, made of chunks
+of random words the length of an indexed chunk, and keeps the best ``top_m`` of
+them. It reports the latency added per query by the BM25 reranker, and by a
+cross-encoder when ``--cross-encoder`` names one (``sentence-transformers``
+must be installed), together with the estimated tokens passed on to the LLM
+calls with and without reranking.
+
+Usage:
+    python evaluation/benchmark_rerank.py --candidates 20 50 100 --top-m 4
+    python evaluation/benchmark_rerank.py --cross-encoder cross-encoder/ms-marco-MiniLM-L-6-v2
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from typing import Optional
+
+from langchain_core.documents import Document
+
+from retrieval_agents.modules.utils import estimate_tokens
+from retrieval_agents.utils.rerank import RerankMethod, arerank
+
+WORDS = (
+    "index shard query cache replica node disk timeout retry quota cluster "
+    "snapshot mapping analyzer token segment merge refresh flush heap"
+).split()
+
+
+def make_candidates(n: int, words: int, rng: random.Random) -> list[Document]:
+    """Return ``n`` chunks of ``words`` random words."""
+    return [
+        Document(page_content=" ".join(rng.choices(WORDS, k=words))) for _ in range(n)
+    ]
+
+
+async def measure(
+    method: RerankMethod,
+    queries: list[str],
+    candidates: list[list[Document]],
+    top_m: int,
+    model: str,
+) -> list[float]:
+    """Return the latency of reranking the candidates of every query, in seconds."""
+    latencies = []
+    for query, docs in zip(queries, candidates):
+        started_at = time.perf_counter()
+        await arerank(query, docs, method, top_m, model)
+        latencies.append(time.perf_counter() - started_at)
+    return latencies
+
+
+async def main(args: argparse.Namespace) -> None:
+    """Rerank every candidate set size with every reranker and print a report."""
+    rng = random.Random(args.seed)
+    queries = [" ".join(rng.choices(WORDS, k=6)) for _ in range(args.queries)]
+    methods: list[tuple[RerankMethod, Optional[str]]] = [("bm25", None)]
+    if args.cross_encoder:
+        methods.append(("cross_encoder", args.cross_encoder))
+        # Load the model before timing.
+        await arerank(
+            "warm up",
+            make_candidates(2, 8, rng),
+            "cross_encoder",
+            1,
+            args.cross_encoder,
+        )
+    print(f"{args.queries} queries, chunks of {args.words} words, top_m={args.top_m}")  # noqa: T201
+    print(  # noqa: T201
+        f"{'reranker':<16}{'candidates':>11}{'mean ms':>10}{'p95 ms':>10}"
+        f"{'tokens in':>11}{'tokens out':>12}"
+    )
+    for n in args.candidates:
+        candidates = [make_candidates(n, args.words, rng) for _ in queries]
+        tokens_in = statistics.mean(
+            sum(estimate_tokens(d.page_content) for d in docs) for docs in candidates
+        )
+        for method, model in methods:
+            latencies = await measure(
+                method, queries, candidates, args.top_m, model or ""
+            )
+            ms = sorted(1000 * s for s in latencies)
+            p95 = ms[min(len(ms) - 1, int(0.95 * len(ms)))]
+            tokens_out = tokens_in * min(args.top_m, n) / n
+            print(  # noqa: T201
+                f"{method:<16}{n:>11}{statistics.mean(ms):>10.3f}{p95:>10.3f}"
+                f"{tokens_in:>11.0f}{tokens_out:>12.0f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--candidates", type=int, nargs="+", default=[20, 50, 100])
+    parser.add_argument("--top-m", type=int, default=4)
+    parser.add_argument("--words", type=int, default=350)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--cross-encoder", default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,192 @@
+"""Calibration of the score thresholds that bypass the document grader.
+
+The tool replays a labelled set of (question, document) pairs through the LLM
+relevance grader of ``grade_context`` and then evaluates every pair of
+``grade_drop_score`` and ``grade_keep_score`` thresholds: documents scoring at
+least the keep threshold count as kept, documents scoring below the drop
+threshold as dropped, and the others get the grader's verdict. It reports the
+accuracy against the labels and the share of grader calls avoided, and
+recommends the thresholds that avoid the most calls while losing at most
+``--max-accuracy-loss`` accuracy compared to grading every document.
+
+The labelled set is a JSON Lines file with one pair per line::
+
+    {"question": "...", "document": "...", "relevant": true, "score": 0.62}
+
+``score`` is the cosine similarity given by the retriever; pairs without one
+are scored with ``--embedding-model``, the way the retrievers score them.
+
+Usage:
+    python evaluation/calibrate_grading.py labelled.jsonl --model openai/gpt-4o-mini
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from collections import defaultdict
+from typing import Any
+
+import numpy as np
+from langchain_core.documents import Document
+
+from retrieval_agents.modules.contextual_answer_generator import (
+    ContextualAnswerGeneratorConfiguration,
+    _grade_documents_individually,
+)
+from retrieval_agents.modules.retrieval import get_text_encoder
+from retrieval_agents.utils.scored_search import cosine_similarities
+
+
+def load_examples(path: str) -> list[dict[str, Any]]:
+    """Return the labelled pairs of a JSON Lines file."""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def score_missing(examples: list[dict[str, Any]], embedding_model: str) -> None:
+    """Set the cosine similarity of the pairs that have no score."""
+    missing = [e for e in examples if e.get("score") is None]
+    if not missing:
+        return
+    encoder = get_text_encoder(embedding_model)
+    documents = np.asarray(encoder.embed_documents([e["document"] for e in missing]))
+    queries = {
+        q: np.asarray(encoder.embed_query(q)) for q in {e["question"] for e in missing}
+    }
+    for example, vector in zip(missing, documents):
+        example["score"] = float(
+            cosine_similarities(queries[example["question"]], vector[None, :])[0]
+        )
+
+
+async def grade(
+    examples: list[dict[str, Any]],
+    configuration: ContextualAnswerGeneratorConfiguration,
+) -> list[bool]:
+    """Return the grader's verdict on every pair, grading each question's documents concurrently."""
+    by_question: dict[str, list[int]] = defaultdict(list)
+    for i, example in enumerate(examples):
+        by_question[example["question"]].append(i)
+    grades = [False] * len(examples)
+    for question, indices in by_question.items():
+        verdicts = await _grade_documents_individually(
+            question,
+            [Document(page_content=examples[i]["document"]) for i in indices],
+            configuration,
+        )
+        for i, verdict in zip(indices, verdicts):
+            grades[i] = verdict
+    return grades
+
+
+def sweep(
+    scores: np.ndarray, labels: np.ndarray, grades: np.ndarray, steps: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Evaluate every pair of thresholds on a grid of score quantiles.
+
+    ``-inf`` as drop threshold and ``+inf`` as keep threshold stand for an unset
+    threshold.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: The thresholds of the grid,
+            and the accuracy and share of grader calls of every (drop, keep)
+            pair, indexed by their positions in the grid; pairs whose drop
+            threshold is above their keep threshold are NaN.
+    """
+    grid = np.unique(
+        np.concatenate(
+            [[-np.inf, np.inf], np.quantile(scores, np.linspace(0, 1, steps + 1))]
+        )
+    )
+    kept = (scores[None, :] >= grid[:, None]).astype(np.float64)
+    dropped = (scores[None, :] < grid[:, None]).astype(np.float64)
+    agree = (grades == labels).astype(np.float64)
+    # Pairs with drop <= keep never keep and drop the same document, so every
+    # document is decided by exactly one of the keep, drop and grader rules.
+    correct = (
+        (dropped @ (~labels - agree))[:, None]
+        + (kept @ (labels - agree))[None, :]
+        + agree.sum()
+    )
+    calls = len(scores) - dropped.sum(axis=1)[:, None] - kept.sum(axis=1)[None, :]
+    valid = grid[:, None] <= grid[None, :]
+    n = len(scores)
+    return (
+        grid,
+        np.where(valid, correct / n, np.nan),
+        np.where(valid, calls / n, np.nan),
+    )
+
+
+def threshold(value: float) -> str:
+    """Format a threshold of the grid, unset thresholds as ``-``."""
+    return "-" if np.isinf(value) else f"{value:.3f}"
+
+
+async def main(args: argparse.Namespace) -> None:
+    """Grade the labelled set, sweep the thresholds and print a report."""
+    examples = load_examples(args.labelled_set)
+    score_missing(examples, args.embedding_model)
+    configuration = ContextualAnswerGeneratorConfiguration(
+        user_id="calibration",
+        grade_documents_model=args.model,
+        grade_documents_max_concurrency=args.concurrency,
+    )
+    started_at = time.perf_counter()
+    grades = np.asarray(await grade(examples, configuration))
+    grading_seconds = time.perf_counter() - started_at
+    scores = np.asarray([e["score"] for e in examples], dtype=np.float64)
+    labels = np.asarray([bool(e["relevant"]) for e in examples])
+
+    grid, accuracy, calls = sweep(scores, labels, grades, args.steps)
+    baseline = float(np.mean(grades == labels))
+    eligible = np.nan_to_num(accuracy, nan=-1) >= baseline - args.max_accuracy_loss
+    # Fewest grader calls, then best accuracy.
+    candidates = np.argwhere(eligible)
+    drop, keep = min(
+        candidates.tolist(), key=lambda p: (calls[p[0], p[1]], -accuracy[p[0], p[1]])
+    )
+
+    print(  # noqa: T201
+        f"{len(examples)} pairs, {labels.mean():.0%} relevant, graded by "
+        f"{args.model} in {grading_seconds:.1f} s"
+    )
+    print(f"{'drop':>8}{'keep':>8}{'accuracy':>10}{'calls':>8}")  # noqa: T201
+    print(f"{'-':>8}{'-':>8}{baseline:>10.3f}{1:>8.0%}")  # noqa: T201
+    reported = set()
+    for budget in args.report_calls:
+        within = np.nan_to_num(calls, nan=np.inf) <= budget
+        if not within.any():
+            continue
+        best = np.unravel_index(np.argmax(np.where(within, accuracy, -1)), calls.shape)
+        if best in reported:
+            continue
+        reported.add(best)
+        print(  # noqa: T201
+            f"{threshold(grid[best[0]]):>8}{threshold(grid[best[1]]):>8}"
+            f"{accuracy[best]:>10.3f}{calls[best]:>8.0%}"
+        )
+    print(  # noqa: T201
+        f"\nRecommended (accuracy loss <= {args.max_accuracy_loss}): "
+        f"accuracy {accuracy[drop, keep]:.3f}, {1 - calls[drop, keep]:.0%} of "
+        "grader calls avoided"
+    )
+    if not np.isinf(grid[drop]):
+        print(f"grade_drop_score: {grid[drop]:.3f}")  # noqa: T201
+    if not np.isinf(grid[keep]):
+        print(f"grade_keep_score: {grid[keep]:.3f}")  # noqa: T201
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("labelled_set")
+    parser.add_argument("--model", default="openai/gpt-4o")
+    parser.add_argument("--embedding-model", default="openai/text-embedding-3-small")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--steps", type=int, default=50)
+    parser.add_argument("--max-accuracy-loss", type=float, default=0.01)
+    parser.add_argument(
+        "--report-calls", type=float, nargs="+", default=[0.5, 0.3, 0.2, 0.1]
+    )
+    asyncio.run(main(parser.parse_args()))
@@ -44,11 +44,11 @@ class IndexerConfiguration(ConfigurationBase):
     )
 
     retriever_provider: Annotated[
-        Literal["elastic", "elastic-local", "pinecone", "mongodb", "chroma"],
+        Literal["elastic", "elastic-local", "pinecone", "mongodb", "chroma", "local"],
         {"__template_metadata__": {"kind": "retriever"}},
     ] = Field(
         default="elastic",
-        description="The vector store provider to use for retrieval. Options are 'elastic', 'pinecone', 'mongodb' or 'chroma'.",
+        description="The vector store provider to use for retrieval. Options are 'elastic', 'pinecone', 'mongodb', 'chroma' or 'local'.",
     )
 
     search_kwargs: dict[str, Any] = Field(
@@ -56,5 +56,152 @@ class IndexerConfiguration(ConfigurationBase):
         description="Additional keyword arguments to pass to the search function of the retriever.",
     )
 
+    retrieval_mode: Literal["vector", "hybrid"] = Field(
+        default="vector",
+        description="'vector' searches embeddings only. 'hybrid' also runs a BM25 search, on Elasticsearch itself or on an in-process index under LEXICAL_INDEX_DIR for the other providers, and fuses both rankings by reciprocal rank. Index with 'hybrid' too, so that chunks are added to the in-process index.",
+    )
+
+    fetch_k: int = Field(
+        default=20,
+        ge=1,
+        description="The number of candidates fetched by the vector search, and by the BM25 search in 'hybrid' mode, before the final k documents are selected.",
+    )
+
+    score_threshold: Optional[float] = Field(
+        default=None,
+        ge=-1,
+        le=1,
+        description="The minimum cosine similarity of a retrieved document with the query. No threshold when unset.",
+    )
+
+    score_margin: Optional[float] = Field(
+        default=None,
+        ge=0,
+        description="Adaptive k: drop retrieved documents whose cosine similarity is more than this below the best one, so that fewer than k are returned when only a few stand out. Disabled when unset.",
+    )
+
+    mmr_lambda: Optional[float] = Field(
+        default=None,
+        ge=0,
+        le=1,
+        description="When set, the k documents are picked from the candidates by maximal marginal relevance: 1 favours relevance only, 0 diversity only.",
+    )
+
+    rrf_k: int = Field(
+        default=60,
+        ge=1,
+        description="The rank offset of reciprocal rank fusion. Larger values flatten the advantage of the top ranks.",
+    )
+
+    vector_weight: float = Field(
+        default=1.0,
+        ge=0,
+        description="The weight of the vector ranking in reciprocal rank fusion.",
+    )
+
+    lexical_weight: float = Field(
+        default=1.0,
+        ge=0,
+        description="The weight of the BM25 ranking in reciprocal rank fusion.",
+    )
+
+    rerank: Literal["none", "bm25", "cross_encoder"] = Field(
+        default="none",
+        description="Rerank the retrieved documents locally before they reach the graders or the response model. 'bm25' scores the candidates by BM25 over the candidate set; 'cross_encoder' uses rerank_model on the CPU and needs sentence-transformers.",
+    )
+
+    rerank_fetch_k: int = Field(
+        default=20,
+        ge=1,
+        description="The number of documents retrieved for reranking, in place of the k of search_kwargs.",
+    )
+
+    rerank_top_m: int = Field(
+        default=4,
+        ge=1,
+        description="The number of reranked documents kept.",
+    )
+
+    rerank_model: str = Field(
+        default="cross-encoder/ms-marco-MiniLM-L-6-v2",
+        description="The sentence-transformers cross-encoder used when rerank is 'cross_encoder'.",
+    )
+
+    chunk_size: int = Field(
+        default=500,
+        ge=1,
+        description="The maximum length, in tokens, of the chunks documents are split into when indexing.",
+    )
+
+    chunk_overlap: int = Field(
+        default=0,
+        ge=0,
+        description="The number of tokens shared by consecutive chunks of a document.",
+    )
+
+    embedding_batch_size: int = Field(
+        default=64,
+        ge=1,
+        description="The number of chunks embedded in a single request when indexing.",
+    )
+
+    embedding_concurrency: int = Field(
+        default=4,
+        ge=1,
+        description="The maximum number of embedding requests in flight when indexing.",
+    )
+
+    write_batch_size: int = Field(
+        default=200,
+        ge=1,
+        description="The number of chunks sent in a single bulk write: the Elasticsearch bulk chunk size, the Pinecone upsert batch, the MongoDB bulk_write or the Chroma upsert.",
+    )
+
+    write_max_retries: int = Field(
+        default=3,
+        ge=0,
+        description="The number of retries of the chunks of a failed embedding request or bulk write. Chunks that were embedded are not embedded again.",
+    )
+
+    refresh_after_write: bool = Field(
+        default=True,
+        description="Refresh the Elasticsearch index once every chunk is written, making the chunks searchable right away. Bulk writes never refresh individually.",
+    )
+
+
+class BudgetConfiguration(ConfigurationBase):
+    """Configuration of the per-request budget of agents that loop."""
+
+    max_llm_calls: Optional[int] = Field(
+        default=25,
+        ge=1,
+        description="The maximum number of LLM calls a single request may make. Unlimited when set to null.",
+    )
+
+    deadline_seconds: Optional[float] = Field(
+        default=120.0,
+        gt=0,
+        description="The wall time, in seconds, after which a request stops and returns its best generation so far. Unlimited when set to null.",
+    )
+
+
+class ContextConfiguration(ConfigurationBase):
+    """Configuration of the retrieved context sent to the language models."""
+
+    context_token_budget: int = Field(
+        default=6000,
+        ge=1,
+        description="The maximum estimated size, in tokens, of the retrieved documents in a prompt. The lowest ranked documents are truncated or left out first.",
+    )
+
+    model_context_token_budgets: dict[str, int] = Field(
+        default_factory=dict,
+        description="Per-model context token budgets, keyed by the fully specified model name. Take precedence over context_token_budget.",
+    )
+
+    def context_budget(self, model: str) -> int:
+        """Return the context token budget of prompts sent to a model."""
+        return self.model_context_token_budgets.get(model, self.context_token_budget)
+
 
 T = TypeVar("T", bound=ConfigurationBase)
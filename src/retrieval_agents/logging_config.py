@@ -1,18 +1,34 @@
 """Initializer for logging."""
 
+import atexit
 import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+
+class _AsyncFileQueueHandler(QueueHandler):
+    """Queue handler whose records are written to a file by a listener thread."""
 
 
 def setup_logging() -> None:
-    """Set up logging."""
+    """Set up logging.
+
+    Records are handed to a queue and written to ``debug.log`` by a background
+    listener thread, so that logging from async nodes never performs file I/O on
+    the event loop. The file is opened lazily by the listener.
+    """
     logger = logging.getLogger()
-    if any(isinstance(h, logging.FileHandler) for h in logger.handlers):
+    if any(isinstance(h, _AsyncFileQueueHandler) for h in logger.handlers):
         return
 
-    file_handler = logging.FileHandler("debug.log", encoding="utf-8")
+    file_handler = logging.FileHandler("debug.log", encoding="utf-8", delay=True)
     file_handler.setFormatter(
         logging.Formatter(
             "%(asctime)s [%(levelname)s] %(name)s.%(funcName)s: %(message)s"
         )
     )
-    logger.addHandler(file_handler)
+    log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    logger.addHandler(_AsyncFileQueueHandler(log_queue))
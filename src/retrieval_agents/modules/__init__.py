@@ -37,11 +37,13 @@ from .contextual_answer_generator import (
 from .contextual_answer_generator import (
     graph as contextual_answer_generator,
 )
+from .directory_indexer import DirectoryIndexerConfiguration, DirectoryInputState
+from .directory_indexer import graph as directory_indexer
 from .document_indexer import DocumentIndexerState
 from .document_indexer import graph as document_indexer
 from .simple_rag import SimpleRagConfiguration, SimpleRagInputState
 from .simple_rag import graph as simple_rag
-from .web_indexer import UrlInputState, WebIndexerState
+from .web_indexer import UrlInputState, WebIndexerConfiguration, WebIndexerState
 from .web_indexer import graph as web_indexer
 
 __all__ = [
@@ -57,8 +59,12 @@ __all__ = [
     "indexer",
     "UrlInputState",
     "WebIndexerState",
+    "WebIndexerConfiguration",
     "web_indexer",
     "DocumentIndexerState",
+    "directory_indexer",
+    "DirectoryInputState",
+    "DirectoryIndexerConfiguration",
     "IndexerConfiguration",
     "IndexConfiguration2",
 ]
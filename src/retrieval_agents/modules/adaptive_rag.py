@@ -1,12 +1,13 @@
 """Agent for adaptive RAG."""
 
+import asyncio
 import logging
-from typing import Annotated, Dict, Literal, Sequence, cast
+from typing import Annotated, Any, Dict, Literal, cast
 
 from langchain_core.documents import Document
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables import Runnable, RunnableConfig
 from langgraph.graph import END, START, StateGraph
 from langgraph.graph.state import CompiledStateGraph
 from pydantic import BaseModel, Field
@@ -14,15 +15,22 @@ from pydantic import BaseModel, Field
 from retrieval_agents import prompts
 from retrieval_agents.configurations import IndexerConfiguration
 from retrieval_agents.modules import retrieval
+from retrieval_agents.modules.budget import (
+    BUDGET_EXHAUSTED,
+    budget_exhausted,
+    spend,
+    within_deadline,
+)
 from retrieval_agents.modules.contextual_answer_generator import (
     ContextualAnswerGeneratorConfiguration,
     ContextualAnswerGeneratorState,
+    budget_exhausted_update,
 )
 from retrieval_agents.modules.contextual_answer_generator import (
     graph as retrieval_generator_graph,
 )
 from retrieval_agents.modules.states import BasicRAGInputState
-from retrieval_agents.modules.utils import load_chat_model
+from retrieval_agents.modules.utils import aget_chain, load_chat_model
 
 logger = logging.getLogger("adaptive_rag_graph2")
 
@@ -76,9 +84,18 @@ class RouteQuery(BaseModel):
 
 
 ### Nodes ###
+def start_request(state: ContextualAnswerGeneratorState) -> dict[str, Any]:
+    """Start the clock of the request and account for the routing LLM call.
+
+    The question is routed on the edge out of this node, and edges cannot update
+    the state.
+    """
+    return spend(state, 1)
+
+
 async def retrieve(
-    state: BasicRAGInputState, *, config: RunnableConfig
-) -> dict[str, str | Sequence[Document]]:
+    state: ContextualAnswerGeneratorState, *, config: RunnableConfig
+) -> dict[str, Any]:
     """Retrieve documents.
 
     Args:
@@ -87,20 +104,23 @@ async def retrieve(
     Returns:
         state (dict): New key added to state, documents, that contains retrieved documents
     """
-    # configuration = ARagConfiguration.from_runnable_config(config)
+    configuration = AdaptiveRagConfiguration.from_runnable_config(config)
+    if budget_exhausted(state, configuration):
+        return budget_exhausted_update(state)
     question = state.question
 
-    # Retrieval
-    # if retriever:
-    #    state.documents = await retriever.ainvoke(question, config)
-    with retrieval.make_retriever(config=config) as retriever:
-        documents = await retriever.ainvoke(question, config)
-    return {"question": question, "documents": documents}
+    # Retrieval, reranked locally when configured.
+    documents = await retrieval.aretrieve(question, config)
+    return {
+        "question": question,
+        "documents": documents,
+        **spend(state),
+    }
 
 
 async def web_search(
-    state: BasicRAGInputState, *, config: RunnableConfig
-) -> dict[str, str | Sequence[Document]]:
+    state: ContextualAnswerGeneratorState, *, config: RunnableConfig
+) -> dict[str, Any]:
     """Web search based on the re-phrased question.
 
     Args:
@@ -109,6 +129,9 @@ async def web_search(
     Returns:
         state (dict): Updates documents key with appended web results
     """
+    configuration = AdaptiveRagConfiguration.from_runnable_config(config)
+    if budget_exhausted(state, configuration):
+        return budget_exhausted_update(state)
     question = state.question
 
     # Web search
@@ -118,12 +141,16 @@ async def web_search(
     docs = await web_search_tool.ainvoke({"query": question})
     web_results = [Document(page_content="\n".join([d["content"] for d in docs]))]
 
-    return {"documents": web_results, "question": question}
+    return {
+        "documents": web_results,
+        "question": question,
+        **spend(state),
+    }
 
 
 async def transform_query(
     state: ContextualAnswerGeneratorState, *, config: RunnableConfig
-) -> dict[str, str | Sequence[Document]]:
+) -> dict[str, Any]:
     """Transform the query to produce a better question.
 
     Args:
@@ -135,26 +162,49 @@ async def transform_query(
     question = state.question
     documents = state.documents
     configuration = AdaptiveRagConfiguration.from_runnable_config(config)
-    re_write_prompt = ChatPromptTemplate.from_messages(
-        [
-            ("system", configuration.rewrite_system_prompt),
-            ("human", configuration.rewrite_human_propmt),
-        ]
+    if budget_exhausted(state, configuration):
+        return budget_exhausted_update(state)
+
+    def build_question_rewriter() -> Runnable[Any, Any]:
+        re_write_prompt = ChatPromptTemplate.from_messages(
+            [
+                ("system", configuration.rewrite_system_prompt),
+                ("human", configuration.rewrite_human_propmt),
+            ]
+        )
+        llm = load_chat_model(configuration.rewrite_model)
+        return re_write_prompt | llm | StrOutputParser()
+
+    question_rewriter = await aget_chain(
+        (
+            "transform_query",
+            configuration.rewrite_model,
+            configuration.rewrite_system_prompt,
+            configuration.rewrite_human_propmt,
+        ),
+        build_question_rewriter,
     )
-
-    llm = load_chat_model(configuration.rewrite_model)
-    question_rewriter = re_write_prompt | llm | StrOutputParser()
     # Re-write question
-    better_question = await question_rewriter.ainvoke({"question": question})
-    return {"documents": documents, "question": better_question}
+    try:
+        better_question = await within_deadline(
+            question_rewriter.ainvoke({"question": question}), state, configuration
+        )
+    except asyncio.TimeoutError:
+        return budget_exhausted_update(state)
+    return {"documents": documents, "question": better_question, **spend(state, 1)}
 
 
 ### Edges ###
 
 
-async def route_question(state: BasicRAGInputState, *, config: RunnableConfig) -> str:
+async def route_question(
+    state: ContextualAnswerGeneratorState, *, config: RunnableConfig
+) -> str:
     """Route question to web search or RAG.
 
+    A question whose routing runs past the deadline goes to the vector store,
+    whose node then ends the request.
+
     Args:
         state (dict): The current graph state
 
@@ -162,22 +212,42 @@ async def route_question(state: BasicRAGInputState, *, config: RunnableConfig) -
         str: Next node to call
     """
     configuration = AdaptiveRagConfiguration.from_runnable_config(config)
-    llm = load_chat_model(configuration.router_model)
-    structured_llm_router = llm.with_structured_output(RouteQuery.model_json_schema())
-    route_prompt = ChatPromptTemplate.from_messages(
-        [
-            ("system", configuration.router_system_prompt),
-            ("human", "{question}"),
-        ]
-    )
-    question_router = route_prompt | structured_llm_router
-    question = state.question
-    source = cast(
-        Dict[str, str],
-        await question_router.ainvoke(
-            {"question": question, "topics": configuration.topics}
+
+    def build_question_router() -> Runnable[Any, Any]:
+        llm = load_chat_model(configuration.router_model)
+        structured_llm_router = llm.with_structured_output(
+            RouteQuery.model_json_schema()
+        )
+        route_prompt = ChatPromptTemplate.from_messages(
+            [
+                ("system", configuration.router_system_prompt),
+                ("human", "{question}"),
+            ]
+        )
+        return route_prompt | structured_llm_router
+
+    question_router = await aget_chain(
+        (
+            "route_question",
+            configuration.router_model,
+            configuration.router_system_prompt,
         ),
+        build_question_router,
     )
+    question = state.question
+    try:
+        source = cast(
+            Dict[str, str],
+            await within_deadline(
+                question_router.ainvoke(
+                    {"question": question, "topics": configuration.topics}
+                ),
+                state,
+                configuration,
+            ),
+        )
+    except asyncio.TimeoutError:
+        return "vectorstore"
     if source["datasource"] == "web_search":
         return "web_search"
     elif source["datasource"] == "vectorstore":
@@ -195,13 +265,15 @@ builder = StateGraph(
     config_schema=AdaptiveRagConfiguration,
 )
 
+builder.add_node(start_request)
 builder.add_node(web_search)
 builder.add_node(retrieve)
 builder.add_node("retrieval_generator_graph", retrieval_generator_graph)
 builder.add_node(transform_query)
 
+builder.add_edge(START, "start_request")
 builder.add_conditional_edges(
-    START,
+    "start_request",
     route_question,
     {
         "web_search": "web_search",
@@ -212,12 +284,19 @@ builder.add_conditional_edges(
 
 def _transform_query_or_end(state: ContextualAnswerGeneratorState) -> str:
     logger.info(state)
-    if state.finish_reason == "complete":
+    if state.finish_reason in ("complete", BUDGET_EXHAUSTED):
         return "complete"
     else:
         return "transform_query"
 
 
+def _retrieve_or_end(state: ContextualAnswerGeneratorState) -> str:
+    if state.finish_reason == BUDGET_EXHAUSTED:
+        return "end"
+    else:
+        return "retrieve"
+
+
 builder.add_edge("web_search", "retrieval_generator_graph")
 builder.add_edge("retrieve", "retrieval_generator_graph")
 builder.add_conditional_edges(
@@ -228,7 +307,14 @@ builder.add_conditional_edges(
         "transform_query": "transform_query",
     },
 )
-builder.add_edge("transform_query", "retrieve")
+builder.add_conditional_edges(
+    "transform_query",
+    _retrieve_or_end,
+    {
+        "end": END,
+        "retrieve": "retrieve",
+    },
+)
 
 graph: CompiledStateGraph = builder.compile(
     interrupt_before=[],  # if you want to update the state before calling the tools
@@ -0,0 +1,110 @@
+"""Per-request budgets for agents that loop.
+
+The clock of a request starts at graph entry. Every node checks the budget
+before doing any work, bounds its LLM calls by the time left and accounts for
+the calls it makes, so that a request stops gracefully once it exceeds its
+deadline or its maximum number of LLM calls.
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Optional, TypeVar
+
+from retrieval_agents.configurations import BudgetConfiguration
+from retrieval_agents.modules.states import BudgetState
+
+BUDGET_EXHAUSTED = "budget_exhausted"
+
+T = TypeVar("T")
+
+
+def budget_exhausted(state: BudgetState, configuration: BudgetConfiguration) -> bool:
+    """Return whether the request has run out of LLM calls or time.
+
+    Args:
+        state (BudgetState): The current graph state.
+        configuration (BudgetConfiguration): The limits of the request.
+
+    Returns:
+        bool: True if no further LLM call should be made.
+    """
+    if (
+        configuration.max_llm_calls is not None
+        and state.llm_calls >= configuration.max_llm_calls
+    ):
+        return True
+    if configuration.deadline_seconds is not None and state.started_at is not None:
+        return time.time() - state.started_at >= configuration.deadline_seconds
+    return False
+
+
+def remaining_llm_calls(
+    state: BudgetState, configuration: BudgetConfiguration
+) -> Optional[int]:
+    """Return the number of LLM calls left to the request.
+
+    Args:
+        state (BudgetState): The current graph state.
+        configuration (BudgetConfiguration): The limits of the request.
+
+    Returns:
+        Optional[int]: The calls left, None if the request has no call limit.
+    """
+    if configuration.max_llm_calls is None:
+        return None
+    return max(0, configuration.max_llm_calls - state.llm_calls)
+
+
+def remaining_seconds(
+    state: BudgetState, configuration: BudgetConfiguration
+) -> Optional[float]:
+    """Return the time left before the deadline of the request.
+
+    Args:
+        state (BudgetState): The current graph state.
+        configuration (BudgetConfiguration): The limits of the request.
+
+    Returns:
+        Optional[float]: The seconds left, None if the request has no deadline.
+    """
+    if configuration.deadline_seconds is None or state.started_at is None:
+        return None
+    return max(0.0, configuration.deadline_seconds - (time.time() - state.started_at))
+
+
+async def within_deadline(
+    awaitable: Awaitable[T], state: BudgetState, configuration: BudgetConfiguration
+) -> T:
+    """Await an LLM call, cancelling it once the request runs past its deadline.
+
+    Raises:
+        asyncio.TimeoutError: If the deadline passes before the call returns.
+    """
+    return await asyncio.wait_for(awaitable, remaining_seconds(state, configuration))
+
+
+def start_budget(state: BudgetState) -> dict[str, Any]:
+    """Graph entry node that starts the clock of a request.
+
+    A sub-graph keeps the start time given by its parent graph.
+    """
+    return spend(state)
+
+
+def spend(state: BudgetState, llm_calls: int = 0) -> dict[str, Any]:
+    """Return the state update that accounts for the LLM calls made by a node.
+
+    Args:
+        state (BudgetState): The current graph state.
+        llm_calls (int): Number of LLM calls made by the node.
+
+    Returns:
+        dict[str, Any]: Updates for the budget fields of the state.
+    """
+    now = time.time()
+    started_at = state.started_at if state.started_at is not None else now
+    return {
+        "started_at": started_at,
+        "llm_calls": state.llm_calls + llm_calls,
+        "elapsed_seconds": now - started_at,
+    }
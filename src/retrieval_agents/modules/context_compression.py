@@ -0,0 +1,105 @@
+"""Extractive compression of retrieved documents before generation.
+
+A retrieved chunk of a few hundred tokens usually holds only a sentence or two
+that bear on the question. ``compress_documents`` splits every document longer
+than a token budget into sentences, scores all of them against the question by
+cosine similarity in a single NumPy product, and keeps the best sentences of
+each document, in their original order, up to the budget. The embedding of
+the question is the one the retriever computed for its search, when it is
+still kept (see ``scored_search``).
+"""
+
+import logging
+import re
+from typing import Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from retrieval_agents.modules.utils import estimate_tokens
+from retrieval_agents.utils.scored_search import aembed_query, cosine_similarities
+
+logger = logging.getLogger(__name__)
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+
+
+def split_sentences(text: str) -> list[str]:
+    r"""Split a text into sentences and paragraphs.
+
+    >>> split_sentences("Retries back off. Why?\n\nTimeouts  apply per attempt!")
+    ['Retries back off.', 'Why?', 'Timeouts  apply per attempt!']
+    """
+    return [s.strip() for s in _SENTENCE_END.split(text) if s.strip()]
+
+
+def select_sentences(sentences: Sequence[str], scores: np.ndarray, budget: int) -> str:
+    """Return the best sentences that fit the token budget, in their original order.
+
+    The best sentence is always kept.
+
+    >>> select_sentences(["a b c d e.", "x.", "y."], np.array([0.1, 0.9, 0.5]), 4)
+    'x. y.'
+    """
+    keep: list[int] = []
+    remaining = budget
+    for i in np.argsort(-scores, kind="stable").tolist():
+        tokens = estimate_tokens(sentences[i]) + 1
+        if keep and tokens > remaining:
+            continue
+        keep.append(i)
+        remaining -= tokens
+    return " ".join(sentences[i] for i in sorted(keep))
+
+
+async def compress_documents(
+    question: str,
+    documents: Sequence[Document],
+    embeddings: Embeddings,
+    budget: int,
+) -> list[Document]:
+    """Keep the sentences of every document most similar to the question.
+
+    Args:
+        question (str): The question the documents should answer.
+        documents (Sequence[Document]): The documents to compress.
+        embeddings (Embeddings): The encoder the documents were retrieved with.
+        budget (int): The maximum estimated number of tokens of a document.
+
+    Returns:
+        list[Document]: The documents, those longer than the budget replaced by
+            their selected sentences.
+    """
+    split = [
+        split_sentences(d.page_content)
+        if estimate_tokens(d.page_content) > budget
+        else []
+        for d in documents
+    ]
+    # A single sentence cannot be compressed.
+    split = [parts if len(parts) > 1 else [] for parts in split]
+    sentences = [s for parts in split for s in parts]
+    if not sentences:
+        return list(documents)
+    query = await aembed_query(embeddings, question)
+    vectors = np.asarray(await embeddings.aembed_documents(sentences), dtype=np.float32)
+    scores = cosine_similarities(np.asarray(query, dtype=np.float32), vectors)
+
+    compressed: list[Document] = []
+    start = 0
+    for doc, parts in zip(documents, split):
+        if not parts:
+            compressed.append(doc)
+            continue
+        text = select_sentences(parts, scores[start : start + len(parts)], budget)
+        start += len(parts)
+        metadata = {k: v for k, v in doc.metadata.items() if k != "token_count"}
+        metadata["compressed_from_tokens"] = estimate_tokens(doc.page_content)
+        compressed.append(Document(id=doc.id, page_content=text, metadata=metadata))
+    before = sum(estimate_tokens(d.page_content) for d in documents)
+    after = sum(estimate_tokens(d.page_content) for d in compressed)
+    logger.info(
+        f"COMPRESS: {len(documents)} DOCUMENT(S) FROM ~{before} TO ~{after} TOKENS"
+    )
+    return compressed
@@ -0,0 +1,201 @@
+"""Token-budgeted packing of retrieved documents into a prompt.
+
+Rendering every retrieved document in full makes the prompt size unbounded.
+``pack_context`` instead serializes the documents compactly, with only the
+metadata useful to the model, drops documents repeated by overlapping chunks
+and trims the text two chunks of the same source share, orders the documents
+by score and fits them to a token budget: the lowest ranked documents are
+truncated or left out first.
+
+Token counts use the ``token_count`` metadata of the chunks when the indexer
+set it, and ``estimate_tokens`` otherwise.
+"""
+
+import logging
+from dataclasses import dataclass, field
+from typing import Optional, Sequence
+
+from langchain_core.documents import Document
+
+from retrieval_agents.modules.utils import estimate_tokens, format_docs
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_METADATA_KEYS = ("source", "title")
+"""The metadata kept in the serialized documents."""
+
+MIN_OVERLAP_CHARS = 32
+"""Shorter overlaps between two chunks are left as is."""
+
+MIN_TRUNCATED_TOKENS = 50
+"""A document is left out rather than truncated to fewer tokens."""
+
+_WRAPPER = "<documents>\n</documents>"
+
+
+@dataclass(frozen=True)
+class PackedContext:
+    """Documents packed into a prompt, and what packing saved."""
+
+    text: str
+    documents: list[Document] = field(default_factory=list)
+    tokens: int = 0
+    unpacked_tokens: int = 0
+    duplicates: int = 0
+    truncated: int = 0
+    dropped: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        """Tokens saved compared to rendering every document in full."""
+        return max(0, self.unpacked_tokens - self.tokens)
+
+
+def pack_context(
+    documents: Optional[Sequence[Document]], budget: int, label: str = "context"
+) -> PackedContext:
+    """Serialize the documents that fit a token budget, best first.
+
+    Args:
+        documents (Optional[Sequence[Document]]): The retrieved documents.
+        budget (int): The maximum estimated number of tokens of the result.
+        label (str): Name of the prompt the context is for, used in logs.
+
+    Returns:
+        PackedContext: The serialized documents and packing statistics.
+
+    Examples:
+        >>> docs = [
+        ...     Document(page_content="Paris is in France.", metadata={"score": 0.2}),
+        ...     Document(page_content="Lyon too.", metadata={"source": "a", "score": 0.9}),
+        ... ]
+        >>> print(pack_context(docs, 100).text)
+        <documents>
+        <document index="1" source="a">
+        Lyon too.
+        </document>
+        <document index="2">
+        Paris is in France.
+        </document>
+        </documents>
+    """
+    documents = list(documents or [])
+    unpacked_tokens = estimate_tokens(format_docs(documents))
+    unique = _dedupe(_by_score(documents))
+    remaining = budget - estimate_tokens(_WRAPPER)
+    packed: list[Document] = []
+    parts: list[str] = []
+    truncated = 0
+    for doc in unique:
+        header = _header(doc, len(packed) + 1)
+        overhead = estimate_tokens(f"{header}\n\n</document>\n")
+        tokens = overhead + _content_tokens(doc)
+        if tokens <= remaining:
+            content = doc.page_content
+        elif remaining - overhead >= MIN_TRUNCATED_TOKENS:
+            content = _truncate(doc.page_content, remaining - overhead)
+            tokens = overhead + estimate_tokens(content)
+            truncated += 1
+        else:
+            # Lower ranked documents may still fit whole.
+            continue
+        parts.append(f"{header}\n{content}\n</document>\n")
+        packed.append(doc)
+        remaining -= tokens
+    text = "<documents>\n" + "".join(parts) + "</documents>"
+    context = PackedContext(
+        text=text,
+        documents=packed,
+        tokens=estimate_tokens(text),
+        unpacked_tokens=unpacked_tokens,
+        duplicates=len(documents) - len(unique),
+        truncated=truncated,
+        dropped=len(unique) - len(packed),
+    )
+    logger.info(
+        f"CONTEXT ({label}): {len(packed)} OF {len(documents)} DOCUMENT(S) IN "
+        f"~{context.tokens} TOKENS, ~{context.tokens_saved} SAVED "
+        f"({context.duplicates} DUPLICATE, {truncated} TRUNCATED, "
+        f"{context.dropped} LEFT OUT)"
+    )
+    return context
+
+
+def _by_score(documents: list[Document]) -> list[Document]:
+    """Order the documents by rerank score, or else by retrieval score.
+
+    Documents keep their retrieval order unless every one of them has the score.
+    """
+    for key in ("rerank_score", "score"):
+        if documents and all(d.metadata.get(key) is not None for d in documents):
+            return sorted(documents, key=lambda d: -d.metadata[key])
+    return documents
+
+
+def _dedupe(documents: list[Document]) -> list[Document]:
+    """Drop repeated documents and the text chunks of a source overlap on.
+
+    A document whose text is contained in a better ranked document of the same
+    source is dropped; text it shares at its start or end with one is trimmed.
+    """
+    kept: list[Document] = []
+    for doc in documents:
+        text = doc.page_content
+        source = doc.metadata.get("source")
+        for other in kept:
+            if other.metadata.get("source") != source:
+                continue
+            if text in other.page_content:
+                text = ""
+                break
+            text = text[_overlap(other.page_content, text) :]
+            text = text[: len(text) - _overlap(text, other.page_content)]
+        if not text.strip():
+            continue
+        if text != doc.page_content:
+            # The token count of the indexer no longer applies.
+            metadata = {k: v for k, v in doc.metadata.items() if k != "token_count"}
+            doc = Document(id=doc.id, page_content=text, metadata=metadata)
+        kept.append(doc)
+    return kept
+
+
+def _overlap(first: str, second: str) -> int:
+    """Return the length of the longest end of ``first`` that ``second`` starts with.
+
+    >>> _overlap("intro " + "shared text " * 4, "shared text " * 4 + "outro")
+    48
+    """
+    if len(second) < MIN_OVERLAP_CHARS:
+        return 0
+    probe = second[:MIN_OVERLAP_CHARS]
+    start = first.find(probe, max(0, len(first) - len(second)))
+    while start != -1:
+        if second.startswith(first[start:]):
+            return len(first) - start
+        start = first.find(probe, start + 1)
+    return 0
+
+
+def _header(doc: Document, index: int) -> str:
+    attributes = "".join(
+        f' {key}="{doc.metadata[key]}"'
+        for key in CONTEXT_METADATA_KEYS
+        if doc.metadata.get(key)
+    )
+    return f'<document index="{index}"{attributes}>'
+
+
+def _content_tokens(doc: Document) -> int:
+    token_count = doc.metadata.get("token_count")
+    if isinstance(token_count, int):
+        return token_count
+    return estimate_tokens(doc.page_content)
+
+
+def _truncate(text: str, tokens: int) -> str:
+    """Cut a text to about ``tokens`` tokens, at a word boundary."""
+    cut = text[: max(0, 4 * tokens - 4)]
+    if " " in cut:
+        cut = cut[: cut.rindex(" ")]
+    return cut + " …"
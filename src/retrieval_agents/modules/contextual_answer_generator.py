@@ -1,27 +1,56 @@
 """Agent for adaptive RAG."""
 
+import asyncio
 import logging
-from typing import Annotated, Dict, Literal, Sequence, cast
+import weakref
+from typing import Annotated, Any, Dict, Literal, Optional, Sequence, cast
 
 from langchain_core.documents import Document
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables import Runnable, RunnableConfig
 from langgraph.graph import StateGraph
 from langgraph.graph.state import CompiledStateGraph
 from langgraph.types import Command
 from pydantic import BaseModel, Field
 
 from retrieval_agents import prompts
-from retrieval_agents.configurations import ConfigurationBase
-from retrieval_agents.modules.states import BasicRAGInputState
-from retrieval_agents.modules.utils import load_chat_model, reduce_docs
+from retrieval_agents.configurations import (
+    BudgetConfiguration,
+    ContextConfiguration,
+    IndexerConfiguration,
+)
+from retrieval_agents.modules import retrieval
+from retrieval_agents.modules.budget import (
+    BUDGET_EXHAUSTED,
+    budget_exhausted,
+    remaining_llm_calls,
+    spend,
+    start_budget,
+    within_deadline,
+)
+from retrieval_agents.modules.context_compression import compress_documents
+from retrieval_agents.modules.context_packing import pack_context
+from retrieval_agents.modules.states import BasicRAGInputState, BudgetState
+from retrieval_agents.modules.utils import (
+    aget_chain,
+    estimate_tokens,
+    load_chat_model,
+    reduce_docs,
+)
+from retrieval_agents.utils.blocking import run_blocking
 
 logger = logging.getLogger("adaptive_rag_graph")
 
+# Grading semaphores shared by every run in the process, per event loop, so
+# that concurrent runs together stay within the provider limits.
+_grading_semaphores: weakref.WeakKeyDictionary[
+    asyncio.AbstractEventLoop, dict[tuple[str, int], asyncio.Semaphore]
+] = weakref.WeakKeyDictionary()
+
 
 ### Configuration ###
-class ContextualAnswerGeneratorConfiguration(ConfigurationBase):
+class ContextualAnswerGeneratorConfiguration(BudgetConfiguration, ContextConfiguration):
     """The configuration for the adaptive rag agent."""
 
     answer_grader_model: Annotated[str, {"__metadata__": {"kind": "llm"}}] = Field(
@@ -61,6 +90,21 @@ class ContextualAnswerGeneratorConfiguration(ConfigurationBase):
         description="The human prompt used for grading the answer gerated by the LLM whether it based on the facts",
     )
 
+    generation_grading_mode: Literal["sequential", "parallel", "combined"] = Field(
+        default="sequential",
+        description="How the generation is graded. 'sequential' runs the answer grader only after the hallucination grader passes; 'parallel' runs both concurrently and cancels the answer grader when the generation is not grounded; 'combined' returns both verdicts from a single call to the hallucination grader model.",
+    )
+
+    generation_grader_system_prompt: str = Field(
+        default=prompts.GENERATION_GRADER_SYSTEM_PROMPT,
+        description="The system prompt used for grading groundedness and usefulness in a single call.",
+    )
+
+    generation_grader_human_prompt: str = Field(
+        default=prompts.GENERATION_GRADER_HUMAN_PROMPT,
+        description="The human prompt used for grading groundedness and usefulness in a single call.",
+    )
+
     grade_documents_model: Annotated[
         str, {"__template_metadata__": {"kind": "llm"}}
     ] = Field(
@@ -78,10 +122,83 @@ class ContextualAnswerGeneratorConfiguration(ConfigurationBase):
         description="The human prompt used for grading the documents.",
     )
 
+    grade_documents_mode: Literal["per_document", "listwise"] = Field(
+        default="per_document",
+        description="How the documents are graded. 'per_document' grades each document in its own call; 'listwise' grades all documents in a single call.",
+    )
+
+    listwise_grade_documents_system_prompt: str = Field(
+        default=prompts.LISTWISE_GRADE_DOCUMENTS_SYSTEM_PROMPT,
+        description="The system prompt used for grading all documents in a single call.",
+    )
+
+    listwise_grade_documents_human_prompt: str = Field(
+        default=prompts.LISTWISE_GRADE_DOCUMENTS_HUMAN_PROMPT,
+        description="The human prompt used for grading all documents in a single call.",
+    )
+
+    listwise_grading_token_budget: int = Field(
+        default=6000,
+        ge=1,
+        description="The maximum estimated prompt size, in tokens, for listwise grading. Larger prompts fall back to per-document grading.",
+    )
+
+    grade_keep_score: Optional[float] = Field(
+        default=None,
+        ge=-1,
+        le=1,
+        description="Documents whose retrieval score (cosine similarity) is at least this are kept without calling the grader. Documents without a score are always graded.",
+    )
+
+    grade_drop_score: Optional[float] = Field(
+        default=None,
+        ge=-1,
+        le=1,
+        description="Documents whose retrieval score (cosine similarity) is below this are dropped without calling the grader. Only the documents scoring between grade_drop_score and grade_keep_score are graded by the LLM.",
+    )
+
+    grade_documents_max_concurrency: int = Field(
+        default=8,
+        ge=1,
+        description="The maximum number of documents graded concurrently.",
+    )
+
+    provider_max_concurrency: dict[str, int] = Field(
+        default_factory=lambda: {"ollama": 1},
+        description="Per-provider caps on concurrent grading calls, keyed by the provider part of the model name. Takes precedence over grade_documents_max_concurrency when lower.",
+    )
+
+    grade_documents_timeout: Optional[float] = Field(
+        default=None,
+        gt=0,
+        description="Seconds to wait for the grade of a single document. No timeout when unset.",
+    )
+
+    grade_documents_timeout_policy: Literal["keep", "drop"] = Field(
+        default="keep",
+        description="Whether a document whose grading timed out, or that the LLM-call budget leaves ungraded, is kept or dropped.",
+    )
+
+    compress_context: bool = Field(
+        default=False,
+        description="Compress the relevant documents before generation and grading, keeping the sentences of each document most similar to the question. Uses the embedding model of the retriever and reuses the query embedding of its search.",
+    )
+
+    compressed_document_tokens: int = Field(
+        default=120,
+        ge=1,
+        description="The maximum estimated size, in tokens, of a compressed document. Shorter documents are left as is.",
+    )
+
     generate_model: Annotated[str, {"__template_metadata__": {"kind": "llm"}}] = Field(
         default="openai/gpt-4o", description="The language model used for generating."
     )
 
+    def max_concurrency(self, model: str) -> int:
+        """Return the number of concurrent grading calls allowed for a model."""
+        limit = self.grade_documents_max_concurrency
+        return min(limit, self.provider_max_concurrency.get(_provider(model), limit))
+
 
 ### Schemas ###
 class GradeHallucinations(BaseModel):
@@ -100,6 +217,15 @@ class GradeAnswer(BaseModel):
     )
 
 
+class GradeGeneration(BaseModel):
+    """Binary scores for groundedness and usefulness of a generation answer."""
+
+    grounded: str = Field(description="Answer is grounded in the facts, 'yes' or 'no'")
+    addresses_question: str = Field(
+        description="Answer addresses the question, 'yes' or 'no'"
+    )
+
+
 class GradeDocuments(BaseModel):
     """Binary score for relevance check on retrieved documents."""
 
@@ -108,8 +234,25 @@ class GradeDocuments(BaseModel):
     )
 
 
+class DocumentGrade(BaseModel):
+    """Binary relevance score of one document in a numbered list."""
+
+    index: int = Field(description="The index of the document in the list.")
+    binary_score: str = Field(
+        description="Document is relevant to the question, 'yes' or 'no'"
+    )
+
+
+class GradeDocumentList(BaseModel):
+    """Binary scores for relevance check on a numbered list of retrieved documents."""
+
+    grades: list[DocumentGrade] = Field(
+        description="One relevance score for every document index."
+    )
+
+
 ### States ###
-class ContextualAnswerGeneratorInputState(BasicRAGInputState):
+class ContextualAnswerGeneratorInputState(BasicRAGInputState, BudgetState):
     """State for the contextual answer generator input."""
 
     documents: Annotated[Sequence[Document], reduce_docs]
@@ -122,10 +265,24 @@ class ContextualAnswerGeneratorState(ContextualAnswerGeneratorInputState):
     finish_reason: str = Field(default="")
 
 
+def budget_exhausted_update(state: ContextualAnswerGeneratorState) -> dict[str, Any]:
+    """Return the state update that ends a request whose budget is exhausted.
+
+    The best generation so far is kept as the final generation.
+    """
+    logger.info("DECISION: BUDGET EXHAUSTED")
+    return {
+        "question": state.question,
+        "generation": state.best_generation or state.generation,
+        "finish_reason": BUDGET_EXHAUSTED,
+        **spend(state),
+    }
+
+
 ### Nodes ###
 async def grade_context(
-    state: ContextualAnswerGeneratorInputState, *, config: RunnableConfig
-) -> Command[Literal["generate", "__end__"]]:
+    state: ContextualAnswerGeneratorState, *, config: RunnableConfig
+) -> Command[Literal["compress_context", "generate", "__end__"]]:
     """Determine whether the retrieved documents are relevant to the question.
 
     Args:
@@ -136,55 +293,293 @@ async def grade_context(
     """
     logger.info(f"grade_documents_call: {state}")
     configuration = ContextualAnswerGeneratorConfiguration.from_runnable_config(config)
+    if budget_exhausted(state, configuration):
+        return Command(goto="__end__", update=budget_exhausted_update(state))
     question = state.question
     documents = state.documents
 
-    llm = load_chat_model(configuration.grade_documents_model)
-    structured_llm_grader = llm.with_structured_output(
-        GradeDocuments.model_json_schema()
-    )
-
-    # Prompt
-    system = configuration.grade_documents_system_prompt
-    grade_prompt = ChatPromptTemplate.from_messages(
-        [
-            ("system", system),
-            ("human", configuration.grade_documents_human_prompt),
-        ]
-    )
-
-    retrieval_grader = grade_prompt | structured_llm_grader
-
-    # Score each doc
-    filtered_docs = []
-    for d in documents:
-        score = cast(
-            Dict[str, str],
-            await retrieval_grader.ainvoke(
-                {"question": question, "document": d.page_content}
+    try:
+        grades, llm_calls = await within_deadline(
+            _grade_context(
+                question,
+                documents,
+                configuration,
+                remaining_llm_calls(state, configuration),
             ),
+            state,
+            configuration,
         )
-        grade = score["binary_score"]
-        if grade == "yes":
-            logger.info("GRADE: DOCUMENT RELEVANT")
-            filtered_docs.append(d)
-        else:
-            logger.info("GRADE: DOCUMENT NOT RELEVANT")
-            continue
+    except asyncio.TimeoutError:
+        return Command(goto="__end__", update=budget_exhausted_update(state))
+
+    filtered_docs = [d for d, relevant in zip(documents, grades) if relevant]
     if len(filtered_docs) == 0:
         return Command(
             goto="__end__",
-            update={"question": question, "finish_reason": "no_relevant_documents"},
+            update={
+                "question": question,
+                "finish_reason": "no_relevant_documents",
+                **spend(state, llm_calls),
+            },
         )
     else:
         return Command(
-            goto="generate", update={"question": question, "documents": filtered_docs}
+            goto="compress_context" if configuration.compress_context else "generate",
+            update={
+                "question": question,
+                "documents": filtered_docs,
+                **spend(state, llm_calls),
+            },
+        )
+
+
+async def _grade_context(
+    question: str,
+    documents: Sequence[Document],
+    configuration: ContextualAnswerGeneratorConfiguration,
+    max_calls: Optional[int] = None,
+) -> tuple[list[Optional[bool]], int]:
+    """Return the grade of every document and the number of LLM calls made.
+
+    When fewer than ``max_calls`` calls are left for the documents the retrieval
+    score did not decide, they are graded listwise instead, and the documents the
+    budget still leaves ungraded follow ``grade_documents_timeout_policy``.
+    """
+    llm_calls = 0
+    grades = gate_by_score(
+        documents, configuration.grade_keep_score, configuration.grade_drop_score
+    )
+    pending = [i for i, grade in enumerate(grades) if grade is None]
+    if len(pending) < len(documents):
+        kept = grades.count(True)
+        logger.info(
+            f"GRADE: {kept} DOCUMENT(S) KEPT AND {len(documents) - len(pending) - kept} "
+            "DROPPED BY RETRIEVAL SCORE"
+        )
+    over_budget = max_calls is not None and len(pending) > max_calls
+    if pending and (configuration.grade_documents_mode == "listwise" or over_budget):
+        listwise_grades = await _grade_documents_listwise(
+            question, [documents[i] for i in pending], configuration
+        )
+        if listwise_grades is not None:
+            for i, grade in zip(pending, listwise_grades):
+                grades[i] = grade
+            llm_calls += 1
+    pending = [i for i, grade in enumerate(grades) if grade is None]
+    calls_left = None if max_calls is None else max_calls - llm_calls
+    if calls_left is not None and len(pending) > calls_left:
+        policy = configuration.grade_documents_timeout_policy
+        logger.info(
+            f"GRADE: BUDGET LEFT FOR {calls_left} OF {len(pending)} DOCUMENT(S), "
+            f"{policy.upper()} THE OTHERS"
+        )
+        for i in pending[calls_left:]:
+            grades[i] = policy == "keep"
+        pending = pending[:calls_left]
+    if pending:
+        pending_grades = await _grade_documents_individually(
+            question, [documents[i] for i in pending], configuration
+        )
+        llm_calls += len(pending)
+        for i, grade in zip(pending, pending_grades):
+            grades[i] = grade
+    return grades, llm_calls
+
+
+def gate_by_score(
+    documents: Sequence[Document],
+    keep_score: Optional[float],
+    drop_score: Optional[float],
+) -> list[Optional[bool]]:
+    """Return the grades decided by the retrieval score of the documents alone.
+
+    Args:
+        documents (Sequence[Document]): Documents with their retrieval score in
+            their ``score`` metadata.
+        keep_score (Optional[float]): Documents scoring at least this are relevant.
+        drop_score (Optional[float]): Documents scoring below this are not relevant.
+
+    Returns:
+        list[Optional[bool]]: The grade of every document, None for the documents
+            left to the grader, including those without a score.
+    """
+    grades: list[Optional[bool]] = []
+    for document in documents:
+        score = document.metadata.get("score")
+        if score is None:
+            grades.append(None)
+        elif keep_score is not None and score >= keep_score:
+            grades.append(True)
+        elif drop_score is not None and score < drop_score:
+            grades.append(False)
+        else:
+            grades.append(None)
+    return grades
+
+
+async def _grade_documents_individually(
+    question: str,
+    documents: Sequence[Document],
+    configuration: ContextualAnswerGeneratorConfiguration,
+) -> list[bool]:
+    retrieval_grader = await _structured_chain(
+        configuration.grade_documents_model,
+        configuration.grade_documents_system_prompt,
+        configuration.grade_documents_human_prompt,
+        GradeDocuments,
+    )
+
+    # Score the docs concurrently; gather keeps the original order.
+    semaphore = _grading_semaphore(
+        configuration.grade_documents_model,
+        configuration.max_concurrency(configuration.grade_documents_model),
+    )
+    return await asyncio.gather(
+        *(
+            _grade_document(retrieval_grader, question, d, semaphore, configuration)
+            for d in documents
+        )
+    )
+
+
+async def _grade_documents_listwise(
+    question: str,
+    documents: Sequence[Document],
+    configuration: ContextualAnswerGeneratorConfiguration,
+) -> Optional[list[Optional[bool]]]:
+    """Grade every document in one structured-output call.
+
+    Returns None without calling the grader if the prompt would exceed the token
+    budget. Documents whose index the grader skipped are graded as None.
+    """
+    numbered_documents = "\n".join(
+        f'<document index="{i}">\n{d.page_content}\n</document>'
+        for i, d in enumerate(documents)
+    )
+    prompt_tokens = estimate_tokens(
+        configuration.listwise_grade_documents_system_prompt
+        + configuration.listwise_grade_documents_human_prompt
+        + numbered_documents
+        + question
+    )
+    if prompt_tokens > configuration.listwise_grading_token_budget:
+        logger.info(
+            f"GRADE: LISTWISE PROMPT OF ~{prompt_tokens} TOKENS EXCEEDS BUDGET, "
+            "FALLING BACK TO PER-DOCUMENT GRADING"
+        )
+        return None
+
+    listwise_grader = await _structured_chain(
+        configuration.grade_documents_model,
+        configuration.listwise_grade_documents_system_prompt,
+        configuration.listwise_grade_documents_human_prompt,
+        GradeDocumentList,
+    )
+    response = cast(
+        Dict[str, list[Dict[str, Any]]],
+        await listwise_grader.ainvoke(
+            {"question": question, "documents": numbered_documents}
+        ),
+    )
+    grades: list[Optional[bool]] = [None] * len(documents)
+    for item in response.get("grades", []):
+        index = item.get("index")
+        if isinstance(index, int) and 0 <= index < len(documents):
+            grades[index] = item.get("binary_score") == "yes"
+    missing = grades.count(None)
+    if missing:
+        logger.info(f"GRADE: {missing} DOCUMENT(S) NOT GRADED BY LISTWISE GRADER")
+    return grades
+
+
+def _provider(model: str) -> str:
+    return model.split("/", maxsplit=1)[0] if "/" in model else ""
+
+
+def _grading_semaphore(model: str, limit: int) -> asyncio.Semaphore:
+    """Return the semaphore of the running loop bounding the grading calls to a provider."""
+    semaphores = _grading_semaphores.setdefault(asyncio.get_running_loop(), {})
+    key = (_provider(model), limit)
+    if key not in semaphores:
+        semaphores[key] = asyncio.Semaphore(limit)
+    return semaphores[key]
+
+
+async def _grade_document(
+    retrieval_grader: Runnable[dict[str, Any], Any],
+    question: str,
+    document: Document,
+    semaphore: asyncio.Semaphore,
+    configuration: ContextualAnswerGeneratorConfiguration,
+) -> bool:
+    async with semaphore:
+        try:
+            score = cast(
+                Dict[str, str],
+                await asyncio.wait_for(
+                    retrieval_grader.ainvoke(
+                        {"question": question, "document": document.page_content}
+                    ),
+                    timeout=configuration.grade_documents_timeout,
+                ),
+            )
+        except asyncio.TimeoutError:
+            policy = configuration.grade_documents_timeout_policy
+            logger.info(f"GRADE: TIMED OUT, {policy.upper()} DOCUMENT")
+            return policy == "keep"
+    grade = score["binary_score"]
+    if grade == "yes":
+        logger.info("GRADE: DOCUMENT RELEVANT")
+        return True
+    else:
+        logger.info("GRADE: DOCUMENT NOT RELEVANT")
+        return False
+
+
+async def compress_context(
+    state: ContextualAnswerGeneratorState, *, config: RunnableConfig
+) -> dict[str, Any]:
+    """Keep the sentences of the relevant documents that bear on the question.
+
+    Args:
+        state (dict): The current graph state
+
+    Returns:
+        state (dict): Updates documents key with the compressed documents
+    """
+    configuration = ContextualAnswerGeneratorConfiguration.from_runnable_config(config)
+    if budget_exhausted(state, configuration):
+        return budget_exhausted_update(state)
+    embedding_model = IndexerConfiguration.from_runnable_config(config).embedding_model
+    try:
+        documents = await within_deadline(
+            _compress_context(state, embedding_model, configuration),
+            state,
+            configuration,
         )
+    except asyncio.TimeoutError:
+        return budget_exhausted_update(state)
+    return {"question": state.question, "documents": documents, **spend(state)}
+
+
+async def _compress_context(
+    state: ContextualAnswerGeneratorState,
+    embedding_model: str,
+    configuration: ContextualAnswerGeneratorConfiguration,
+) -> list[Document]:
+    # Building the encoder on a pool miss may open clients or load weights.
+    embeddings = await run_blocking(retrieval.get_text_encoder, embedding_model)
+    return await compress_documents(
+        state.question,
+        state.documents,
+        embeddings,
+        configuration.compressed_document_tokens,
+    )
 
 
 async def generate(
-    state: ContextualAnswerGeneratorInputState, *, config: RunnableConfig
-) -> dict[str, str | Sequence[Document]]:
+    state: ContextualAnswerGeneratorState, *, config: RunnableConfig
+) -> dict[str, Any]:
     """Generate answer.
 
     Args:
@@ -194,18 +589,48 @@ async def generate(
         state (dict): New key added to state, generation, that contains LLM generation
     """
     configuration = ContextualAnswerGeneratorConfiguration.from_runnable_config(config)
+    if budget_exhausted(state, configuration):
+        return budget_exhausted_update(state)
 
     question = state.question
     documents = state.documents
-    prompt = ChatPromptTemplate.from_messages(
-        [("human", configuration.generate_human_prompt)]
+
+    def build_rag_chain() -> Runnable[Any, Any]:
+        prompt = ChatPromptTemplate.from_messages(
+            [("human", configuration.generate_human_prompt)]
+        )
+        llm = load_chat_model(configuration.generate_model)
+        return prompt | llm | StrOutputParser()
+
+    rag_chain = await aget_chain(
+        (
+            "generate",
+            configuration.generate_model,
+            configuration.generate_human_prompt,
+        ),
+        build_rag_chain,
     )
-    llm = load_chat_model(configuration.generate_model)
-    rag_chain = prompt | llm | StrOutputParser()
     # RAG generation
-    generation = await rag_chain.ainvoke({"context": documents, "question": question})
+    context = pack_context(
+        documents,
+        configuration.context_budget(configuration.generate_model),
+        "generate",
+    )
+    try:
+        generation = await within_deadline(
+            rag_chain.ainvoke({"context": context.text, "question": question}),
+            state,
+            configuration,
+        )
+    except asyncio.TimeoutError:
+        return budget_exhausted_update(state)
 
-    return {"documents": documents, "question": question, "generation": generation}
+    return {
+        "documents": documents,
+        "question": question,
+        "generation": generation,
+        **spend(state, 1),
+    }
 
 
 async def grade_generation(
@@ -220,17 +645,22 @@ async def grade_generation(
         str: Decision for next node to call
     """
     configuration = ContextualAnswerGeneratorConfiguration.from_runnable_config(config)
-    grade_hallucination = (
-        await _grade_generation_v_documents_and_question_hallucination(
-            state=state, configuration=configuration
+    if state.finish_reason == BUDGET_EXHAUSTED or budget_exhausted(
+        state, configuration
+    ):
+        return Command(goto="__end__", update=budget_exhausted_update(state))
+    try:
+        grade_hallucination, grade_answer = await within_deadline(
+            _grade_generation(state=state, configuration=configuration),
+            state,
+            configuration,
         )
-    )
+    except asyncio.TimeoutError:
+        return Command(goto="__end__", update=budget_exhausted_update(state))
+    budget = spend(state, _generation_grading_calls(configuration, grade_hallucination))
 
     # Check hallucination
     if grade_hallucination:
-        grade_answer = await _grade_generation_v_docuemnts_and_question_answer(
-            state=state, configuration=configuration
-        )
         if not grade_answer:
             logger.info("DECISION: GENERATION DOES NOT ADDRESS QUESTION")
             return Command(
@@ -239,7 +669,9 @@ async def grade_generation(
                     "question": state.question,
                     "documents": state.documents,
                     "generation": state.generation,
+                    "best_generation": state.generation,
                     "finish_reason": "not_useful",
+                    **budget,
                 },
             )
 
@@ -251,40 +683,150 @@ async def grade_generation(
                     "question": state.question,
                     "documents": state.documents,
                     "generation": state.generation,
+                    "best_generation": state.generation,
                     "finish_reason": "complete",
+                    **budget,
                 },
             )
     else:
         logger.info("DECISION: GENERATION IS NOT GROUNDED IN DOCUMENTS, RE-TRY")
         return Command(
             goto="generate",
-            update={"question": state.question, "documents": state.documents},
+            update={
+                "question": state.question,
+                "documents": state.documents,
+                **budget,
+            },
+        )
+
+
+def _generation_grading_calls(
+    configuration: ContextualAnswerGeneratorConfiguration, grounded: bool
+) -> int:
+    """Return the number of LLM calls made to grade a generation.
+
+    The answer grader is not called for an ungrounded generation, or its
+    speculative call is cancelled in parallel mode.
+    """
+    if configuration.generation_grading_mode == "combined":
+        return 1
+    return 2 if grounded else 1
+
+
+async def _grade_generation(
+    state: ContextualAnswerGeneratorState,
+    configuration: ContextualAnswerGeneratorConfiguration,
+) -> tuple[bool, Optional[bool]]:
+    """Return the hallucination and answer grades of the generation.
+
+    The answer grade is None when the generation is not grounded, since the
+    answer grader's verdict does not change the routing in that case.
+    """
+    mode = configuration.generation_grading_mode
+    if mode == "combined":
+        return await _grade_generation_v_documents_and_question_combined(
+            state=state, configuration=configuration
         )
+    if mode == "parallel":
+        # Speculatively grade the answer while checking for hallucinations.
+        answer_task = asyncio.create_task(
+            _grade_generation_v_docuemnts_and_question_answer(
+                state=state, configuration=configuration
+            )
+        )
+        try:
+            grade_hallucination = (
+                await _grade_generation_v_documents_and_question_hallucination(
+                    state=state, configuration=configuration
+                )
+            )
+        except BaseException:
+            await _cancel(answer_task)
+            raise
+        if not grade_hallucination:
+            await _cancel(answer_task)
+            return False, None
+        return True, await answer_task
+
+    grade_hallucination = (
+        await _grade_generation_v_documents_and_question_hallucination(
+            state=state, configuration=configuration
+        )
+    )
+    if not grade_hallucination:
+        return False, None
+    return True, await _grade_generation_v_docuemnts_and_question_answer(
+        state=state, configuration=configuration
+    )
+
+
+async def _cancel(task: "asyncio.Task[Any]") -> None:
+    """Cancel a speculative task and wait until it has stopped."""
+    task.cancel()
+    # asyncio.wait does not raise the task's outcome, but still propagates a
+    # cancellation of the caller.
+    await asyncio.wait({task})
+    if not task.cancelled():
+        task.exception()
+
+
+def _grader_context(
+    state: ContextualAnswerGeneratorState,
+    configuration: ContextualAnswerGeneratorConfiguration,
+) -> str:
+    """Return the documents packed for the generation graders."""
+    return pack_context(
+        state.documents,
+        configuration.context_budget(configuration.hallucination_grader_model),
+        "grade_generation",
+    ).text
+
+
+async def _grade_generation_v_documents_and_question_combined(
+    state: ContextualAnswerGeneratorState,
+    configuration: ContextualAnswerGeneratorConfiguration,
+) -> tuple[bool, Optional[bool]]:
+    generation_grader = await _structured_chain(
+        configuration.hallucination_grader_model,
+        configuration.generation_grader_system_prompt,
+        configuration.generation_grader_human_prompt,
+        GradeGeneration,
+    )
+    score = cast(
+        Dict[str, str],
+        await generation_grader.ainvoke(
+            {
+                "documents": _grader_context(state, configuration),
+                "question": state.question,
+                "generation": state.generation,
+            }
+        ),
+    )
+    if score["grounded"] != "yes":
+        return False, None
+    return True, score["addresses_question"] == "yes"
 
 
 async def _grade_generation_v_documents_and_question_hallucination(
     state: ContextualAnswerGeneratorState,
     configuration: ContextualAnswerGeneratorConfiguration,
 ) -> bool:
-    documents = state.documents
     generation = state.generation
 
-    llm = load_chat_model(configuration.hallucination_grader_model)
-    configuration.hallucination_grader_human_prompt
-    structured_llm_grader = llm.with_structured_output(
-        GradeHallucinations.model_json_schema(), include_raw=True
-    )
-    hallucination_prompt = ChatPromptTemplate.from_messages(
-        [
-            ("system", configuration.hallucination_grader_system_prompt),
-            ("human", configuration.hallucination_grader_human_prompt),
-        ]
+    hallucination_grader = await _structured_chain(
+        configuration.hallucination_grader_model,
+        configuration.hallucination_grader_system_prompt,
+        configuration.hallucination_grader_human_prompt,
+        GradeHallucinations,
+        include_raw=True,
     )
-    hallucination_grader = hallucination_prompt | structured_llm_grader
     response = cast(
         Dict[str, Dict[str, str]],
         await hallucination_grader.ainvoke(
-            {"documents": documents, "generation": generation}
+            {
+                "documents": _grader_context(state, configuration),
+                "generation": generation,
+            }
         ),
     )
     # _ = response["raw"]
@@ -305,16 +847,12 @@ async def _grade_generation_v_docuemnts_and_question_answer(
     question = state.question
     generation = state.generation
     # Check question-answering
-    llm = load_chat_model(configuration.answer_grader_model)
-    structured_llm_grader = llm.with_structured_output(GradeAnswer.model_json_schema())
-    answer_prompt = ChatPromptTemplate.from_messages(
-        [
-            ("system", configuration.answer_grader_system_prompt),
-            ("human", configuration.answer_grader_human_prompt),
-        ]
+    answer_grader = await _structured_chain(
+        configuration.answer_grader_model,
+        configuration.answer_grader_system_prompt,
+        configuration.answer_grader_human_prompt,
+        GradeAnswer,
     )
-
-    answer_grader = answer_prompt | structured_llm_grader
     score = cast(
         Dict[str, str],
         await answer_grader.ainvoke({"question": question, "generation": generation}),
@@ -326,6 +864,29 @@ async def _grade_generation_v_docuemnts_and_question_answer(
         return False
 
 
+async def _structured_chain(
+    model: str,
+    system_prompt: str,
+    human_prompt: str,
+    schema: type[BaseModel],
+    include_raw: bool = False,
+) -> Runnable[dict[str, Any], Any]:
+    """Return the cached ``prompt | model.with_structured_output(schema)`` chain."""
+
+    def build() -> Runnable[dict[str, Any], Any]:
+        prompt = ChatPromptTemplate.from_messages(
+            [("system", system_prompt), ("human", human_prompt)]
+        )
+        llm = load_chat_model(model)
+        return prompt | llm.with_structured_output(
+            schema.model_json_schema(), include_raw=include_raw
+        )
+
+    return await aget_chain(
+        (schema.__name__, model, system_prompt, human_prompt, include_raw), build
+    )
+
+
 ### Edges ###
 
 ### Build Graph ###
@@ -337,11 +898,15 @@ builder = StateGraph(
     config_schema=ContextualAnswerGeneratorConfiguration,
 )
 
+builder.add_node(start_budget)
 builder.add_node(grade_context)
+builder.add_node(compress_context)
 builder.add_node(generate)
 builder.add_node(grade_generation)
 
-builder.set_entry_point("grade_context")
+builder.set_entry_point("start_budget")
+builder.add_edge("start_budget", "grade_context")
+builder.add_edge("compress_context", "generate")
 builder.add_edge("generate", "grade_generation")
 
 
@@ -0,0 +1,347 @@
+"""This "graph" indexes the files of a local directory tree.
+
+Files are parsed and split in a pool of worker processes and their chunks are
+streamed into the same upsert path as the other indexers. A manifest records
+every file once all of its chunks are indexed, so an interrupted run resumes
+where it stopped and a re-run only re-indexes the files that changed.
+
+It can also be run from the command line::
+
+    python -m retrieval_agents.modules.directory_indexer ./docs --user-id me
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, AsyncIterator, Optional
+
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableConfig
+from langgraph.graph import StateGraph
+from pydantic import BaseModel, Field
+
+from retrieval_agents.configurations import IndexerConfiguration
+from retrieval_agents.modules import retrieval
+from retrieval_agents.utils.blocking import run_blocking
+from retrieval_agents.utils.crawl_state import CrawlState, PageRecord
+from retrieval_agents.utils.file_parsing import (
+    SUPPORTED_EXTENSIONS,
+    ParsedFile,
+    file_signature,
+    parse_file,
+)
+from retrieval_agents.utils.pipeline import (
+    Channel,
+    PipelineSummary,
+    StageStats,
+    run_pipeline,
+    run_stage,
+)
+
+logger = logging.getLogger("directory_indexer")
+
+
+### Configuration ###
+class DirectoryIndexerConfiguration(IndexerConfiguration):
+    """Configuration of the directory indexer."""
+
+    workers: Optional[int] = Field(
+        default=None,
+        ge=1,
+        description="The number of processes parsing and splitting files. Defaults to the number of CPUs.",
+    )
+
+    extensions: list[str] = Field(
+        default_factory=lambda: list(SUPPORTED_EXTENSIONS),
+        description="The extensions of the files to index.",
+    )
+
+    manifest_path: Optional[str] = Field(
+        default=None,
+        description="Path of the SQLite database recording the files indexed for each user. When set, files that did not change since they were indexed are skipped, which lets an interrupted run resume.",
+    )
+
+    queue_size: int = Field(
+        default=16,
+        ge=1,
+        description="The number of parsed files waiting to be indexed. A full queue pauses parsing.",
+    )
+
+    index_batch_size: int = Field(
+        default=256,
+        ge=1,
+        description="The minimum number of chunks handed to the upsert together. Files are never split across upserts.",
+    )
+
+
+### States ###
+class DirectoryInputState(BaseModel):
+    """Input state of the directory indexer."""
+
+    path: str
+    """Root of the directory tree to index."""
+
+
+class DirectoryIndexerState(DirectoryInputState):
+    """The state of the directory indexer."""
+
+    summary: Optional[dict[str, Any]] = None
+    """Counters of the ingestion pipeline."""
+
+
+def list_files(root: str, extensions: list[str]) -> list[str]:
+    """Return the files under ``root`` with one of the extensions, in a stable order."""
+    suffixes = tuple(e.lower() for e in extensions)
+    files: list[str] = []
+    for directory, subdirectories, names in os.walk(root):
+        subdirectories.sort()
+        files.extend(
+            os.path.join(directory, name)
+            for name in sorted(names)
+            if name.lower().endswith(suffixes)
+        )
+    return files
+
+
+def _make_pool(workers: Optional[int]) -> Executor:
+    # Forking a process that runs an event loop and executor threads can deadlock.
+    return ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    )
+
+
+### Nodes ###
+async def index_directory(
+    state: DirectoryIndexerState, *, config: Optional[RunnableConfig] = None
+) -> dict[str, Any]:
+    """Parse, split and index every supported file of a directory tree.
+
+    Files are parsed in worker processes and indexed in batches as they are
+    parsed. With a manifest, files whose size and modification time (or, failing
+    that, content) did not change are skipped, and the stale chunks of changed
+    files, and all the chunks of files deleted since the last run, are deleted.
+    A file that fails to parse is logged and skipped.
+
+    Args:
+        state (DirectoryIndexerState): The directory to index.
+        config (Optional[RunnableConfig]): Configuration for the indexing process.
+
+    Returns:
+        dict[str, Any]: The pipeline summary (files, chunks, bytes and seconds per
+            stage) and the upsert report.
+    """
+    if not config:
+        raise ValueError("Configuration required to run index_directory.")
+    configuration = DirectoryIndexerConfiguration.from_runnable_config(config)
+    user_id = configuration.user_id
+    root = os.path.abspath(state.path)
+    files = await run_blocking(list_files, root, configuration.extensions)
+    logger.info(f"Found {len(files)} file(s) under {root}")
+    options = retrieval.BulkOptions.from_configuration(configuration)
+    report = retrieval.UpsertReport()
+    parsed = StageStats("parse")
+    indexed = StageStats("index")
+    outbox: Channel[ParsedFile] = Channel(configuration.queue_size)
+    manifest = (
+        await run_blocking(CrawlState, configuration.manifest_path)
+        if configuration.manifest_path
+        else None
+    )
+    started_at = time.monotonic()
+    try:
+        recorded = (
+            await run_blocking(manifest.get_prefixed, user_id, os.path.join(root, ""))
+            if manifest
+            else {}
+        )
+        listed = set(files)
+        previous = {p: r for p, r in recorded.items() if p in listed}
+        removed = {p: r for p, r in recorded.items() if p not in listed}
+        known_ids = {i for r in previous.values() for i in r.chunk_ids}
+
+        async def paths() -> AsyncIterator[str]:
+            for path in files:
+                yield path
+
+        async def parse(path: str) -> list[ParsedFile]:
+            record = previous.get(path)
+            try:
+                if record is not None and record.last_modified == await run_blocking(
+                    file_signature, path
+                ):
+                    parsed.skipped += 1
+                    return []
+                result = await loop.run_in_executor(
+                    pool,
+                    parse_file,
+                    path,
+                    configuration.chunk_size,
+                    configuration.chunk_overlap,
+                    record.content_hash if record else None,
+                )
+            except Exception as e:
+                parsed.errors += 1
+                logger.warning(f"Failed to parse {path}: {e!r}")
+                return []
+            if result.chunks is None:
+                parsed.skipped += 1
+                await record_files([result], {})
+                return []
+            return [result]
+
+        async def record_files(
+            batch: list[ParsedFile], ids: dict[str, list[str]]
+        ) -> None:
+            if manifest is None:
+                return
+            for result in batch:
+                chunk_ids = ids.get(result.path)
+                record = previous.get(result.path)
+                if chunk_ids is None and record is not None:
+                    chunk_ids = list(record.chunk_ids)
+                stale = sorted(
+                    set(record.chunk_ids if record else ()) - set(chunk_ids or ())
+                )
+                if stale:
+                    await retrieval.adelete_documents(
+                        retriever.vectorstore,
+                        stale,
+                        lexical_index=retrieval.lexical_index_of(retriever),
+                    )
+                await run_blocking(
+                    manifest.put,
+                    user_id,
+                    result.path,
+                    PageRecord(
+                        content_hash=result.content_hash,
+                        chunk_ids=tuple(chunk_ids or ()),
+                        last_modified=result.signature,
+                    ),
+                )
+
+        async def index_batch(batch: list[ParsedFile]) -> list[Document]:
+            chunks = retrieval.with_chunk_ids(
+                [
+                    Document(
+                        page_content=chunk.page_content,
+                        metadata={**chunk.metadata, "user_id": user_id},
+                    )
+                    for result in batch
+                    for chunk in result.chunks or ()
+                ],
+                user_id,
+            )
+            report.merge(
+                await retrieval.aupsert_documents(
+                    retriever.vectorstore,
+                    chunks,
+                    known_ids=known_ids,
+                    options=options,
+                    lexical_index=retrieval.lexical_index_of(retriever),
+                )
+            )
+            ids: dict[str, list[str]] = {result.path: [] for result in batch}
+            for chunk in chunks:
+                ids[chunk.metadata["source"]].append(str(chunk.id))
+            await record_files(batch, ids)
+            return chunks
+
+        loop = asyncio.get_running_loop()
+        workers = configuration.workers or os.cpu_count() or 1
+        with _make_pool(workers) as pool:
+            async with retrieval.amake_retriever(config) as retriever:
+                await run_pipeline(
+                    run_stage(
+                        parsed,
+                        paths(),
+                        parse,
+                        outbox,
+                        # Keep every worker busy while results are collected.
+                        concurrency=2 * workers,
+                    ),
+                    run_stage(
+                        indexed,
+                        _batched_files(outbox, configuration.index_batch_size),
+                        index_batch,
+                        measure=lambda batch: sum(
+                            len(c.page_content.encode())
+                            for result in batch
+                            for c in result.chunks or ()
+                        ),
+                    ),
+                )
+                if manifest is not None and removed:
+                    await retrieval.adelete_documents(
+                        retriever.vectorstore,
+                        sorted({i for r in removed.values() for i in r.chunk_ids}),
+                        lexical_index=retrieval.lexical_index_of(retriever),
+                    )
+                    await run_blocking(manifest.delete, user_id, list(removed))
+                    logger.info(
+                        f"Deleted the chunks of {len(removed)} file(s) removed "
+                        f"from {root}"
+                    )
+    finally:
+        if manifest is not None:
+            await run_blocking(manifest.close)
+    summary = PipelineSummary([parsed, indexed], seconds=time.monotonic() - started_at)
+    logger.info(f"{summary}\n  upsert: {report}")
+    return {"summary": {**summary.as_dict(), "dedupe": report.as_dict()}}
+
+
+async def _batched_files(
+    files: Channel[ParsedFile], min_chunks: int
+) -> AsyncIterator[list[ParsedFile]]:
+    """Group parsed files until they hold at least ``min_chunks`` chunks."""
+    batch: list[ParsedFile] = []
+    n_chunks = 0
+    async for result in files:
+        batch.append(result)
+        n_chunks += len(result.chunks or ())
+        if n_chunks >= min_chunks:
+            yield batch
+            batch, n_chunks = [], 0
+    if batch:
+        yield batch
+
+
+### Graph ###
+builder = StateGraph(
+    DirectoryIndexerState,
+    input=DirectoryInputState,
+    config_schema=DirectoryIndexerConfiguration,
+)
+builder.add_node(index_directory)
+builder.set_entry_point("index_directory")
+builder.set_finish_point("index_directory")
+
+graph = builder.compile()
+graph.name = "DirectoryIndexer"
+
+
+def main() -> None:
+    """Index a directory from the command line and print the summary."""
+    parser = argparse.ArgumentParser(description="Index the files of a directory.")
+    parser.add_argument("path", help="Root of the directory tree to index.")
+    parser.add_argument("--user-id", required=True)
+    parser.add_argument("--manifest", dest="manifest_path")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--retriever-provider")
+    parser.add_argument("--embedding-model")
+    args = parser.parse_args()
+    configurable = {
+        k: v for k, v in vars(args).items() if k != "path" and v is not None
+    }
+    result = asyncio.run(
+        graph.ainvoke({"path": args.path}, {"configurable": configurable})
+    )
+    print(json.dumps(result["summary"], indent=2))  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 """This "graph" simply exposes an endpoint for a user to upload docs to be indexed."""
 
-from typing import Annotated, Optional, Sequence
+import logging
+from typing import Annotated, Any, Optional, Sequence
 
 from langchain_core.documents import Document
 from langchain_core.runnables import RunnableConfig
@@ -8,9 +9,17 @@ from langgraph.graph import StateGraph
 from pydantic import BaseModel
 
 from retrieval_agents.configurations import IndexerConfiguration
-from retrieval_agents.modules.retrieval import make_retriever
+from retrieval_agents.modules.retrieval import (
+    BulkOptions,
+    amake_retriever,
+    aupsert_documents,
+    lexical_index_of,
+    with_chunk_ids,
+)
 from retrieval_agents.modules.utils import reduce_docs
 
+logger = logging.getLogger("document_indexer")
+
 
 ### States ###
 class DocumentIndexerState(BaseModel):
@@ -24,6 +33,9 @@ class DocumentIndexerState(BaseModel):
     docs: Annotated[Sequence[Document], reduce_docs]
     """A list of documents that the agent can index."""
 
+    summary: Optional[dict[str, Any]] = None
+    """Dedupe and throughput report of the last indexing run."""
+
 
 def ensure_docs_have_user_id(
     docs: Sequence[Document], config: RunnableConfig
@@ -49,12 +61,14 @@ def ensure_docs_have_user_id(
 ### Nodes ###
 async def index_docs(
     state: DocumentIndexerState, *, config: Optional[RunnableConfig] = None
-) -> dict[str, str]:
+) -> dict[str, Any]:
     """Asynchronously index documents in the given state using the configured retriever.
 
     This function takes the documents from the state, ensures they have a user ID,
-    adds them to the retriever's index, and then signals for the documents to be
-    deleted from the state.
+    upserts them into the retriever's index under deterministic IDs in
+    concurrent embedding batches and bulk writes, and then signals for the
+    documents to be deleted from the state. Re-submitted chunks are skipped and
+    counted in the dedupe report, next to the indexing throughput.
 
     Args:
         state (IndexState): The current state containing documents and retriever.
@@ -63,11 +77,19 @@ async def index_docs(
     if not config:
         raise ValueError("Configuration required to run index_docs.")
 
-    with make_retriever(config) as retriever:
-        stamped_docs = ensure_docs_have_user_id(state.docs, config)
-
-        await retriever.aadd_documents(stamped_docs)
-    return {"docs": "delete"}
+    configuration = IndexerConfiguration.from_runnable_config(config)
+    async with amake_retriever(config) as retriever:
+        stamped_docs = with_chunk_ids(
+            ensure_docs_have_user_id(state.docs, config), configuration.user_id
+        )
+        report = await aupsert_documents(
+            retriever.vectorstore,
+            stamped_docs,
+            options=BulkOptions.from_configuration(configuration),
+            lexical_index=lexical_index_of(retriever),
+        )
+    logger.info(f"Upsert report: {report}")
+    return {"docs": "delete", "summary": {"dedupe": report.as_dict()}}
 
 
 ### Graph ###
@@ -1,28 +1,180 @@
 """Manage the configuration of various retrievers.
 
 This module provides functionality to create and manage retrievers for different
-vector store backends, specifically Elasticsearch, Pinecone, and MongoDB.
+vector store backends, specifically Elasticsearch, Pinecone, MongoDB, Chroma and
+an embedded store of memory-mapped files (``local``).
 
 The retrievers support filtering results by user_id to ensure data isolation between users.
+
+In ``hybrid`` retrieval mode, the vector search is fused with a BM25 search (see
+``hybrid_search``): Elasticsearch runs it on its own index, and the other
+providers on a pooled in-process ``LexicalIndex`` that the indexers keep up to
+date through ``aupsert_documents`` and ``adelete_documents``.
+
+Retrievers fetch candidates together with their vectors and score them by
+cosine similarity in-process (see ``scored_search``), so every document they
+return carries a comparable ``score`` in its metadata whatever the provider, and
+the score threshold, adaptive ``k`` and MMR of the configuration apply alike.
+
+Graph nodes should use ``amake_retriever``, which builds clients on the blocking
+I/O executor so that the event loop is never blocked by client setup, or
+``aretrieve``, which also applies the local reranker of the configuration.
+
+Text encoders and vector stores are kept in process-wide pools keyed by provider,
+embedding model, index name and credentials, so that HTTP clients, connection
+pools and on-disk collections are reused across requests instead of being
+rebuilt on every call.
+
+Indexers write through ``aupsert_documents``: chunks carry deterministic IDs
+(see ``with_chunk_ids``), so re-submitting the same chunks overwrites them
+instead of creating duplicates, and chunks that are already indexed are not
+embedded again. Chunks are embedded in batches with several requests in flight
+and written through the native bulk API of each store; a failed embedding
+request or bulk write is retried without re-embedding the chunks that were
+already embedded.
 """
 
 from __future__ import annotations
 
+import asyncio
+import atexit
+import functools
+import hashlib
+import logging
 import os
-from contextlib import contextmanager
-from typing import TYPE_CHECKING
+import random
+import sys
+import time
+import uuid
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import asdict, dataclass
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Callable,
+    Collection,
+    Optional,
+    Sequence,
+    cast,
+)
+
+from langchain_core.documents import Document
+
+from retrieval_agents.utils.blocking import run_blocking
+from retrieval_agents.utils.embedding_cache import CachedEmbeddings, get_embedding_cache
+from retrieval_agents.utils.hybrid_search import HybridRetriever, LexicalIndex
+from retrieval_agents.utils.pipeline import (
+    Channel,
+    StageStats,
+    abatched,
+    run_pipeline,
+    run_stage,
+)
+from retrieval_agents.utils.rerank import arerank
+from retrieval_agents.utils.resource_pool import PoolStats, ResourcePool, fingerprint
+from retrieval_agents.utils.scored_search import (
+    Candidates,
+    ScoredRetriever,
+    VectorSearch,
+)
 
 if TYPE_CHECKING:
-    from typing import Generator
+    from typing import AsyncGenerator, Generator
 
     from langchain_core.embeddings import Embeddings
+    from langchain_core.retrievers import BaseRetriever
     from langchain_core.runnables import RunnableConfig
-    from langchain_core.vectorstores import VectorStoreRetriever
+    from langchain_core.vectorstores import VectorStore, VectorStoreRetriever
 
     from retrieval_agents.modules import IndexerConfiguration
 
     from .simple_rag import SimpleRagConfiguration
 
+logger = logging.getLogger(__name__)
+
+ENCODER_POOL_SIZE = 8
+VECTORSTORE_POOL_SIZE = 16
+LEXICAL_INDEX_POOL_SIZE = 16
+
+_ENCODER_CREDENTIALS = {
+    "openai": ("OPENAI_API_KEY",),
+    "cohere": ("COHERE_API_KEY",),
+    "nomic": ("NOMIC_API_KEY",),
+    "voyageai": ("VOYAGE_API_KEY",),
+}
+
+
+## Resource pools
+
+
+def _close_vectorstore(vstore: VectorStore) -> None:
+    """Release the network clients and files held by a vector store, if any."""
+    collection = getattr(vstore, "_collection", None)
+    database = getattr(collection, "database", None)
+    for client in (
+        vstore,
+        getattr(vstore, "client", None),
+        getattr(database, "client", None),
+    ):
+        close = getattr(client, "close", None)
+        if callable(close):
+            close()
+
+
+_encoders: ResourcePool[tuple[str, str, str], Embeddings] = ResourcePool(
+    "encoders", max_size=ENCODER_POOL_SIZE
+)
+_vectorstores: ResourcePool[tuple[str, ...], VectorStore] = ResourcePool(
+    "vectorstores", max_size=VECTORSTORE_POOL_SIZE, close=_close_vectorstore
+)
+_lexical_indexes: ResourcePool[str, LexicalIndex] = ResourcePool(
+    "lexical_indexes", max_size=LEXICAL_INDEX_POOL_SIZE, close=LexicalIndex.close
+)
+
+
+def pool_stats() -> dict[str, PoolStats]:
+    """Return hit/miss counters of the encoder, vector store and lexical index pools."""
+    return {
+        pool.name: pool.stats() for pool in (_encoders, _vectorstores, _lexical_indexes)
+    }
+
+
+@atexit.register
+def close_pools() -> None:
+    """Close every pooled vector store and drop every pooled encoder.
+
+    This is registered to run at interpreter exit, and can be called explicitly
+    on shutdown or to force new clients to be built.
+    """
+    _vectorstores.close()
+    _lexical_indexes.close()
+    _encoders.close()
+
+
+def get_text_encoder(model: str) -> Embeddings:
+    """Return a pooled text encoder for the fully specified model name.
+
+    When ``EMBEDDING_CACHE_PATH`` is set, the encoder is wrapped in a persistent
+    embedding cache so that repeated queries and chunks are not re-embedded.
+    """
+    provider = model.split("/", maxsplit=1)[0]
+    env_vars = _ENCODER_CREDENTIALS.get(provider, ())
+    cache = get_embedding_cache()
+    key = (
+        model,
+        fingerprint(*(os.environ.get(v) for v in env_vars)),
+        cache.path if cache else "",
+    )
+
+    def build() -> Embeddings:
+        encoder = make_text_encoder(model)
+        return CachedEmbeddings(encoder, model, cache) if cache else encoder
+
+    return _encoders.get(key, build)
+
+
 ## Encoder constructors
 
 
@@ -39,13 +191,13 @@ def make_text_encoder(model: str) -> Embeddings:
 
             return CohereEmbeddings(model=model)  # type: ignore
         case "nomic":
-            from langchain_nomic import NomicEmbeddings
+            from retrieval_agents.utils.local_embeddings import get_local_embedder
 
-            return NomicEmbeddings(model=model, inference_mode="local")
+            return get_local_embedder(model)
         case "voyageai":
             from langchain_voyageai import VoyageAIEmbeddings
 
-            return VoyageAIEmbeddings(model=model)  # type: ignore[call-arg]
+            return VoyageAIEmbeddings(model=model)
         case _:
             raise ValueError(f"Unsupported embedding provider: {provider}")
 
@@ -56,7 +208,7 @@ def make_text_encoder(model: str) -> Embeddings:
 @contextmanager
 def make_elastic_retriever(
     configuration: IndexerConfiguration, embedding_model: Embeddings
-) -> Generator[VectorStoreRetriever, None, None]:
+) -> Generator[ScoredRetriever, None, None]:
     """Configure this agent to connect to a specific elastic index."""
     from langchain_elasticsearch import ElasticsearchStore
 
@@ -70,24 +222,35 @@ def make_elastic_retriever(
     else:
         connection_options = {"es_api_key": os.environ["ELASTICSEARCH_API_KEY"]}
 
-    vstore = ElasticsearchStore(
-        **connection_options,  # type: ignore
-        es_url=os.environ["ELASTICSEARCH_URL"],
-        index_name=configuration.embedding_model.lower().replace("/", "_"),
-        embedding=embedding_model,
+    es_url = os.environ["ELASTICSEARCH_URL"]
+    index_name = configuration.embedding_model.lower().replace("/", "_")
+    key = (
+        configuration.retriever_provider,
+        configuration.embedding_model,
+        index_name,
+        fingerprint(es_url, *connection_options.values()),
     )
 
-    search_kwargs = configuration.search_kwargs
+    def build() -> VectorStore:
+        return ElasticsearchStore(
+            **connection_options,
+            es_url=es_url,
+            index_name=index_name,
+            embedding=embedding_model,
+        )
+
+    with _vectorstores.lease(key, build) as vstore:
+        search_kwargs = configuration.search_kwargs
 
-    search_filter = search_kwargs.setdefault("filter", [])
-    search_filter.append({"term": {"metadata.user_id": configuration.user_id}})
-    yield vstore.as_retriever(search_kwargs=search_kwargs)
+        search_filter = search_kwargs.setdefault("filter", [])
+        search_filter.append({"term": {"metadata.user_id": configuration.user_id}})
+        yield _scored_retriever(configuration, vstore, search_kwargs)
 
 
 @contextmanager
 def make_pinecone_retriever(
     configuration: IndexerConfiguration, embedding_model: Embeddings
-) -> Generator[VectorStoreRetriever, None, None]:
+) -> Generator[ScoredRetriever, None, None]:
     """Configure this agent to connect to a specific pinecone index."""
     from langchain_pinecone import PineconeVectorStore
 
@@ -95,49 +258,203 @@ def make_pinecone_retriever(
 
     search_filter = search_kwargs.setdefault("filter", {})
     search_filter.update({"user_id": configuration.user_id})
-    vstore = PineconeVectorStore.from_existing_index(
-        index_name=configuration.embedding_model.lower()
-        .replace(".", "-")
-        .replace("/", "-"),
-        embedding=embedding_model,
+    index_name = (
+        configuration.embedding_model.lower().replace(".", "-").replace("/", "-")
     )
-    yield vstore.as_retriever(search_kwargs=search_kwargs)
+    key = (
+        "pinecone",
+        configuration.embedding_model,
+        index_name,
+        fingerprint(os.environ.get("PINECONE_API_KEY")),
+    )
+
+    def build() -> VectorStore:
+        return PineconeVectorStore.from_existing_index(
+            index_name=index_name,
+            embedding=embedding_model,
+        )
+
+    with _vectorstores.lease(key, build) as vstore:
+        yield _scored_retriever(configuration, vstore, search_kwargs)
 
 
 @contextmanager
 def make_mongodb_retriever(
     configuration: IndexerConfiguration, embedding_model: Embeddings
-) -> Generator[VectorStoreRetriever, None, None]:
+) -> Generator[ScoredRetriever, None, None]:
     """Configure this agent to connect to a specific MongoDB Atlas index & namespaces."""
     from langchain_mongodb.vectorstores import MongoDBAtlasVectorSearch
 
-    vstore = MongoDBAtlasVectorSearch.from_connection_string(
-        os.environ["MONGODB_URI"],
-        namespace=configuration.embedding_model.lower().replace("/", "_"),
-        embedding=embedding_model,
+    connection_string = os.environ["MONGODB_URI"]
+    namespace = configuration.embedding_model.lower().replace("/", "_")
+    key = (
+        "mongodb",
+        configuration.embedding_model,
+        namespace,
+        fingerprint(connection_string),
     )
-    search_kwargs = configuration.search_kwargs
-    pre_filter = search_kwargs.setdefault("pre_filter", {})
-    pre_filter["user_id"] = {"$eq": configuration.user_id}
-    yield vstore.as_retriever(search_kwargs=search_kwargs)
+
+    def build() -> VectorStore:
+        return MongoDBAtlasVectorSearch.from_connection_string(
+            connection_string,
+            namespace=namespace,
+            embedding=embedding_model,
+        )
+
+    with _vectorstores.lease(key, build) as vstore:
+        search_kwargs = configuration.search_kwargs
+        pre_filter = search_kwargs.setdefault("pre_filter", {})
+        pre_filter["user_id"] = {"$eq": configuration.user_id}
+        yield _scored_retriever(configuration, vstore, search_kwargs)
 
 
 @contextmanager
 def make_chroma_retriever(
     configuration: IndexerConfiguration, embedding_model: Embeddings
-) -> Generator[VectorStoreRetriever, None, None]:
+) -> Generator[ScoredRetriever, None, None]:
     """Configure this agent to connect to a specific Chroma index."""
     from langchain_chroma import Chroma
 
-    vstore = Chroma(
-        collection_name=configuration.embedding_model.lower().replace("/", "_"),
-        embedding_function=embedding_model,
-        persist_directory=os.environ["CHROMA_DIR"],
+    persist_directory = os.environ["CHROMA_DIR"]
+    collection_name = configuration.embedding_model.lower().replace("/", "_")
+    key = ("chroma", configuration.embedding_model, collection_name, persist_directory)
+
+    def build() -> VectorStore:
+        return Chroma(
+            collection_name=collection_name,
+            embedding_function=embedding_model,
+            persist_directory=persist_directory,
+        )
+
+    with _vectorstores.lease(key, build) as vstore:
+        search_kwargs = configuration.search_kwargs
+        where = search_kwargs.setdefault("filter", {})
+        where["user_id"] = configuration.user_id
+        yield _scored_retriever(configuration, vstore, search_kwargs)
+
+
+@contextmanager
+def make_local_retriever(
+    configuration: IndexerConfiguration, embedding_model: Embeddings
+) -> Generator[ScoredRetriever, None, None]:
+    """Configure this agent to use an embedded store of memory-mapped files."""
+    from retrieval_agents.utils.local_vectorstore import LocalVectorStore
+
+    directory = os.path.join(
+        os.environ["LOCAL_VECTORSTORE_DIR"],
+        configuration.embedding_model.lower().replace("/", "_"),
     )
-    search_kwargs = configuration.search_kwargs
-    where = search_kwargs.setdefault("filter", {})
-    where["user_id"] = configuration.user_id
-    yield vstore.as_retriever(search_kwargs=search_kwargs)
+    dtype = os.environ.get("LOCAL_VECTORSTORE_DTYPE", "float32")
+    index = os.environ.get("LOCAL_VECTORSTORE_INDEX", "flat")
+    key = ("local", configuration.embedding_model, directory, dtype, index)
+
+    def build() -> VectorStore:
+        return LocalVectorStore(directory, embedding_model, dtype=dtype, index=index)  # type: ignore[arg-type]
+
+    with _vectorstores.lease(key, build) as vstore:
+        search_kwargs = configuration.search_kwargs
+        where = search_kwargs.setdefault("filter", {})
+        where["user_id"] = configuration.user_id
+        yield _scored_retriever(configuration, vstore, search_kwargs)
+
+
+def _scored_retriever(
+    configuration: IndexerConfiguration,
+    vstore: VectorStore,
+    search_kwargs: dict[str, Any],
+) -> ScoredRetriever:
+    """Return the retriever of a store that scores and selects its candidates."""
+    return ScoredRetriever(
+        vectorstore=vstore,
+        search_kwargs=search_kwargs,
+        vector_search=_vector_search(vstore),
+        fetch_k=configuration.fetch_k,
+        score_threshold=configuration.score_threshold,
+        score_margin=configuration.score_margin,
+        mmr_lambda=configuration.mmr_lambda,
+    )
+
+
+@contextmanager
+def make_hybrid_retriever(
+    configuration: IndexerConfiguration, retriever: ScoredRetriever
+) -> Generator[HybridRetriever, None, None]:
+    """Fuse the vector search of a retriever with a BM25 search of the same chunks.
+
+    Elasticsearch runs the BM25 search on the index of the store, with the same
+    filters. The other providers search a pooled ``LexicalIndex`` stored in
+    ``LEXICAL_INDEX_DIR``, restricted to the chunks of the user.
+    """
+    vstore = retriever.vectorstore
+
+    def hybrid(
+        lexical_search: Callable[[str, int], list[Document]],
+        lexical_index: Optional[LexicalIndex] = None,
+    ) -> HybridRetriever:
+        return HybridRetriever(
+            vectorstore=vstore,
+            search_kwargs=retriever.search_kwargs,
+            vector_search=retriever.vector_search,
+            fetch_k=retriever.fetch_k,
+            score_threshold=retriever.score_threshold,
+            score_margin=retriever.score_margin,
+            mmr_lambda=retriever.mmr_lambda,
+            rrf_k=configuration.rrf_k,
+            vector_weight=configuration.vector_weight,
+            lexical_weight=configuration.lexical_weight,
+            lexical_search=lexical_search,
+            lexical_index=lexical_index,
+        )
+
+    if type(vstore).__name__ == "ElasticsearchStore":
+        yield hybrid(
+            _elasticsearch_lexical_search(vstore, retriever.search_kwargs["filter"])
+        )
+        return
+    path = os.path.join(
+        os.environ.get("LEXICAL_INDEX_DIR", "./.data/lexical"),
+        "{}_{}.sqlite3".format(
+            configuration.retriever_provider,
+            configuration.embedding_model.lower().replace("/", "_"),
+        ),
+    )
+    user_id = configuration.user_id
+
+    with _lexical_indexes.lease(path, lambda: LexicalIndex(path)) as index:
+
+        def lexical_search(query: str, k: int) -> list[Document]:
+            return [doc for doc, _ in index.search(query, k, user_id=user_id)]
+
+        yield hybrid(lexical_search, index)
+
+
+def _elasticsearch_lexical_search(
+    vstore: Any, filters: list[dict[str, Any]]
+) -> Callable[[str, int], list[Document]]:
+    """Return a BM25 search of the text field of the index of the store."""
+    text_field = getattr(vstore, "query_field", "text")
+
+    def search(query: str, k: int) -> list[Document]:
+        response = vstore.client.search(
+            index=vstore.index_name,
+            query={"bool": {"must": {"match": {text_field: query}}, "filter": filters}},
+            size=k,
+        )
+        return [
+            Document(
+                id=hit["_id"],
+                page_content=hit["_source"][text_field],
+                metadata=hit["_source"].get("metadata", {}),
+            )
+            for hit in response["hits"]["hits"]
+        ]
+
+    return search
+
+
+def lexical_index_of(retriever: BaseRetriever) -> Optional[LexicalIndex]:
+    """Return the in-process lexical index a retriever searches, if any."""
+    return retriever.lexical_index if isinstance(retriever, HybridRetriever) else None
 
 
 @contextmanager
@@ -148,10 +465,23 @@ def make_retriever(
     from retrieval_agents.modules import IndexerConfiguration
 
     configuration = IndexerConfiguration.from_runnable_config(config)
-    embedding_model = make_text_encoder(configuration.embedding_model)
+    embedding_model = get_text_encoder(configuration.embedding_model)
     user_id = configuration.user_id
     if not user_id:
         raise ValueError("Please provide a valid user_id in the configuration.")
+    with make_vector_retriever(configuration, embedding_model) as retriever:
+        if configuration.retrieval_mode == "hybrid":
+            with make_hybrid_retriever(configuration, retriever) as hybrid:
+                yield hybrid
+        else:
+            yield retriever
+
+
+@contextmanager
+def make_vector_retriever(
+    configuration: IndexerConfiguration, embedding_model: Embeddings
+) -> Generator[ScoredRetriever, None, None]:
+    """Create the vector search retriever of the configured provider."""
     match configuration.retriever_provider:
         case "elastic" | "elastic-local":
             with make_elastic_retriever(configuration, embedding_model) as retriever:
@@ -167,9 +497,616 @@ def make_retriever(
         case "chroma":
             with make_chroma_retriever(configuration, embedding_model) as retriever:
                 yield retriever
+        case "local":
+            with make_local_retriever(configuration, embedding_model) as retriever:
+                yield retriever
         case _:
             raise ValueError(
                 "Unrecognized retriever_provider in configuration. "
                 f"Expected one of: {', '.join(SimpleRagConfiguration.__annotations__['retriever_provider'].__args__)}\n"
                 f"Got: {configuration.retriever_provider}"
             )
+
+
+@asynccontextmanager
+async def amake_retriever(
+    config: RunnableConfig,
+) -> AsyncGenerator[VectorStoreRetriever, None]:
+    """Asynchronously create a retriever, based on the current configuration.
+
+    Entering and leaving ``make_retriever`` may construct encoders and vector
+    store clients (opening files, sockets and connection pools), so both run on
+    the blocking I/O executor.
+    """
+    manager = make_retriever(config)
+    retriever = await run_blocking(manager.__enter__)
+    try:
+        yield retriever
+    except BaseException:
+        if not await run_blocking(manager.__exit__, *sys.exc_info()):
+            raise
+    else:
+        await run_blocking(manager.__exit__, None, None, None)
+
+
+async def aretrieve(query: str, config: RunnableConfig) -> list[Document]:
+    """Retrieve the documents of a query, reranked if the configuration says so.
+
+    With a reranker, ``rerank_fetch_k`` documents are retrieved and the best
+    ``rerank_top_m`` of them kept (see ``rerank``).
+    """
+    from retrieval_agents.modules import IndexerConfiguration
+
+    configuration = IndexerConfiguration.from_runnable_config(config)
+    async with amake_retriever(config) as retriever:
+        if configuration.rerank == "none":
+            return await retriever.ainvoke(query, config)
+        candidates = await retriever.ainvoke(
+            query, config, k=configuration.rerank_fetch_k
+        )
+    return await arerank(
+        query,
+        candidates,
+        configuration.rerank,
+        configuration.rerank_top_m,
+        configuration.rerank_model,
+    )
+
+
+## Vector searches
+
+
+def _search_elasticsearch(
+    vstore: Any, embedding: list[float], k: int, search_kwargs: dict[str, Any]
+) -> Candidates:
+    vector_field = getattr(vstore, "vector_query_field", "vector")
+    response = vstore.client.search(
+        index=vstore.index_name,
+        knn={
+            "field": vector_field,
+            "query_vector": embedding,
+            "k": k,
+            "num_candidates": search_kwargs.get("num_candidates", 10 * k),
+            "filter": search_kwargs.get("filter", []),
+        },
+        size=k,
+    )
+    return [
+        (
+            Document(
+                id=hit["_id"],
+                page_content=hit["_source"][getattr(vstore, "query_field", "text")],
+                metadata=hit["_source"].get("metadata", {}),
+            ),
+            hit["_source"][vector_field],
+        )
+        for hit in response["hits"]["hits"]
+    ]
+
+
+def _search_pinecone(
+    vstore: Any, embedding: list[float], k: int, search_kwargs: dict[str, Any]
+) -> Candidates:
+    response = vstore._index.query(
+        vector=embedding,
+        top_k=k,
+        filter=search_kwargs.get("filter"),
+        namespace=search_kwargs.get("namespace", vstore._namespace),
+        include_values=True,
+        include_metadata=True,
+    )
+    candidates: Candidates = []
+    for match in response["matches"]:
+        metadata = dict(match["metadata"])
+        text = metadata.pop(vstore._text_key, "")
+        candidates.append(
+            (
+                Document(id=match["id"], page_content=text, metadata=metadata),
+                match["values"],
+            )
+        )
+    return candidates
+
+
+def _search_mongodb(
+    vstore: Any, embedding: list[float], k: int, search_kwargs: dict[str, Any]
+) -> Candidates:
+    query: dict[str, Any] = {
+        "index": vstore._index_name,
+        "path": vstore._embedding_key,
+        "queryVector": embedding,
+        "numCandidates": search_kwargs.get("num_candidates", 10 * k),
+        "limit": k,
+    }
+    if search_kwargs.get("pre_filter"):
+        query["filter"] = search_kwargs["pre_filter"]
+    candidates: Candidates = []
+    for record in vstore._collection.aggregate([{"$vectorSearch": query}]):
+        vector = record.pop(vstore._embedding_key)
+        text = record.pop(vstore._text_key, "")
+        id_ = str(record.pop("_id"))
+        candidates.append(
+            (Document(id=id_, page_content=text, metadata=record), vector)
+        )
+    return candidates
+
+
+def _search_chroma(
+    vstore: Any, embedding: list[float], k: int, search_kwargs: dict[str, Any]
+) -> Candidates:
+    result = vstore._collection.query(
+        query_embeddings=[embedding],
+        n_results=k,
+        where=search_kwargs.get("filter") or None,
+        include=["documents", "metadatas", "embeddings"],
+    )
+    return [
+        (Document(id=id_, page_content=text or "", metadata=metadata or {}), vector)
+        for id_, text, metadata, vector in zip(
+            result["ids"][0],
+            result["documents"][0],
+            result["metadatas"][0],
+            result["embeddings"][0],
+        )
+    ]
+
+
+def _search_local(
+    vstore: Any, embedding: list[float], k: int, search_kwargs: dict[str, Any]
+) -> Candidates:
+    return cast(
+        Candidates,
+        vstore.similarity_search_with_vectors(embedding, k, **search_kwargs),
+    )
+
+
+# Searches returning the vectors of the candidates, keyed by vector store class
+# name like the bulk writers.
+_VECTOR_SEARCHES: dict[
+    str, Callable[[Any, list[float], int, dict[str, Any]], Candidates]
+] = {
+    "ElasticsearchStore": _search_elasticsearch,
+    "PineconeVectorStore": _search_pinecone,
+    "MongoDBAtlasVectorSearch": _search_mongodb,
+    "Chroma": _search_chroma,
+    "LocalVectorStore": _search_local,
+}
+
+
+def _vector_search(vstore: VectorStore) -> VectorSearch:
+    """Return the search of a store that returns the vectors of the candidates.
+
+    Other stores are searched by vector without vectors, so their documents
+    cannot be scored in-process.
+    """
+    search = _VECTOR_SEARCHES.get(type(vstore).__name__)
+    if search is None:
+        return lambda embedding, k, search_kwargs: [
+            (doc, None)
+            for doc in vstore.similarity_search_by_vector(embedding, k, **search_kwargs)
+        ]
+    return functools.partial(search, vstore)
+
+
+## Upserts
+
+_CHUNK_NAMESPACE = uuid.UUID("5d0f3b1e-8a4c-4f7e-9b2d-6c1a7e3f9d40")
+
+
+@dataclass
+class UpsertReport:
+    """Dedupe and throughput report of an upsert."""
+
+    submitted: int = 0
+    duplicates: int = 0
+    """Chunks submitted more than once in the same upsert."""
+    unchanged: int = 0
+    """Chunks skipped because they were already indexed."""
+    upserted: int = 0
+    failed: int = 0
+    """Chunks that could not be embedded or written after every retry."""
+    retries: int = 0
+    """Embedding requests and bulk writes that were retried."""
+    seconds: float = 0.0
+    """Time spent embedding and writing."""
+
+    @property
+    def docs_per_second(self) -> float:
+        """Throughput of the upsert in chunks written per second."""
+        return self.upserted / self.seconds if self.seconds else 0.0
+
+    def merge(self, other: UpsertReport) -> None:
+        """Add the counters of another report to this one."""
+        self.submitted += other.submitted
+        self.duplicates += other.duplicates
+        self.unchanged += other.unchanged
+        self.upserted += other.upserted
+        self.failed += other.failed
+        self.retries += other.retries
+        self.seconds += other.seconds
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the counters as a dictionary."""
+        return {**asdict(self), "docs_per_second": self.docs_per_second}
+
+
+class IngestError(Exception):
+    """Raised when chunks could not be embedded or written after every retry.
+
+    The other chunks of the upsert were written; upserting the same chunks
+    again only writes the ones that are missing.
+    """
+
+    def __init__(self, failed_ids: Sequence[str], report: UpsertReport) -> None:
+        """Initialize the error with the IDs of the failed chunks."""
+        self.failed_ids = list(failed_ids)
+        self.report = report
+        super().__init__(f"Failed to upsert {len(self.failed_ids)} chunk(s)")
+
+
+def chunk_id(user_id: str, source: str, position: int, content: str) -> str:
+    """Return the deterministic ID of a chunk.
+
+    The ID is a UUID derived from the owner, the source document, the position
+    of the chunk in the source and a hash of its content, which every supported
+    vector store accepts as a document ID.
+
+    Examples:
+        >>> chunk_id("user", "https://example.com", 0, "text")
+        '520db19c-8de3-50b5-927f-8aaf867e0467'
+        >>> chunk_id("user", "a", 0, "x") == chunk_id("user", "a", 0, "x")
+        True
+        >>> chunk_id("user", "a", 0, "x") == chunk_id("user", "a", 1, "x")
+        False
+    """
+    digest = hashlib.sha256(content.encode()).hexdigest()
+    return str(
+        uuid.uuid5(_CHUNK_NAMESPACE, f"{user_id}\0{source}\0{position}\0{digest}")
+    )
+
+
+def with_chunk_ids(docs: Sequence[Document], user_id: str) -> list[Document]:
+    """Return copies of the chunks with their deterministic IDs set.
+
+    The position of a chunk is its rank among the given chunks of the same
+    ``source``, so all the chunks of a source must be passed together and in
+    order. The ID of a chunk without a source only depends on its owner and
+    content, since its rank would depend on the rest of the submission.
+    """
+    positions: Counter[str] = Counter()
+    stamped = []
+    for doc in docs:
+        source = str(doc.metadata.get("source") or "")
+        position = positions[source] if source else 0
+        stamped.append(
+            doc.model_copy(
+                update={"id": chunk_id(user_id, source, position, doc.page_content)}
+            )
+        )
+        positions[source] += 1
+    return stamped
+
+
+@dataclass(frozen=True)
+class BulkOptions:
+    """Batching and retry settings of bulk ingestion."""
+
+    embedding_batch_size: int = 64
+    embedding_concurrency: int = 4
+    write_batch_size: int = 200
+    max_retries: int = 3
+    backoff: float = 0.5
+    """Base delay of the exponential backoff between retries, in seconds."""
+    refresh: bool = True
+    """Refresh the index once at the end of the upsert (Elasticsearch)."""
+
+    @classmethod
+    def from_configuration(cls, configuration: IndexerConfiguration) -> BulkOptions:
+        """Return the bulk options of an indexer configuration."""
+        return cls(
+            embedding_batch_size=configuration.embedding_batch_size,
+            embedding_concurrency=configuration.embedding_concurrency,
+            write_batch_size=configuration.write_batch_size,
+            max_retries=configuration.write_max_retries,
+            refresh=configuration.refresh_after_write,
+        )
+
+
+async def aupsert_documents(
+    vectorstore: VectorStore,
+    docs: Sequence[Document],
+    known_ids: Collection[str] = (),
+    options: BulkOptions = BulkOptions(),
+    lexical_index: Optional[LexicalIndex] = None,
+) -> UpsertReport:
+    """Upsert chunks by ID, skipping the ones that are already indexed.
+
+    Chunks must have their ``id`` set (see ``with_chunk_ids``). Writing by ID
+    makes every supported store overwrite instead of duplicate: Elasticsearch
+    indexes by ``_id``, Pinecone and Chroma upsert, MongoDB replaces by
+    ``_id`` and the local store tombstones the previous row. Chunks whose ID is
+    in ``known_ids`` or is found in the store are not embedded again.
+
+    Args:
+        vectorstore (VectorStore): Store to write to.
+        docs (Sequence[Document]): Chunks with IDs.
+        known_ids (Collection[str]): IDs known to be indexed already.
+        options (BulkOptions): Batching and retry settings.
+        lexical_index (Optional[LexicalIndex]): Lexical index to write every
+            chunk that is in the store to as well, unchanged ones included.
+
+    Returns:
+        UpsertReport: How many chunks were duplicates, unchanged and upserted,
+            and how fast.
+
+    Raises:
+        IngestError: If some chunks could not be upserted after every retry.
+    """
+    unique: dict[str, Document] = {}
+    for doc in docs:
+        if doc.id is None:
+            raise ValueError("Every chunk must have an ID to be upserted.")
+        unique[doc.id] = doc
+    report = UpsertReport(submitted=len(docs), duplicates=len(docs) - len(unique))
+    candidates = [i for i in unique if i not in known_ids]
+    report.unchanged = len(unique) - len(candidates)
+    if candidates:
+        try:
+            found = {d.id for d in await vectorstore.aget_by_ids(candidates)}
+        except NotImplementedError:
+            found = set()
+        report.unchanged += len(found)
+        candidates = [i for i in candidates if i not in found]
+    failed: list[str] = []
+    if candidates:
+        started_at = time.monotonic()
+        failed = await _abulk_write(
+            vectorstore, [unique[i] for i in candidates], options, report
+        )
+        report.seconds = time.monotonic() - started_at
+        report.upserted = len(candidates) - len(failed)
+        report.failed = len(failed)
+        logger.info(
+            f"Upserted {report.upserted} chunk(s) in {report.seconds:.2f}s "
+            f"({report.docs_per_second:.1f} docs/s)"
+        )
+    if lexical_index is not None:
+        lost = set(failed)
+        await run_blocking(
+            lexical_index.upsert, [d for i, d in unique.items() if i not in lost]
+        )
+    if failed:
+        raise IngestError(failed, report)
+    return report
+
+
+async def adelete_documents(
+    vectorstore: VectorStore,
+    ids: Sequence[str],
+    lexical_index: Optional[LexicalIndex] = None,
+) -> None:
+    """Delete chunks by ID from a store and, if given, from a lexical index."""
+    await vectorstore.adelete(ids=list(ids))
+    if lexical_index is not None:
+        await run_blocking(lexical_index.delete, ids)
+
+
+## Bulk ingestion
+
+_Embedded = tuple[Document, list[float]]
+"""A chunk and its embedding."""
+
+_BulkWrite = Callable[[Any, list[_Embedded], BulkOptions], list[str]]
+"""Write embedded chunks to a store and return the IDs of those that failed."""
+
+
+def _write_elasticsearch(
+    vstore: Any, batch: list[_Embedded], options: BulkOptions
+) -> list[str]:
+    from elasticsearch.helpers import BulkIndexError
+
+    try:
+        vstore.add_embeddings(
+            [(doc.page_content, vector) for doc, vector in batch],
+            metadatas=[doc.metadata for doc, _ in batch],
+            ids=[doc.id for doc, _ in batch],
+            refresh_indices=False,
+            bulk_kwargs={"chunk_size": options.write_batch_size},
+        )
+    except BulkIndexError as e:
+        # Every error is keyed by its operation type: {"index": {"_id": ...}}.
+        return [item["_id"] for error in e.errors for item in error.values()]
+    return []
+
+
+def _refresh_elasticsearch(vstore: Any) -> None:
+    vstore.client.indices.refresh(index=vstore.index_name)
+
+
+def _write_pinecone(
+    vstore: Any, batch: list[_Embedded], options: BulkOptions
+) -> list[str]:
+    vstore._index.upsert(
+        vectors=[
+            {
+                "id": doc.id,
+                "values": vector,
+                "metadata": {**doc.metadata, vstore._text_key: doc.page_content},
+            }
+            for doc, vector in batch
+        ],
+        namespace=vstore._namespace,
+        batch_size=options.write_batch_size,
+    )
+    return []
+
+
+def _write_mongodb(
+    vstore: Any, batch: list[_Embedded], options: BulkOptions
+) -> list[str]:
+    from pymongo import ReplaceOne
+    from pymongo.errors import BulkWriteError
+
+    requests = [
+        ReplaceOne(
+            {"_id": doc.id},
+            {
+                **doc.metadata,
+                vstore._text_key: doc.page_content,
+                vstore._embedding_key: vector,
+            },
+            upsert=True,
+        )
+        for doc, vector in batch
+    ]
+    try:
+        vstore._collection.bulk_write(requests, ordered=False)
+    except BulkWriteError as e:
+        return [
+            cast(str, batch[error["index"]][0].id)
+            for error in e.details.get("writeErrors", [])
+        ]
+    return []
+
+
+def _write_local(
+    vstore: Any, batch: list[_Embedded], options: BulkOptions
+) -> list[str]:
+    vstore.add_vectors(
+        [doc.id for doc, _ in batch],
+        [vector for _, vector in batch],
+        [doc.page_content for doc, _ in batch],
+        [doc.metadata for doc, _ in batch],
+    )
+    return []
+
+
+def _write_chroma(
+    vstore: Any, batch: list[_Embedded], options: BulkOptions
+) -> list[str]:
+    vstore._collection.upsert(
+        ids=[doc.id for doc, _ in batch],
+        embeddings=[vector for _, vector in batch],
+        metadatas=[doc.metadata for doc, _ in batch],
+        documents=[doc.page_content for doc, _ in batch],
+    )
+    return []
+
+
+# Native bulk writers and end-of-upsert hooks, keyed by vector store class name so
+# that the optional store packages are only imported when they are used.
+_BULK_WRITERS: dict[str, tuple[_BulkWrite, Optional[Callable[[Any], None]]]] = {
+    "ElasticsearchStore": (_write_elasticsearch, _refresh_elasticsearch),
+    "PineconeVectorStore": (_write_pinecone, None),
+    "MongoDBAtlasVectorSearch": (_write_mongodb, None),
+    "Chroma": (_write_chroma, None),
+    "LocalVectorStore": (_write_local, None),
+}
+
+
+async def _abulk_write(
+    vectorstore: VectorStore,
+    docs: list[Document],
+    options: BulkOptions,
+    report: UpsertReport,
+) -> list[str]:
+    """Embed and write chunks in batches, returning the IDs that failed.
+
+    Embedding batches run concurrently and feed bulk writes through a bounded
+    channel. A failed embedding request is retried for its batch only, and a
+    failed write is retried for its failed chunks only, with their embeddings.
+    Stores without a native bulk writer fall back to ``aadd_documents``.
+    """
+    failed: list[str] = []
+
+    async def pause(attempt: int) -> None:
+        report.retries += 1
+        await asyncio.sleep(
+            options.backoff * 2 ** (attempt - 1) * (1 + random.random())
+        )
+
+    async def with_retries(
+        ids: list[str], attempt: Callable[[], Any]
+    ) -> tuple[list[str], Any]:
+        """Call ``attempt`` until it succeeds; return the IDs that still fail."""
+        for n in range(options.max_retries + 1):
+            if n:
+                await pause(n)
+            try:
+                return [], await attempt()
+            except Exception as e:
+                logger.warning(f"Attempt {n + 1} for {len(ids)} chunk(s) failed: {e!r}")
+        return ids, None
+
+    writer, finish = _BULK_WRITERS.get(type(vectorstore).__name__, (None, None))
+    embeddings = vectorstore.embeddings
+    if writer is None or embeddings is None:
+
+        async def add_batch(batch: list[Document]) -> list[Document]:
+            ids = [cast(str, doc.id) for doc in batch]
+            lost, _ = await with_retries(
+                ids, lambda: vectorstore.aadd_documents(batch, ids=ids)
+            )
+            failed.extend(lost)
+            return batch
+
+        await run_stage(
+            StageStats("write"),
+            _aiter_batches(docs, options.write_batch_size),
+            add_batch,
+            concurrency=options.embedding_concurrency,
+        )
+        return failed
+
+    embedded: Channel[_Embedded] = Channel(2 * options.write_batch_size)
+
+    async def embed_batch(batch: list[Document]) -> list[_Embedded]:
+        ids = [cast(str, doc.id) for doc in batch]
+        lost, vectors = await with_retries(
+            ids,
+            lambda: embeddings.aembed_documents([doc.page_content for doc in batch]),
+        )
+        failed.extend(lost)
+        return list(zip(batch, vectors)) if vectors is not None else []
+
+    async def write_batch(batch: list[_Embedded]) -> list[_Embedded]:
+        pending = batch
+        for n in range(options.max_retries + 1):
+            if n:
+                await pause(n)
+            try:
+                lost = set(await run_blocking(writer, vectorstore, pending, options))
+            except Exception as e:
+                logger.warning(f"Bulk write of {len(pending)} chunk(s) failed: {e!r}")
+                continue
+            pending = [item for item in pending if item[0].id in lost]
+            if not pending:
+                return batch
+            logger.warning(f"{len(pending)} chunk(s) of a bulk write failed")
+        failed.extend(cast(str, doc.id) for doc, _ in pending)
+        return batch
+
+    await run_pipeline(
+        run_stage(
+            StageStats("embed"),
+            _aiter_batches(docs, options.embedding_batch_size),
+            embed_batch,
+            embedded,
+            concurrency=options.embedding_concurrency,
+        ),
+        run_stage(
+            StageStats("write"),
+            abatched(embedded, options.write_batch_size),
+            write_batch,
+        ),
+    )
+    if finish is not None and options.refresh and len(failed) < len(docs):
+        await run_blocking(finish, vectorstore)
+    return failed
+
+
+async def _aiter_batches(
+    docs: Sequence[Document], size: int
+) -> AsyncIterator[list[Document]]:
+    for start in range(0, len(docs), size):
+        yield list(docs[start : start + size])
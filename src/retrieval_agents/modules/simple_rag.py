@@ -7,20 +7,21 @@ relevant documents, and formulating responses.
 """
 
 from datetime import datetime, timezone
-from typing import Annotated, Sequence, cast
+from typing import Annotated, Any, Sequence, cast
 
 from langchain_core.documents import Document
 from langchain_core.messages import AnyMessage, BaseMessage
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables import Runnable, RunnableConfig
 from langgraph.graph import END, START, StateGraph, add_messages
 from pydantic import BaseModel, Field
 
 from retrieval_agents import prompts
-from retrieval_agents.configurations import IndexerConfiguration
+from retrieval_agents.configurations import ContextConfiguration, IndexerConfiguration
 from retrieval_agents.modules import retrieval
+from retrieval_agents.modules.context_packing import pack_context
 from retrieval_agents.modules.utils import (
-    format_docs,
+    aget_chain,
     get_message_text,
     load_chat_model,
 )
@@ -34,7 +35,7 @@ class SearchQuery(BaseModel):
 
 
 ### Configuration ###
-class SimpleRagConfiguration(IndexerConfiguration):
+class SimpleRagConfiguration(IndexerConfiguration, ContextConfiguration):
     """The configuration for the agent."""
 
     response_system_prompt: str = Field(
@@ -154,26 +155,37 @@ async def generate_query(
         return {"queries": [human_input]}
     else:
         configuration = SimpleRagConfiguration.from_runnable_config(config)
+
         # Feel free to customize the prompt, model, and other logic!
-        prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", configuration.query_system_prompt),
-                ("placeholder", "{messages}"),
-            ]
-        )
-        model = load_chat_model(configuration.query_model).with_structured_output(
-            SearchQuery
+        def build_query_generator() -> Runnable[Any, Any]:
+            prompt = ChatPromptTemplate.from_messages(
+                [
+                    ("system", configuration.query_system_prompt),
+                    ("placeholder", "{messages}"),
+                ]
+            )
+            llm = load_chat_model(configuration.query_model)
+            return prompt | llm.with_structured_output(SearchQuery)
+
+        query_generator = await aget_chain(
+            (
+                "generate_query",
+                configuration.query_model,
+                configuration.query_system_prompt,
+            ),
+            build_query_generator,
         )
-
-        message_value = await prompt.ainvoke(
-            {
-                "messages": state.messages,
-                "queries": "\n- ".join(state.queries),
-                "system_time": datetime.now(tz=timezone.utc).isoformat(),
-            },
-            config,
+        generated = cast(
+            SearchQuery,
+            await query_generator.ainvoke(
+                {
+                    "messages": state.messages,
+                    "queries": "\n- ".join(state.queries),
+                    "system_time": datetime.now(tz=timezone.utc).isoformat(),
+                },
+                config,
+            ),
         )
-        generated = cast(SearchQuery, await model.ainvoke(message_value, config))
         return {
             "queries": [generated.query],
         }
@@ -185,8 +197,9 @@ async def retrieve(
     """Retrieve documents based on the latest query in the state.
 
     This function takes the current state and configuration, uses the latest query
-    from the state to retrieve relevant documents using the retriever, and returns
-    the retrieved documents.
+    from the state to retrieve relevant documents using the retriever, reranks them
+    locally if the configuration enables a reranker, and returns the retrieved
+    documents.
 
     Args:
         state (State): The current state containing queries and the retriever.
@@ -196,9 +209,8 @@ async def retrieve(
         dict[str, list[Document]]: A dictionary with a single key "retrieved_docs"
         containing a list of retrieved Document objects.
     """
-    with retrieval.make_retriever(config) as retriever:
-        docs = await retriever.ainvoke(state.queries[-1], config)
-        return {"retrieved_docs": docs}
+    docs = await retrieval.aretrieve(state.queries[-1], config)
+    return {"retrieved_docs": docs}
 
 
 async def respond(
@@ -206,17 +218,28 @@ async def respond(
 ) -> dict[str, list[BaseMessage]]:
     """Call the LLM powering our "agent"."""
     configuration = SimpleRagConfiguration.from_runnable_config(config)
+
     # Feel free to customize the prompt, model, and other logic!
-    prompt = ChatPromptTemplate.from_messages(
-        [
-            ("system", configuration.response_system_prompt),
-            ("placeholder", "{messages}"),
-        ]
+    def build_responder() -> Runnable[Any, Any]:
+        prompt = ChatPromptTemplate.from_messages(
+            [
+                ("system", configuration.response_system_prompt),
+                ("placeholder", "{messages}"),
+            ]
+        )
+        return prompt | load_chat_model(configuration.response_model)
+
+    responder = await aget_chain(
+        ("respond", configuration.response_model, configuration.response_system_prompt),
+        build_responder,
     )
-    model = load_chat_model(configuration.response_model)
 
-    retrieved_docs = format_docs(state.retrieved_docs)
-    message_value = await prompt.ainvoke(
+    retrieved_docs = pack_context(
+        state.retrieved_docs,
+        configuration.context_budget(configuration.response_model),
+        "respond",
+    ).text
+    response = await responder.ainvoke(
         {
             "messages": state.messages,
             "retrieved_docs": retrieved_docs,
@@ -224,7 +247,6 @@ async def respond(
         },
         config,
     )
-    response = await model.ainvoke(message_value, config)
     # We return a list, because this will get added to the existing list
     return {"messages": [response]}
 
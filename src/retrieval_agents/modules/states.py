@@ -1,5 +1,7 @@
 """States."""
 
+from typing import Optional
+
 from pydantic import BaseModel, Field
 
 
@@ -7,3 +9,23 @@ class BasicRAGInputState(BaseModel):
     """Input state for the basic RAG agent."""
 
     question: str = Field(default="")
+
+
+class BudgetState(BaseModel):
+    """Budget spent by a request so far.
+
+    These fields are part of the input of sub-graphs so that the budget is carried
+    across graph boundaries.
+    """
+
+    started_at: Optional[float] = Field(default=None)
+    """Epoch time at which the request started."""
+
+    llm_calls: int = Field(default=0)
+    """Number of LLM calls made so far."""
+
+    elapsed_seconds: float = Field(default=0.0)
+    """Wall time spent so far, in seconds."""
+
+    best_generation: str = Field(default="")
+    """The best generation so far, returned if the budget is exhausted."""
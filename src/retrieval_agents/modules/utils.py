@@ -6,15 +6,30 @@ and other common operations in project.
 Functions:
     get_message_text: Extract text content from various message formats.
     format_docs: Convert documents to an xml-formatted string.
+    estimate_tokens: Approximate the number of tokens in a text.
+    load_chat_model: Return the shared chat model client for a model name.
+    aget_chain: Return a compiled prompt | model chain from the chain cache.
 """
 
-import uuid
-from typing import Any, Literal, Optional, Sequence, Union
+from typing import Any, Callable, Hashable, Literal, Optional, Sequence, Union
 
 from langchain.chat_models import init_chat_model
 from langchain_core.documents import Document
 from langchain_core.language_models import BaseChatModel
 from langchain_core.messages import AnyMessage
+from langchain_core.runnables import Runnable
+
+from retrieval_agents.utils.resource_pool import PoolStats, ResourcePool
+
+CHAT_MODEL_POOL_SIZE = 16
+CHAIN_CACHE_SIZE = 64
+
+_chat_models: ResourcePool[str, BaseChatModel] = ResourcePool(
+    "chat_models", max_size=CHAT_MODEL_POOL_SIZE
+)
+_chains: ResourcePool[Hashable, Runnable[Any, Any]] = ResourcePool(
+    "chains", max_size=CHAIN_CACHE_SIZE
+)
 
 
 def get_message_text(msg: AnyMessage) -> str:
@@ -98,27 +113,83 @@ def format_docs(docs: Optional[list[Document]]) -> str:
 </documents>"""
 
 
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens in a text without loading a tokenizer.
+
+    Uses the common approximation of four characters per token, which is close
+    enough for budgeting prompts across providers.
+
+    Args:
+        text (str): The text to measure.
+
+    Returns:
+        int: The estimated number of tokens.
+
+    Examples:
+        >>> estimate_tokens("Hello, world!")
+        4
+    """
+    return (len(text) + 3) // 4
+
+
 def load_chat_model(fully_specified_name: str) -> BaseChatModel:
     """Load a chat model from a fully specified name.
 
+    Clients are shared: every call with the same name returns the same
+    instance, so provider clients and their connection pools are built once.
+
     Args:
         fully_specified_name (str): String in the format 'provider/model'.
     """
+    return _chat_models.get(
+        fully_specified_name, lambda: _init_chat_model(fully_specified_name)
+    )
+
+
+def _init_chat_model(fully_specified_name: str) -> BaseChatModel:
     if "/" in fully_specified_name:
         provider, model = fully_specified_name.split("/", maxsplit=1)
     else:
         provider = ""
         model = fully_specified_name
     if provider == "ollama":
-        from ollama import pull
+        from retrieval_agents.utils.ollama_utils import get_ollama_manager
 
-        from retrieval_agents.utils.ollama_utils import run_ollama
-
-        run_ollama()
-        pull(model)
+        get_ollama_manager().ensure_model(model)
     return init_chat_model(model, model_provider=provider)
 
 
+async def aget_chain(
+    key: Hashable, build: Callable[[], Runnable[Any, Any]]
+) -> Runnable[Any, Any]:
+    """Return the compiled chain for ``key``, building it on first use.
+
+    Nodes rebuild the same prompt, model client and structured-output wrapper
+    on every invocation. Chains are instead cached in a bounded LRU keyed by
+    everything that affects them, and built on the blocking I/O executor since
+    building may create clients.
+
+    Args:
+        key (Hashable): Identity of the chain: a tuple of the chain name (the
+            node name, or the output schema name for structured-output chains),
+            the model name and the prompt texts, then any other option.
+        build (Callable[[], Runnable[Any, Any]]): Factory of the chain on a
+            cache miss.
+    """
+    return await _chains.aget(key, build)
+
+
+def chain_cache_stats() -> PoolStats:
+    """Return the counters of the chain cache; ``size`` is the number of live chains."""
+    return _chains.stats()
+
+
+def clear_chain_cache() -> None:
+    """Drop every cached chain and chat model client."""
+    _chains.close()
+    _chat_models.close()
+
+
 def reduce_docs(
     existing: Optional[Sequence[Document]],
     new: Union[
@@ -143,14 +214,12 @@ def reduce_docs(
     if new == "delete":
         return []
     if isinstance(new, str):
-        return [Document(page_content=new, metadata={"id": str(uuid.uuid4())})]
+        return [Document(page_content=new)]
     if isinstance(new, list):
         coerced = []
         for item in new:
             if isinstance(item, str):
-                coerced.append(
-                    Document(page_content=item, metadata={"id": str(uuid.uuid4())})
-                )
+                coerced.append(Document(page_content=item))
             elif isinstance(item, dict):
                 coerced.append(Document(**item))
             else:
@@ -1,21 +1,96 @@
 """This "graph" exposes an endpoint for a user to upload URLs to be indexed."""
 
+import asyncio
+import hashlib
 import logging
-from typing import Annotated, Optional, Sequence
+import os
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Annotated, Any, AsyncIterator, Literal, Optional, Sequence, cast
 
-from langchain_community.document_loaders import WebBaseLoader
 from langchain_core.documents import Document
 from langchain_core.runnables import RunnableConfig
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_core.vectorstores import VectorStoreRetriever
 from langgraph.graph import END, START, StateGraph
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
-from retrieval_agents.modules import IndexerConfiguration, retrieval
+from retrieval_agents.configurations import IndexerConfiguration
+from retrieval_agents.modules import retrieval
 from retrieval_agents.modules.utils import reduce_docs, reduce_strs
+from retrieval_agents.utils import text_splitting
+from retrieval_agents.utils.blocking import run_blocking
+from retrieval_agents.utils.crawl_state import CrawlState, PageRecord
+from retrieval_agents.utils.fetcher import FetchError, FetchResult, HttpFetcher
+from retrieval_agents.utils.pipeline import (
+    Channel,
+    PipelineSummary,
+    StageStats,
+    abatched,
+    run_pipeline,
+    run_stage,
+)
 
 logger = logging.getLogger("web_indexer")
 
 
+### Configuration ###
+class WebIndexerConfiguration(IndexerConfiguration):
+    """Configuration of the web indexer."""
+
+    streaming: bool = Field(
+        default=False,
+        description="Stream pages through fetch, split and index stages instead of loading the whole crawl before indexing.",
+    )
+
+    fetch_concurrency: int = Field(
+        default=8,
+        ge=1,
+        description="The maximum number of pages fetched concurrently.",
+    )
+
+    per_host_concurrency: int = Field(
+        default=4,
+        ge=1,
+        description="The maximum number of pages fetched concurrently from the same host.",
+    )
+
+    per_host_requests_per_second: Optional[float] = Field(
+        default=None,
+        gt=0,
+        description="The maximum request rate to the same host. Unlimited when unset.",
+    )
+
+    fetch_timeout: float = Field(
+        default=30.0,
+        gt=0,
+        description="The timeout, in seconds, of a single attempt to fetch a page.",
+    )
+
+    fetch_max_retries: int = Field(
+        default=3,
+        ge=0,
+        description="The number of retries of a page after connection errors, timeouts, 429 or 5xx responses.",
+    )
+
+    crawl_state_path: Optional[str] = Field(
+        default=None,
+        description="Path of the SQLite database recording the pages indexed for each user. When set, re-crawls skip unchanged pages and replace the chunks of changed ones.",
+    )
+
+    queue_size: int = Field(
+        default=16,
+        ge=1,
+        description="The capacity of the queues between the stages in streaming mode. A full queue pauses the stage feeding it.",
+    )
+
+    index_batch_size: int = Field(
+        default=64,
+        ge=1,
+        description="The number of chunks handed to the upsert together in streaming mode. They are embedded and written in batches of embedding_batch_size and write_batch_size.",
+    )
+
+
 ### States ###
 class UrlInputState(BaseModel):
     """Input state for web indexer."""
@@ -27,6 +102,8 @@ class WebIndexerState(UrlInputState):
     """The State of web indexer."""
 
     docs: Annotated[Sequence[Document], reduce_docs]
+    summary: Optional[dict[str, Any]] = None
+    """Counters of the streaming pipeline."""
 
 
 def ensure_docs_have_user_id(
@@ -55,17 +132,27 @@ async def load_web(
 ) -> dict[str, list[Document]]:
     """Load from the web sites.
 
+    A page that fails to download is logged and skipped.
+
     Args:
         state (WebIndexState): Input state.
         config (Optional[RunnableConfig], optional): Runnable config. Defaults to None.
     """
-    urls = [url for url in state.urls]
-    loader = WebBaseLoader(urls)
-    docs = []
-    async for doc in loader.alazy_load():
-        docs.append(doc)
-    # state.docs = [item for sublist in docs for item in sublist]
-    return {"docs": docs}
+    configuration = WebIndexerConfiguration.from_runnable_config(config)
+
+    async def fetch(url: str) -> list[Document]:
+        try:
+            return await _fetch_page(fetcher, url, crawl)
+        except Exception as e:
+            logger.warning(f"Failed to fetch {url}: {e!r}")
+            return []
+
+    async with (
+        _open_crawl(configuration, state.urls) as crawl,
+        _make_fetcher(configuration) as fetcher,
+    ):
+        pages = await asyncio.gather(*(fetch(url) for url in state.urls))
+    return {"docs": [doc for page in pages for doc in page]}
 
 
 async def split_text(
@@ -80,22 +167,22 @@ async def split_text(
     Returns:
         WebIndexState: The updated state after splitting the text in the documents.
     """
-    text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-        chunk_size=500, chunk_overlap=0
+    configuration = WebIndexerConfiguration.from_runnable_config(config)
+    state.docs = await text_splitting.asplit_documents(
+        state.docs, configuration.chunk_size, configuration.chunk_overlap
     )
-    docs = text_splitter.split_documents(state.docs)
-    state.docs = docs
     return state
 
 
 async def index_docs(
     state: WebIndexerState, *, config: Optional[RunnableConfig] = None
-) -> dict[str, str]:
+) -> dict[str, Any]:
     """Asynchronously index documents in the given state using the configured retriever.
 
     This function takes the documents from the state, ensures they have a user ID,
-    adds them to the retriever's index, and then signals for the documents to be
-    deleted from the state.
+    upserts them into the retriever's index under deterministic IDs, and then
+    signals for the documents to be deleted from the state. The dedupe report is
+    returned in the summary.
 
     Args:
         state (WebIndexState): The current state containing documents and retriever.
@@ -104,21 +191,334 @@ async def index_docs(
     logger.debug(state)
     if not config:
         raise ValueError("Configuration required to run index_docs.")
-    with retrieval.make_retriever(config) as retriever:
-        stamped_docs = ensure_docs_have_user_id(state.docs, config)
+    configuration = WebIndexerConfiguration.from_runnable_config(config)
+    chunks_per_page = Counter(doc.metadata.get("source") for doc in state.docs)
+    async with (
+        _open_crawl(configuration, list(filter(None, chunks_per_page))) as crawl,
+        retrieval.amake_retriever(config) as retriever,
+    ):
+        stamped_docs = retrieval.with_chunk_ids(
+            ensure_docs_have_user_id(state.docs, config), configuration.user_id
+        )
+        for doc in stamped_docs:
+            if chunks_per_page.get(doc.metadata.get("source")):
+                crawl.expect(doc, chunks_per_page.pop(doc.metadata.get("source")))
+        await crawl.add(retriever, stamped_docs)
+    logger.info(f"Upsert report: {crawl.report}")
+    return {"docs": "delete", "summary": {"dedupe": crawl.report.as_dict()}}
+
+
+class _Crawl:
+    """Crawl state of the pages of one indexing run.
+
+    Pages are recorded once every one of their chunks has been upserted, at
+    which point the chunks of the previous version of the page are deleted.
+    Without a crawl state store, chunks are simply upserted.
+    """
+
+    def __init__(
+        self,
+        store: Optional[CrawlState],
+        user_id: str,
+        previous: dict[str, PageRecord],
+        options: retrieval.BulkOptions,
+    ) -> None:
+        self.store = store
+        self.user_id = user_id
+        self.previous = previous
+        self.options = options
+        self.unchanged = 0
+        self.deleted = 0
+        self.report = retrieval.UpsertReport()
+        self._known_ids = {i for r in previous.values() for i in r.chunk_ids}
+        self._pending: dict[str, int] = {}
+        self._pages: dict[str, Document] = {}
+        self._ids: dict[str, list[str]] = {}
+
+    def headers(self, url: str) -> Optional[dict[str, str]]:
+        """Return the conditional request headers of a page indexed before."""
+        record = self.previous.get(url)
+        return record.conditional_headers() if record is not None else None
+
+    async def is_unchanged(
+        self, url: str, result: FetchResult, content_hash: Optional[str]
+    ) -> bool:
+        """Return whether the page is the same as when it was last indexed."""
+        record = self.previous.get(url)
+        if self.store is None or record is None:
+            return False
+        if result.status == 304 or record.content_hash == content_hash:
+            self.unchanged += 1
+            etag = result.headers.get("ETag") or record.etag
+            last_modified = result.headers.get("Last-Modified") or record.last_modified
+            if (etag, last_modified) != (record.etag, record.last_modified):
+                await run_blocking(
+                    self.store.put,
+                    self.user_id,
+                    url,
+                    PageRecord(
+                        record.content_hash, record.chunk_ids, etag, last_modified
+                    ),
+                )
+            return True
+        return False
+
+    def expect(self, page: Document, n_chunks: int) -> None:
+        """Announce the number of chunks a page was split into."""
+        source = page.metadata["source"]
+        self._pending[source] = n_chunks
+        self._pages[source] = page
+        self._ids[source] = []
+
+    async def add(
+        self, retriever: VectorStoreRetriever, chunks: list[Document]
+    ) -> None:
+        """Upsert chunks and record the pages whose chunks are all indexed.
+
+        Chunks that the previous crawl already indexed are not embedded again.
+        """
+        self.report.merge(
+            await retrieval.aupsert_documents(
+                retriever.vectorstore,
+                chunks,
+                known_ids=self._known_ids,
+                options=self.options,
+                lexical_index=retrieval.lexical_index_of(retriever),
+            )
+        )
+        if self.store is None:
+            return
+        for chunk in chunks:
+            source = chunk.metadata.get("source")
+            if source in self._pending:
+                self._ids[source].append(cast(str, chunk.id))
+                self._pending[source] -= 1
+        # Claim the finished pages before awaiting, so that a concurrent add does
+        # not finish them again.
+        finished = []
+        for source in [s for s, n in self._pending.items() if n <= 0]:
+            self._pending.pop(source, None)
+            finished.append((source, self._pages.pop(source), self._ids.pop(source)))
+        for source, page, ids in finished:
+            await self._finish(retriever, source, page, ids)
+
+    async def _finish(
+        self,
+        retriever: VectorStoreRetriever,
+        source: str,
+        page: Document,
+        ids: list[str],
+    ) -> None:
+        assert self.store is not None
+        previous = self.previous.get(source)
+        if previous is not None:
+            stale = sorted(set(previous.chunk_ids) - set(ids))
+            if stale:
+                await retrieval.adelete_documents(
+                    retriever.vectorstore,
+                    stale,
+                    lexical_index=retrieval.lexical_index_of(retriever),
+                )
+                self.deleted += len(stale)
+        await run_blocking(
+            self.store.put,
+            self.user_id,
+            source,
+            PageRecord(
+                content_hash=page.metadata["content_hash"],
+                chunk_ids=tuple(ids),
+                etag=page.metadata.get("etag"),
+                last_modified=page.metadata.get("last_modified"),
+            ),
+        )
+
+
+@asynccontextmanager
+async def _open_crawl(
+    configuration: WebIndexerConfiguration, urls: Sequence[str]
+) -> AsyncIterator[_Crawl]:
+    options = retrieval.BulkOptions.from_configuration(configuration)
+    if configuration.crawl_state_path is None:
+        yield _Crawl(None, configuration.user_id, {}, options)
+        return
+    store = await run_blocking(CrawlState, configuration.crawl_state_path)
+    try:
+        previous = await run_blocking(store.get_many, configuration.user_id, urls)
+        crawl = _Crawl(store, configuration.user_id, previous, options)
+        yield crawl
+        if crawl.unchanged or crawl.deleted:
+            logger.info(
+                f"{crawl.unchanged} unchanged page(s) skipped, "
+                f"{crawl.deleted} stale chunk(s) deleted"
+            )
+    finally:
+        await run_blocking(store.close)
+
+
+def _make_fetcher(configuration: WebIndexerConfiguration) -> HttpFetcher:
+    return HttpFetcher(
+        max_concurrency=configuration.fetch_concurrency,
+        per_host_concurrency=configuration.per_host_concurrency,
+        per_host_rate=configuration.per_host_requests_per_second,
+        timeout=configuration.fetch_timeout,
+        max_retries=configuration.fetch_max_retries,
+        headers={"User-Agent": os.environ.get("USER_AGENT", "retrieval-agents")},
+    )
+
+
+async def _fetch_page(fetcher: HttpFetcher, url: str, crawl: _Crawl) -> list[Document]:
+    """Fetch a page, returning nothing if it did not change since the last crawl."""
+    result = await fetcher.fetch(url, headers=crawl.headers(url))
+    if result.status == 304 and await crawl.is_unchanged(url, result, None):
+        return []
+    if not 200 <= result.status < 300:
+        raise FetchError(url, f"HTTP {result.status}")
+    # Parsing HTML is CPU-bound.
+    page = await run_blocking(_parse_html, url, result.text)
+    content_hash = hashlib.sha256(page.page_content.encode()).hexdigest()
+    if await crawl.is_unchanged(url, result, content_hash):
+        return []
+    page.metadata["content_hash"] = content_hash
+    if etag := result.headers.get("ETag"):
+        page.metadata["etag"] = etag
+    if last_modified := result.headers.get("Last-Modified"):
+        page.metadata["last_modified"] = last_modified
+    return [page]
+
+
+def _parse_html(url: str, html: str) -> Document:
+    """Extract the text and metadata of a page like ``WebBaseLoader`` does."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+    metadata = {"source": url}
+    if title := soup.find("title"):
+        metadata["title"] = title.get_text()
+    if description := soup.find("meta", attrs={"name": "description"}):
+        metadata["description"] = description.get("content", "No description found.")
+    if tag := soup.find("html"):
+        metadata["language"] = tag.get("lang", "No language found.")
+    return Document(page_content=soup.get_text(), metadata=metadata)
+
+
+async def stream_index(
+    state: WebIndexerState, *, config: Optional[RunnableConfig] = None
+) -> dict[str, Any]:
+    """Fetch, split and index the pages as a streaming pipeline.
+
+    Pages are fetched concurrently and flow through bounded queues: each page is
+    split as soon as it arrives and chunks are embedded and upserted in fixed-size
+    batches, so memory is bounded by the queue sizes rather than by the crawl.
+    A page that fails to download is logged and skipped, and so is a page that
+    did not change since the last crawl when a crawl state is configured.
+
+    Args:
+        state (WebIndexerState): Input state.
+        config (Optional[RunnableConfig]): Configuration for the indexing process.
+
+    Returns:
+        dict[str, Any]: The pipeline summary (pages, chunks, bytes and seconds per stage).
+    """
+    if not config:
+        raise ValueError("Configuration required to run stream_index.")
+    configuration = WebIndexerConfiguration.from_runnable_config(config)
+    fetched = StageStats("fetch")
+    split = StageStats("split")
+    indexed = StageStats("index")
+    pages: Channel[Document] = Channel(configuration.queue_size)
+    chunks: Channel[Document] = Channel(
+        configuration.queue_size * configuration.index_batch_size
+    )
+
+    async def urls() -> AsyncIterator[str]:
+        for url in state.urls:
+            yield url
+
+    async def fetch(url: str) -> list[Document]:
+        try:
+            page = await _fetch_page(fetcher, url, crawl)
+        except Exception as e:
+            fetched.errors += 1
+            logger.warning(f"Failed to fetch {url}: {e!r}")
+            return []
+        if not page:
+            fetched.skipped += 1
+        return page
+
+    async def split_page(page: Document) -> list[Document]:
+        docs = retrieval.with_chunk_ids(
+            ensure_docs_have_user_id(
+                await text_splitting.asplit_documents(
+                    [page], configuration.chunk_size, configuration.chunk_overlap
+                ),
+                config,
+            ),
+            configuration.user_id,
+        )
+        crawl.expect(page, len(docs))
+        if not docs:
+            await crawl.add(retriever, [])
+        return docs
+
+    started_at = time.monotonic()
+    async with (
+        _open_crawl(configuration, state.urls) as crawl,
+        _make_fetcher(configuration) as fetcher,
+        retrieval.amake_retriever(config) as retriever,
+    ):
+
+        async def index_batch(batch: list[Document]) -> list[Document]:
+            await crawl.add(retriever, batch)
+            return batch
+
+        await run_pipeline(
+            run_stage(
+                fetched,
+                urls(),
+                fetch,
+                pages,
+                concurrency=configuration.fetch_concurrency,
+            ),
+            run_stage(
+                split,
+                pages,
+                split_page,
+                chunks,
+                measure=lambda page: len(page.page_content.encode()),
+            ),
+            run_stage(
+                indexed,
+                abatched(chunks, configuration.index_batch_size),
+                index_batch,
+                measure=lambda batch: sum(len(d.page_content.encode()) for d in batch),
+            ),
+        )
+    summary = PipelineSummary(
+        [fetched, split, indexed], seconds=time.monotonic() - started_at
+    )
+    logger.info(f"{summary}\n  dedupe: {crawl.report}")
+    return {"summary": {**summary.as_dict(), "dedupe": crawl.report.as_dict()}}
+
 
-        await retriever.aadd_documents(stamped_docs)
-    return {"docs": "delete"}
+### Edges ###
+def route_mode(
+    state: WebIndexerState, *, config: RunnableConfig
+) -> Literal["load_web", "stream_index"]:
+    """Choose between the batch and the streaming pipeline."""
+    configuration = WebIndexerConfiguration.from_runnable_config(config)
+    return "stream_index" if configuration.streaming else "load_web"
 
 
 ### Graph ###
 builder = StateGraph(
-    WebIndexerState, input=UrlInputState, config_schema=IndexerConfiguration
+    WebIndexerState, input=UrlInputState, config_schema=WebIndexerConfiguration
 )
 builder.add_node(index_docs)
 builder.add_node(load_web)
 builder.add_node(split_text)
-builder.add_edge(START, "load_web")
+builder.add_node(stream_index)
+builder.add_conditional_edges(START, route_mode)
+builder.add_edge("stream_index", END)
 builder.add_edge("load_web", "split_text")
 builder.add_edge("split_text", "index_docs")
 builder.add_edge("index_docs", END)
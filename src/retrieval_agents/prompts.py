@@ -45,9 +45,29 @@ GRADE_DOCUMENTS_HUMAN_PROMPT = (
     """Retrieved document: \n\n {document} \n\n User question: {question}"""
 )
 
+LISTWISE_GRADE_DOCUMENTS_SYSTEM_PROMPT = """You are a grader assessing relevance of retrieved documents to a user question.
+You are given a numbered list of documents. If a document contains keyword(s) or semantic meaning related to the user question, grade it as relevant.
+It does not need to be a stringent test. The goal is to filter out erroneous retrievals.
+Give a binary score 'yes' or 'no' for every document index to indicate whether the document is relevant to the question."""
+
+LISTWISE_GRADE_DOCUMENTS_HUMAN_PROMPT = (
+    """Retrieved documents: \n\n {documents} \n\n User question: {question}"""
+)
+
 ANSWER_GRADER_SYSTEM_PROMPT = """You are a grader assessing whether an answer addresses / resolves a question.
 Give a binary score 'yes' or 'no'. Yes' means that the answer resolves the question."""
 
 ANSWER_GRADER_HUMAN_PROMPT = (
     """User question: \n\n {question} \n\n LLM generation: {generation}"""
 )
+
+GENERATION_GRADER_SYSTEM_PROMPT = """You are a grader assessing an LLM generation against a set of retrieved facts and a user question.
+Give two binary scores 'yes' or 'no':
+- grounded: 'yes' means that the answer is grounded in / supported by the set of facts.
+- addresses_question: 'yes' means that the answer resolves the question."""
+
+GENERATION_GRADER_HUMAN_PROMPT = """Set of facts: {documents} 
+
+User question: {question} 
+
+LLM generation: {generation}"""
@@ -0,0 +1,141 @@
+"""Helpers for keeping synchronous I/O off the event loop.
+
+Blocking calls (client construction, disk access, subprocesses, CPU-bound
+tokenization) are run on a bounded, process-wide thread pool through
+``run_blocking``. ``detect_blocking`` is a test-mode guard that fails when the
+event loop is stalled for longer than a threshold.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import os
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncGenerator, Callable, Optional, TypeVar
+
+from typing_extensions import ParamSpec
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            max_workers = int(
+                os.environ.get(
+                    "BLOCKING_IO_MAX_WORKERS", str(min(32, (os.cpu_count() or 1) + 4))
+                )
+            )
+            _executor = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="blocking-io"
+            )
+        return _executor
+
+
+async def run_blocking(func: Callable[P, R], *args: P.args, **kwargs: P.kwargs) -> R:
+    """Run a blocking callable on the bounded I/O executor and await its result.
+
+    The size of the executor is read from ``BLOCKING_IO_MAX_WORKERS``.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _get_executor(), functools.partial(func, *args, **kwargs)
+    )
+
+
+@dataclass(frozen=True)
+class BlockingEvent:
+    """A stall of the event loop observed by ``detect_blocking``."""
+
+    duration: float
+    stack: str
+
+
+class BlockingCallError(AssertionError):
+    """Raised when the event loop was blocked for longer than the threshold."""
+
+    def __init__(self, threshold: float, events: list[BlockingEvent]) -> None:
+        """Initialize the error with the observed stalls."""
+        self.threshold = threshold
+        self.events = events
+        worst = max(events, key=lambda e: e.duration)
+        super().__init__(
+            f"The event loop was blocked {len(events)} time(s) for more than "
+            f"{threshold:.3f}s (worst {worst.duration:.3f}s) at:\n{worst.stack}"
+        )
+
+
+@asynccontextmanager
+async def detect_blocking(
+    threshold: Optional[float] = None, interval: float = 0.01
+) -> AsyncGenerator[list[BlockingEvent], None]:
+    """Fail if the event loop is blocked for longer than ``threshold`` seconds.
+
+    Intended for tests: wrap graph or node invocations to assert that no
+    synchronous I/O runs on the loop. A heartbeat task measures how late it is
+    woken up, while a watchdog thread captures the stack of the loop thread
+    during a stall so that the offending call can be located.
+
+    Args:
+        threshold (Optional[float]): Maximum tolerated stall in seconds. Defaults
+            to ``BLOCKING_THRESHOLD_SECONDS`` or 0.1.
+        interval (float): Heartbeat period in seconds.
+
+    Raises:
+        BlockingCallError: On exit, if any stall exceeded the threshold.
+    """
+    if threshold is None:
+        threshold = float(os.environ.get("BLOCKING_THRESHOLD_SECONDS", "0.1"))
+    loop_thread = threading.get_ident()
+    events: list[BlockingEvent] = []
+    stacks: list[str] = []
+    last_beat = time.monotonic()
+    stopped = threading.Event()
+
+    async def heartbeat() -> None:
+        nonlocal last_beat
+        while True:
+            expected = time.monotonic() + interval
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            last_beat = now
+            lag = now - expected
+            if lag > threshold:
+                events.append(
+                    BlockingEvent(duration=lag, stack=stacks[-1] if stacks else "")
+                )
+            stacks.clear()
+
+    def watchdog() -> None:
+        while not stopped.wait(interval):
+            if time.monotonic() - last_beat > threshold and not stacks:
+                frame = sys._current_frames().get(loop_thread)
+                if frame is not None:
+                    stacks.append("".join(traceback.format_stack(frame)))
+
+    task = asyncio.create_task(heartbeat())
+    thread = threading.Thread(target=watchdog, name="blocking-watchdog", daemon=True)
+    thread.start()
+    try:
+        await asyncio.sleep(0)
+        yield events
+        # Let the heartbeat observe a stall that happened right before exiting.
+        await asyncio.sleep(interval)
+    finally:
+        stopped.set()
+        task.cancel()
+        thread.join()
+    if events:
+        raise BlockingCallError(threshold, events)
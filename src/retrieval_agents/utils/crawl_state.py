@@ -0,0 +1,146 @@
+"""Persistent state of crawled pages for incremental re-crawls.
+
+For every page indexed on behalf of a user, the crawl state records the HTTP
+validators (``ETag`` and ``Last-Modified``), a hash of the extracted text and
+the IDs of the chunks that were upserted for it. A re-crawl sends conditional
+requests with the validators, skips pages whose content hash did not change,
+and replaces only the chunks of the pages that did.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    user_id TEXT NOT NULL,
+    url TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    content_hash TEXT NOT NULL,
+    chunk_ids TEXT NOT NULL,
+    crawled_at REAL NOT NULL,
+    PRIMARY KEY (user_id, url)
+);
+"""
+
+# SQLite limits the number of host parameters in a single statement.
+_MAX_PARAMS = 500
+
+
+@dataclass(frozen=True)
+class PageRecord:
+    """What is known about a page from the last time it was indexed."""
+
+    content_hash: str
+    chunk_ids: tuple[str, ...] = ()
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+    def conditional_headers(self) -> dict[str, str]:
+        """Return the headers of a conditional request for the page."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class CrawlState:
+    """SQLite-backed store of page records keyed by user ID and URL."""
+
+    def __init__(self, path: str) -> None:
+        """Open or create the store.
+
+        Args:
+            path (str): Path of the SQLite database file.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def get_many(self, user_id: str, urls: Sequence[str]) -> dict[str, PageRecord]:
+        """Return the records of the given URLs that have been indexed before."""
+        records = {}
+        unique = list(dict.fromkeys(urls))
+        with self._lock:
+            for start in range(0, len(unique), _MAX_PARAMS):
+                chunk = unique[start : start + _MAX_PARAMS]
+                rows = self._conn.execute(
+                    "SELECT url, etag, last_modified, content_hash, chunk_ids "
+                    "FROM pages WHERE user_id = ? "
+                    f"AND url IN ({','.join('?' * len(chunk))})",
+                    [user_id, *chunk],
+                ).fetchall()
+                for url, *record in rows:
+                    records[url] = _record(*record)
+        return records
+
+    def get_prefixed(self, user_id: str, prefix: str) -> dict[str, PageRecord]:
+        """Return the records of every URL that starts with ``prefix``."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT url, etag, last_modified, content_hash, chunk_ids "
+                "FROM pages WHERE user_id = ? AND substr(url, 1, ?) = ?",
+                (user_id, len(prefix), prefix),
+            ).fetchall()
+        return {url: _record(*record) for url, *record in rows}
+
+    def put(self, user_id: str, url: str, record: PageRecord) -> None:
+        """Insert or replace the record of a page."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages "
+                "(user_id, url, etag, last_modified, content_hash, chunk_ids, "
+                "crawled_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    user_id,
+                    url,
+                    record.etag,
+                    record.last_modified,
+                    record.content_hash,
+                    json.dumps(list(record.chunk_ids)),
+                    time.time(),
+                ),
+            )
+            self._conn.commit()
+
+    def delete(self, user_id: str, urls: Sequence[str]) -> None:
+        """Delete the records of the given URLs."""
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM pages WHERE user_id = ? AND url = ?",
+                [(user_id, url) for url in urls],
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+
+def _record(
+    etag: Optional[str],
+    last_modified: Optional[str],
+    content_hash: str,
+    chunk_ids: str,
+) -> PageRecord:
+    return PageRecord(
+        content_hash=content_hash,
+        chunk_ids=tuple(json.loads(chunk_ids)),
+        etag=etag,
+        last_modified=last_modified,
+    )
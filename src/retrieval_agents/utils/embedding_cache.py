@@ -0,0 +1,324 @@
+"""Persistent, content-addressed cache of text embeddings.
+
+Embeddings are stored in a SQLite database keyed by a hash of the embedding
+model name, the kind of text (query or document) and the text itself. Vectors
+are stored as packed float32 or float16 arrays. Entries are evicted by age
+(TTL) and by least recent use once the cache exceeds its size limit.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Literal, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from retrieval_agents.utils.blocking import run_blocking
+
+_Kind = Literal["query", "document"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key BLOB PRIMARY KEY,
+    model TEXT NOT NULL,
+    dtype TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS embeddings_accessed_at ON embeddings (accessed_at);
+"""
+
+# SQLite limits the number of host parameters in a single statement.
+_MAX_PARAMS = 500
+
+
+@dataclass(frozen=True)
+class EmbeddingCacheStats:
+    """Snapshot of the counters of an embedding cache."""
+
+    size: int
+    max_entries: int
+    hits: int
+    misses: int
+    evictions: int
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of lookups served from the cache."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class EmbeddingCache:
+    """SQLite-backed embedding cache shared by every encoder in the process."""
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 1_000_000,
+        ttl_seconds: Optional[float] = None,
+        dtype: Literal["float32", "float16"] = "float32",
+    ) -> None:
+        """Open or create the cache.
+
+        Args:
+            path (str): Path of the SQLite database file.
+            max_entries (int): Maximum number of vectors kept in the cache.
+            ttl_seconds (Optional[float]): Entries older than this are discarded.
+            dtype (Literal["float32", "float16"]): Storage precision of new vectors.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.dtype = dtype
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._size: int = self._conn.execute(
+            "SELECT COUNT(*) FROM embeddings"
+        ).fetchone()[0]
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @staticmethod
+    def key(model: str, kind: _Kind, text: str) -> bytes:
+        """Return the content address of a text embedded by a model."""
+        return hashlib.sha256(f"{model}\0{kind}\0{text}".encode()).digest()
+
+    def get_many(
+        self, model: str, kind: _Kind, texts: Sequence[str]
+    ) -> list[Optional[list[float]]]:
+        """Look up the embeddings of ``texts``; missing entries are returned as None."""
+        keys = [self.key(model, kind, text) for text in texts]
+        now = time.time()
+        found: dict[bytes, list[float]] = {}
+        with self._lock:
+            for start in range(0, len(keys), _MAX_PARAMS):
+                chunk = list(set(keys[start : start + _MAX_PARAMS]))
+                rows = self._conn.execute(
+                    "SELECT key, dtype, vector, created_at FROM embeddings "
+                    f"WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for key, dtype, vector, created_at in rows:
+                    if (
+                        self.ttl_seconds is not None
+                        and now - created_at > self.ttl_seconds
+                    ):
+                        continue
+                    found[key] = (
+                        np.frombuffer(vector, dtype=dtype).astype(np.float32).tolist()
+                    )
+            if found:
+                self._conn.executemany(
+                    "UPDATE embeddings SET accessed_at = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._conn.commit()
+            results = [found.get(key) for key in keys]
+            hits = sum(r is not None for r in results)
+            self._hits += hits
+            self._misses += len(results) - hits
+        return results
+
+    def put_many(
+        self,
+        model: str,
+        kind: _Kind,
+        texts: Sequence[str],
+        vectors: Sequence[Sequence[float]],
+    ) -> None:
+        """Store the embeddings of ``texts`` and evict entries over the size limit."""
+        now = time.time()
+        rows = [
+            (
+                self.key(model, kind, text),
+                model,
+                self.dtype,
+                np.asarray(vector, dtype=self.dtype).tobytes(),
+                now,
+                now,
+            )
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            # Expired rows would otherwise keep the fresh vectors of their keys out.
+            self._expire(now)
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings "
+                "(key, model, dtype, vector, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._size += self._conn.total_changes - before
+            self._evict(now)
+            self._conn.commit()
+
+    def evict_expired(self) -> int:
+        """Delete every entry older than the TTL and return how many were removed."""
+        with self._lock:
+            before = self._evictions
+            self._evict(time.time())
+            self._conn.commit()
+            return self._evictions - before
+
+    def stats(self) -> EmbeddingCacheStats:
+        """Return the size of the cache and its hit/miss counters."""
+        with self._lock:
+            return EmbeddingCacheStats(
+                size=self._size,
+                max_entries=self.max_entries,
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+            )
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+    def _expire(self, now: float) -> None:
+        if self.ttl_seconds is None:
+            return
+        removed = self._conn.execute(
+            "DELETE FROM embeddings WHERE created_at < ?",
+            (now - self.ttl_seconds,),
+        ).rowcount
+        self._size -= removed
+        self._evictions += removed
+
+    def _evict(self, now: float) -> None:
+        self._expire(now)
+        overflow = self._size - self.max_entries
+        if overflow > 0:
+            removed = self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN ("
+                "SELECT key FROM embeddings ORDER BY accessed_at LIMIT ?)",
+                (overflow,),
+            ).rowcount
+            self._size -= removed
+            self._evictions += removed
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only sends cache misses to the underlying provider."""
+
+    def __init__(
+        self, embeddings: Embeddings, model: str, cache: EmbeddingCache
+    ) -> None:
+        """Wrap an encoder.
+
+        Args:
+            embeddings (Embeddings): The provider encoder.
+            model (str): Fully specified model name, used as part of the cache key.
+            cache (EmbeddingCache): The cache to read from and write to.
+        """
+        self.embeddings = embeddings
+        self.model = model
+        self.cache = cache
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embed search documents, reusing cached vectors."""
+        cached = self.cache.get_many(self.model, "document", texts)
+        misses = _unique_misses(texts, cached)
+        if misses:
+            vectors = self.embeddings.embed_documents(misses)
+            self.cache.put_many(self.model, "document", misses, vectors)
+            _fill(texts, cached, dict(zip(misses, vectors)))
+        return cached  # type: ignore[return-value]
+
+    def embed_query(self, text: str) -> list[float]:
+        """Embed a query text, reusing a cached vector."""
+        cached = self.cache.get_many(self.model, "query", [text])[0]
+        if cached is None:
+            cached = self.embeddings.embed_query(text)
+            self.cache.put_many(self.model, "query", [text], [cached])
+        return cached
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Asynchronously embed search documents, reusing cached vectors."""
+        cached = await run_blocking(self.cache.get_many, self.model, "document", texts)
+        misses = _unique_misses(texts, cached)
+        if misses:
+            vectors = await self.embeddings.aembed_documents(misses)
+            await run_blocking(
+                self.cache.put_many, self.model, "document", misses, vectors
+            )
+            _fill(texts, cached, dict(zip(misses, vectors)))
+        return cached  # type: ignore[return-value]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        """Asynchronously embed a query text, reusing a cached vector."""
+        cached = (await run_blocking(self.cache.get_many, self.model, "query", [text]))[
+            0
+        ]
+        if cached is None:
+            cached = await self.embeddings.aembed_query(text)
+            await run_blocking(
+                self.cache.put_many, self.model, "query", [text], [cached]
+            )
+        return cached
+
+
+def _unique_misses(
+    texts: Sequence[str], cached: Sequence[Optional[list[float]]]
+) -> list[str]:
+    return list(dict.fromkeys(t for t, v in zip(texts, cached) if v is None))
+
+
+def _fill(
+    texts: Sequence[str],
+    cached: list[Optional[list[float]]],
+    computed: dict[str, list[float]],
+) -> None:
+    for i, text in enumerate(texts):
+        if cached[i] is None:
+            cached[i] = computed[text]
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Return the process-wide cache configured by the environment, if enabled.
+
+    The cache is enabled by setting ``EMBEDDING_CACHE_PATH``. Its size, TTL and
+    storage precision are read from ``EMBEDDING_CACHE_MAX_ENTRIES``,
+    ``EMBEDDING_CACHE_TTL_SECONDS`` and ``EMBEDDING_CACHE_DTYPE``.
+    """
+    global _cache
+    path = os.environ.get("EMBEDDING_CACHE_PATH")
+    if not path:
+        return None
+    with _cache_lock:
+        if _cache is None or _cache.path != path:
+            if _cache is not None:
+                _cache.close()
+            ttl = os.environ.get("EMBEDDING_CACHE_TTL_SECONDS")
+            _cache = EmbeddingCache(
+                path,
+                max_entries=int(
+                    os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", "1000000")
+                ),
+                ttl_seconds=float(ttl) if ttl else None,
+                dtype="float16"
+                if os.environ.get("EMBEDDING_CACHE_DTYPE") == "float16"
+                else "float32",
+            )
+        return _cache
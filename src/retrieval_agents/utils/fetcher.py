@@ -0,0 +1,262 @@
+"""Concurrent, rate-limited HTTP fetcher.
+
+All requests of a fetcher share one keep-alive ``aiohttp`` session. The number
+of requests in flight is bounded globally and per host, and requests to the same
+host can be spaced to a maximum rate. Transient failures (connection errors,
+timeouts, 429 and 5xx responses) are retried with exponential backoff, and
+response bodies are decoded incrementally as they stream in.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import codecs
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from types import TracebackType
+from typing import Mapping, Optional, Type
+from urllib.parse import urlsplit
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class FetchError(Exception):
+    """Raised when a URL cannot be fetched after all retries."""
+
+    def __init__(self, url: str, reason: str) -> None:
+        """Initialize the error with the URL and the last failure."""
+        self.url = url
+        self.reason = reason
+        super().__init__(f"Failed to fetch {url}: {reason}")
+
+
+@dataclass(frozen=True)
+class FetchResult:
+    """A fetched response."""
+
+    url: str
+    status: int
+    text: str
+    headers: Mapping[str, str] = field(default_factory=dict)
+    attempts: int = 1
+    seconds: float = 0.0
+
+
+@dataclass
+class FetcherStats:
+    """Counters of a fetcher."""
+
+    requests: int = 0
+    retries: int = 0
+    failures: int = 0
+    bytes: int = 0
+
+
+class _HostLimiter:
+    """Concurrency and rate limit of one host."""
+
+    def __init__(self, concurrency: int, rate: Optional[float]) -> None:
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.interval = 1 / rate if rate else 0.0
+        self._next_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait_turn(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_at - now
+            self._next_at = max(now, self._next_at) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class HttpFetcher:
+    """Fetch URLs over a shared keep-alive session with global and per-host limits.
+
+    Use as an async context manager::
+
+        async with HttpFetcher(per_host_concurrency=2) as fetcher:
+            result = await fetcher.fetch("https://example.com")
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 32,
+        per_host_concurrency: int = 4,
+        per_host_rate: Optional[float] = None,
+        timeout: float = 30.0,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        max_bytes: Optional[int] = None,
+        headers: Optional[Mapping[str, str]] = None,
+        chunk_size: int = 64 * 1024,
+    ) -> None:
+        """Initialize the fetcher; the session is opened on first use.
+
+        Args:
+            max_concurrency (int): Maximum number of requests in flight.
+            per_host_concurrency (int): Maximum number of requests in flight per host.
+            per_host_rate (Optional[float]): Maximum requests per second per host.
+            timeout (float): Timeout of a single attempt in seconds.
+            max_retries (int): Number of retries after the first attempt.
+            backoff (float): Base delay of the exponential backoff in seconds.
+            max_bytes (Optional[int]): Response bodies are truncated to this size.
+            headers (Optional[Mapping[str, str]]): Headers sent with every request.
+            chunk_size (int): Size of the chunks in which bodies are read.
+        """
+        self.max_concurrency = max_concurrency
+        self.per_host_concurrency = per_host_concurrency
+        self.per_host_rate = per_host_rate
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_bytes = max_bytes
+        self.headers = dict(headers or {})
+        self.chunk_size = chunk_size
+        self.stats = FetcherStats()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._hosts: dict[str, _HostLimiter] = {}
+
+    async def __aenter__(self) -> HttpFetcher:
+        """Open the session."""
+        self._get_session()
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        tb: Optional[TracebackType],
+    ) -> None:
+        """Close the session."""
+        await self.close()
+
+    async def close(self) -> None:
+        """Close the session and its pooled connections."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def fetch(
+        self, url: str, headers: Optional[Mapping[str, str]] = None
+    ) -> FetchResult:
+        """Fetch a URL, retrying transient failures.
+
+        Responses with a non-retryable status (including 304 and 4xx) are
+        returned as is; check ``FetchResult.status``.
+
+        Args:
+            url (str): URL to fetch.
+            headers (Optional[Mapping[str, str]]): Extra headers of this request.
+
+        Raises:
+            FetchError: If every attempt failed.
+        """
+        host = urlsplit(url).netloc
+        limiter = self._hosts.get(host)
+        if limiter is None:
+            limiter = self._hosts[host] = _HostLimiter(
+                self.per_host_concurrency, self.per_host_rate
+            )
+        started_at = time.monotonic()
+        reason = ""
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.stats.retries += 1
+            delay: Optional[float] = None
+            # A request waiting for its host does not hold a global slot.
+            async with limiter.semaphore:
+                await limiter.wait_turn()
+                async with self._semaphore:
+                    self.stats.requests += 1
+                    try:
+                        result = await self._attempt(url, headers)
+                    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                        reason = repr(e)
+                    else:
+                        if result.status not in RETRYABLE_STATUSES:
+                            return FetchResult(
+                                url=url,
+                                status=result.status,
+                                text=result.text,
+                                headers=result.headers,
+                                attempts=attempt + 1,
+                                seconds=time.monotonic() - started_at,
+                            )
+                        reason = f"HTTP {result.status}"
+                        delay = _retry_after(result.headers)
+            if attempt < self.max_retries:
+                if delay is None:
+                    delay = self.backoff * 2**attempt * (1 + random.random())
+                logger.debug(f"Retrying {url} in {delay:.2f}s after {reason}")
+                await asyncio.sleep(delay)
+        self.stats.failures += 1
+        raise FetchError(url, reason)
+
+    async def _attempt(
+        self, url: str, headers: Optional[Mapping[str, str]]
+    ) -> FetchResult:
+        session = self._get_session()
+        async with session.get(url, headers=headers) as response:
+            if response.status in RETRYABLE_STATUSES or response.status == 304:
+                text = ""
+            else:
+                text = await self._read_text(response)
+            return FetchResult(
+                url=url, status=response.status, text=text, headers=response.headers
+            )
+
+    async def _read_text(self, response: aiohttp.ClientResponse) -> str:
+        decoder = codecs.getincrementaldecoder(_codec(response.charset) or "utf-8")(
+            errors="replace"
+        )
+        parts = []
+        size = 0
+        async for chunk in response.content.iter_chunked(self.chunk_size):
+            if self.max_bytes is not None and size + len(chunk) > self.max_bytes:
+                chunk = chunk[: self.max_bytes - size]
+            size += len(chunk)
+            parts.append(decoder.decode(chunk))
+            if self.max_bytes is not None and size >= self.max_bytes:
+                break
+        parts.append(decoder.decode(b"", final=True))
+        self.stats.bytes += size
+        return "".join(parts)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.max_concurrency,
+                    limit_per_host=self.per_host_concurrency,
+                ),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers=self.headers,
+            )
+        return self._session
+
+
+def _codec(charset: Optional[str]) -> Optional[str]:
+    if not charset:
+        return None
+    try:
+        return codecs.lookup(charset).name
+    except LookupError:
+        return None
+
+
+def _retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    value = headers.get("Retry-After")
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
@@ -0,0 +1,88 @@
+"""Parse and split local files in worker processes.
+
+The functions of this module run in the worker processes of the directory
+indexer, so they only take and return picklable values. Each worker loads the
+tokenizer once and reuses it for every file it handles. Markdown, HTML and
+PDF files are parsed with ``unstructured`` (the ``unstructured`` extra); plain
+text files are read as is.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+from langchain_core.documents import Document
+
+from retrieval_agents.utils.text_splitting import split_documents
+
+SUPPORTED_EXTENSIONS = (".md", ".markdown", ".html", ".htm", ".pdf", ".txt")
+
+
+@dataclass(frozen=True)
+class ParsedFile:
+    """A file and its chunks."""
+
+    path: str
+    signature: str
+    """Size and modification time of the file when it was read."""
+    content_hash: str
+    chunks: Optional[list[Document]]
+    """None if the content hash matches the one of the previous ingestion."""
+
+
+def file_signature(path: str) -> str:
+    """Return a cheap signature of a file that changes when the file does.
+
+    The signature is made of the size and the modification time of the file, so
+    that unchanged files can be skipped without reading them.
+    """
+    stat = os.stat(path)
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+
+def parse_file(
+    path: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    previous_hash: Optional[str] = None,
+) -> ParsedFile:
+    """Read, parse and split a file.
+
+    Args:
+        path (str): Path of the file.
+        chunk_size (int): Maximum number of tokens of a chunk.
+        chunk_overlap (int): Number of tokens shared by consecutive chunks.
+        previous_hash (Optional[str]): Content hash recorded by the previous
+            ingestion of the file, if any.
+
+    Returns:
+        ParsedFile: The chunks of the file, each with the file path as its
+            ``source``, or no chunks if the content did not change.
+    """
+    signature = file_signature(path)
+    with open(path, "rb") as f:
+        data = f.read()
+    content_hash = hashlib.sha256(data).hexdigest()
+    if content_hash == previous_hash:
+        return ParsedFile(path, signature, content_hash, None)
+    page = Document(
+        page_content=_extract_text(path, data),
+        metadata={"source": path, "filename": os.path.basename(path)},
+    )
+    chunks = split_documents([page], chunk_size, chunk_overlap)
+    return ParsedFile(path, signature, content_hash, chunks)
+
+
+def _extract_text(path: str, data: bytes) -> str:
+    if path.lower().endswith(".txt"):
+        return data.decode("utf-8", errors="replace")
+    from langchain_unstructured import UnstructuredLoader
+
+    return "\n\n".join(
+        element.page_content
+        for element in UnstructuredLoader(path).lazy_load()
+        if element.page_content
+    )
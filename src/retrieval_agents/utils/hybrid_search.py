@@ -0,0 +1,236 @@
+"""Hybrid retrieval: a lexical search fused with a vector search.
+
+Embeddings miss queries that hinge on an exact term, such as an error code or a
+product name, which a lexical search ranks first. ``HybridRetriever`` runs both
+searches concurrently and fuses their rankings by reciprocal rank, which needs
+no calibration between BM25 scores and similarities.
+
+Elasticsearch ranks its own ``text`` field by BM25. For the other providers the
+lexical side is a ``LexicalIndex``: an SQLite FTS5 inverted index, also ranked
+by BM25, that the indexers write next to the vector store.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Callable, Optional, Sequence
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+
+from retrieval_agents.utils.blocking import run_blocking
+from retrieval_agents.utils.scored_search import ScoredRetriever
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    row INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    user_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS terms USING fts5(
+    text, content='chunks', content_rowid='row'
+);
+CREATE TRIGGER IF NOT EXISTS chunks_insert AFTER INSERT ON chunks BEGIN
+    INSERT INTO terms (rowid, text) VALUES (new.row, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS chunks_delete AFTER DELETE ON chunks BEGIN
+    INSERT INTO terms (terms, rowid, text) VALUES ('delete', old.row, old.text);
+END;
+"""
+
+# SQLite limits the number of host parameters in a single statement.
+_MAX_PARAMS = 500
+
+
+class LexicalIndex:
+    """BM25 inverted index of chunks in an SQLite FTS5 table."""
+
+    def __init__(self, path: str) -> None:
+        """Open or create the index.
+
+        Args:
+            path (str): Path of the SQLite database.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def upsert(self, docs: Sequence[Document]) -> None:
+        """Index chunks, replacing the chunks with the same IDs."""
+        ids = [str(doc.id) for doc in docs]
+        with self._lock, self._conn:
+            self._delete(ids)
+            self._conn.executemany(
+                "INSERT INTO chunks (id, user_id, text, metadata) VALUES (?, ?, ?, ?)",
+                [
+                    (
+                        id_,
+                        str(doc.metadata.get("user_id", "")),
+                        doc.page_content,
+                        json.dumps(doc.metadata),
+                    )
+                    for id_, doc in zip(ids, docs)
+                ],
+            )
+
+    def delete(self, ids: Sequence[str]) -> None:
+        """Remove the chunks with the given IDs."""
+        with self._lock, self._conn:
+            self._delete(ids)
+
+    def search(
+        self, query: str, k: int = 4, user_id: Optional[str] = None
+    ) -> list[tuple[Document, float]]:
+        """Return the chunks matching the most query terms, best first.
+
+        Args:
+            query (str): Free text; every word of it is an optional term.
+            k (int): Number of chunks to return.
+            user_id (Optional[str]): Only return the chunks of this user.
+
+        Returns:
+            list[tuple[Document, float]]: Chunks by decreasing BM25 score.
+        """
+        expression = match_expression(query)
+        if not expression or k <= 0:
+            return []
+        where, params = "terms MATCH ?", [expression]
+        if user_id is not None:
+            where += " AND chunks.user_id = ?"
+            params.append(user_id)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunks.id, chunks.text, chunks.metadata, bm25(terms) AS rank "
+                "FROM terms JOIN chunks ON chunks.row = terms.rowid "
+                f"WHERE {where} ORDER BY rank LIMIT ?",
+                [*params, k],
+            ).fetchall()
+        # FTS5 negates BM25 so that the best match sorts first.
+        return [
+            (Document(id=id_, page_content=text, metadata=json.loads(metadata)), -rank)
+            for id_, text, metadata, rank in rows
+        ]
+
+    def close(self) -> None:
+        """Close the database."""
+        with self._lock:
+            self._conn.close()
+
+    def _delete(self, ids: Sequence[str]) -> None:
+        for start in range(0, len(ids), _MAX_PARAMS):
+            chunk = list(ids[start : start + _MAX_PARAMS])
+            self._conn.execute(
+                f"DELETE FROM chunks WHERE id IN ({','.join('?' * len(chunk))})", chunk
+            )
+
+
+def match_expression(query: str) -> str:
+    """Return the FTS5 query matching any word of a free-text query.
+
+    Every word is quoted, so that operators and punctuation in the query are
+    searched as text instead of being parsed.
+
+    >>> match_expression('Why does ERR-42 "fail" on db.connect?')
+    '"why" OR "does" OR "err" OR "42" OR "fail" OR "on" OR "db" OR "connect"'
+    """
+    words = dict.fromkeys(re.findall(r"[^\W_]+", query.lower()))
+    return " OR ".join(f'"{word}"' for word in words)
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[Document]],
+    weights: Optional[Sequence[float]] = None,
+    k: int = 60,
+) -> list[Document]:
+    """Fuse rankings of documents by weighted reciprocal rank.
+
+    A document scores ``weight / (k + rank)`` in every ranking it appears in,
+    with ranks starting at 1; documents are identified by ID, or by content if
+    they have none. Ties keep the order in which documents were first seen.
+
+    >>> a, b, c = (Document(id=i, page_content=i) for i in "abc")
+    >>> [d.id for d in reciprocal_rank_fusion([[a, b], [c, b]])]
+    ['b', 'a', 'c']
+    >>> [d.id for d in reciprocal_rank_fusion([[a, b], [c]], [1.0, 3.0])]
+    ['c', 'a', 'b']
+    """
+    weights = weights if weights is not None else [1.0] * len(rankings)
+    scores: dict[str, float] = {}
+    docs: dict[str, Document] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, doc in enumerate(ranking, start=1):
+            key = doc.id or doc.page_content
+            docs.setdefault(key, doc)
+            scores[key] = scores.get(key, 0.0) + weight / (k + rank)
+    return [docs[key] for key in sorted(scores, key=scores.__getitem__, reverse=True)]
+
+
+class HybridRetriever(ScoredRetriever):
+    """Retriever fusing a vector search and a lexical search by reciprocal rank.
+
+    Each search returns ``fetch_k`` candidates and the best ``k`` (from
+    ``search_kwargs``) fused documents are returned. The score threshold,
+    adaptive ``k`` and MMR of the vector search apply to the vector candidates
+    only; documents found by the lexical search alone have no ``score``.
+    """
+
+    lexical_search: Callable[[str, int], list[Document]]
+    """Blocking lexical search returning the best ``k`` documents of a query."""
+    lexical_index: Optional[LexicalIndex] = None
+    """The in-process index the lexical search reads, which indexers write to."""
+    rrf_k: int = 60
+    vector_weight: float = 1.0
+    lexical_weight: float = 1.0
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun, **kwargs: Any
+    ) -> list[Document]:
+        k, n = self._sizes(kwargs)
+        vector = super()._get_relevant_documents(
+            query, run_manager=run_manager, **kwargs, k=n
+        )
+        return self._fuse(vector, self.lexical_search(query, n), k)
+
+    async def _aget_relevant_documents(
+        self,
+        query: str,
+        *,
+        run_manager: AsyncCallbackManagerForRetrieverRun,
+        **kwargs: Any,
+    ) -> list[Document]:
+        k, n = self._sizes(kwargs)
+        vector, lexical = await asyncio.gather(
+            super()._aget_relevant_documents(
+                query, run_manager=run_manager, **kwargs, k=n
+            ),
+            run_blocking(self.lexical_search, query, n),
+        )
+        return self._fuse(vector, lexical, k)
+
+    def _sizes(self, kwargs: dict[str, Any]) -> tuple[int, int]:
+        """Pop ``k`` from the search arguments; return it and the candidates per search."""
+        k = kwargs.pop("k", self.search_kwargs.get("k", 4))
+        return k, max(k, self.fetch_k)
+
+    def _fuse(
+        self, vector: list[Document], lexical: list[Document], k: int
+    ) -> list[Document]:
+        return reciprocal_rank_fusion(
+            [vector, lexical], [self.vector_weight, self.lexical_weight], self.rrf_k
+        )[:k]
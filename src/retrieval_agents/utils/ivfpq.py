@@ -0,0 +1,158 @@
+"""Inverted-file index with product quantization (IVF-PQ) over unit vectors.
+
+The index partitions vectors into ``nlist`` lists around centroids found by
+spherical k-means, and compresses every vector into ``m`` one-byte codes, one
+per subspace, each naming the nearest of 256 sub-centroids. A search visits
+the ``nprobe`` lists whose centroids are closest to the query and scores their
+vectors from the codes with one table lookup per subspace; the best candidates
+are then re-scored exactly by the caller.
+
+Only the trained centroids and codebooks live here. The list and the codes of
+every vector are row-aligned arrays kept by the vector store, so the index grows
+incrementally as vectors are appended.
+"""
+
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+
+import numpy as np
+
+KSUB = 256
+"""Number of sub-centroids per subspace, so that a code fits in a byte."""
+
+
+@dataclass(frozen=True)
+class IvfPqIndex:
+    """Trained centroids and product quantization codebooks."""
+
+    centroids: np.ndarray
+    """Unit-norm centroids of the lists, shape (nlist, dim)."""
+    codebooks: np.ndarray
+    """Sub-centroids of every subspace, shape (m, ksub, dim // m)."""
+
+    @property
+    def nlist(self) -> int:
+        """Number of inverted lists."""
+        return int(self.centroids.shape[0])
+
+    @property
+    def m(self) -> int:
+        """Number of subspaces, i.e. bytes per encoded vector."""
+        return int(self.codebooks.shape[0])
+
+    @classmethod
+    def train(
+        cls, sample: np.ndarray, nlist: int, iterations: int = 10, seed: int = 0
+    ) -> IvfPqIndex:
+        """Train the index on a sample of unit vectors.
+
+        Args:
+            sample (np.ndarray): Training vectors, shape (n, dim).
+            nlist (int): Number of inverted lists.
+            iterations (int): Number of k-means iterations.
+            seed (int): Seed of the random initialization.
+        """
+        rng = np.random.default_rng(seed)
+        sample = np.ascontiguousarray(sample, dtype=np.float32)
+        centroids = _kmeans(sample, nlist, iterations, rng, spherical=True)
+        m = subspaces(sample.shape[1])
+        parts = sample.reshape(len(sample), m, -1)
+        codebooks = np.stack(
+            [
+                _kmeans(parts[:, j], KSUB, iterations, rng, spherical=False)
+                for j in range(m)
+            ]
+        )
+        return cls(centroids, codebooks)
+
+    def assign(self, vectors: np.ndarray) -> np.ndarray:
+        """Return the list of every vector."""
+        return np.asarray(np.argmax(vectors @ self.centroids.T, axis=1), dtype=np.int32)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """Return the codes of every vector, shape (n, m)."""
+        parts = vectors.reshape(len(vectors), self.m, -1)
+        codes = np.empty((len(vectors), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            codes[:, j] = _nearest(parts[:, j], self.codebooks[j])
+        return codes
+
+    def probe(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        """Return the ``nprobe`` lists closest to the query."""
+        scores = self.centroids @ query
+        nprobe = min(nprobe, self.nlist)
+        return np.argpartition(scores, -nprobe)[-nprobe:]
+
+    def lookup_table(self, query: np.ndarray) -> np.ndarray:
+        """Return the dot products of the query with every sub-centroid, shape (m, ksub)."""
+        return np.asarray(
+            np.einsum("mkd,md->mk", self.codebooks, query.reshape(self.m, -1))
+        )
+
+    def approximate_scores(self, table: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Return the approximate dot products of the query with encoded vectors."""
+        return np.asarray(table[np.arange(self.m), codes].sum(axis=1))
+
+    def save(self, path: str) -> None:
+        """Write the index to ``path`` atomically."""
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, centroids=self.centroids, codebooks=self.codebooks)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> IvfPqIndex:
+        """Read an index written by ``save``."""
+        with np.load(path) as data:
+            return cls(data["centroids"], data["codebooks"])
+
+
+def subspaces(dim: int) -> int:
+    """Return the number of subspaces of a dimension, of 4 or fewer components.
+
+    >>> subspaces(1536), subspaces(12), subspaces(7)
+    (384, 3, 7)
+    """
+    for size in (4, 2):
+        if dim % size == 0:
+            return dim // size
+    return dim
+
+
+def _nearest(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    # argmin ||x - c||^2 == argmax (x.c - ||c||^2 / 2)
+    return np.asarray(
+        np.argmax(x @ centroids.T - 0.5 * (centroids**2).sum(axis=1), axis=1)
+    )
+
+
+def _kmeans(
+    x: np.ndarray,
+    k: int,
+    iterations: int,
+    rng: np.random.Generator,
+    spherical: bool,
+) -> np.ndarray:
+    """Return ``k`` centroids of ``x`` found by Lloyd iterations.
+
+    Spherical k-means assigns by dot product and keeps centroids unit-norm.
+    With fewer points than centroids, points are repeated.
+    """
+    centroids = x[rng.choice(len(x), k, replace=len(x) < k)].copy()
+    for _ in range(iterations):
+        labels = (
+            np.argmax(x @ centroids.T, axis=1) if spherical else _nearest(x, centroids)
+        )
+        order = np.argsort(labels, kind="stable")
+        sorted_labels = labels[order]
+        starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+        present = sorted_labels[starts]
+        counts = np.diff(np.r_[starts, len(x)])
+        # Empty clusters keep their previous centroid.
+        centroids[present] = np.add.reduceat(x[order], starts) / counts[:, None]
+        if spherical:
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            centroids /= np.where(norms == 0, 1, norms)
+    return centroids.astype(np.float32)
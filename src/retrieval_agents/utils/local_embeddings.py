@@ -0,0 +1,267 @@
+"""Managed runtime for locally executed embedding models.
+
+Local models such as ``NomicEmbeddings(inference_mode="local")`` load their
+weights when they are constructed, which takes seconds and hundreds of MB. The
+runtime in this module loads each model once per process and runs inference on
+a dedicated worker thread, so the event loop is never blocked. Queries that
+arrive concurrently from different requests are batched into a single forward
+pass.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Callable, Literal, Optional, cast
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+_Kind = Literal["query", "document"]
+
+
+@dataclass(frozen=True)
+class LocalEmbeddingStats:
+    """Snapshot of the state of a local embedding runtime."""
+
+    model: str
+    loaded: bool
+    load_seconds: float
+    memory_bytes: int
+    queue_depth: int
+    batches: int
+    embedded_texts: int
+
+
+class _Job:
+    __slots__ = ("kind", "texts", "future")
+
+    def __init__(self, kind: _Kind, texts: list[str]) -> None:
+        self.kind = kind
+        self.texts = texts
+        self.future: Future[list[list[float]]] = Future()
+
+
+def _rss_bytes() -> int:
+    """Return the resident set size of the current process in bytes."""
+    try:
+        with open("/proc/self/statm", encoding="utf-8") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+
+        # ru_maxrss is reported in kilobytes on Linux.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _load_nomic(model: str) -> Embeddings:
+    from langchain_nomic import NomicEmbeddings
+
+    return cast(Embeddings, NomicEmbeddings(model=model, inference_mode="local"))
+
+
+class LocalEmbeddingRuntime(Embeddings):
+    """Run a local embedding model on a dedicated worker thread.
+
+    The model is loaded lazily by the worker on the first request. Concurrent
+    ``embed_query`` calls are collected for up to ``max_wait`` seconds, or until
+    ``max_batch_size`` texts are queued, and embedded together.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        loader: Optional[Callable[[], Embeddings]] = None,
+        max_batch_size: int = 32,
+        max_wait: float = 0.005,
+    ) -> None:
+        """Initialize the runtime.
+
+        Args:
+            model (str): Name of the model, without the provider prefix.
+            loader (Optional[Callable[[], Embeddings]]): Builds the underlying model.
+                Defaults to a local Nomic model.
+            max_batch_size (int): Maximum number of queries embedded in one batch.
+            max_wait (float): Seconds to wait for more queries before running a batch.
+        """
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._loader = loader or (lambda: _load_nomic(model))
+        self._embeddings: Optional[Embeddings] = None
+        self._queue: queue.Queue[Optional[_Job]] = queue.Queue()
+        self._deferred: deque[_Job] = deque()
+        # Guards submissions against a concurrent close, so that no job is
+        # queued after the shutdown sentinel and left unanswered.
+        self._lock = threading.Lock()
+        self._closed = False
+        self._load_seconds = 0.0
+        self._memory_bytes = 0
+        self._batches = 0
+        self._embedded_texts = 0
+        self._worker = threading.Thread(
+            target=self._run, name=f"local-embeddings-{model}", daemon=True
+        )
+        self._worker.start()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embed search documents."""
+        return self._submit("document", texts).result()
+
+    def embed_query(self, text: str) -> list[float]:
+        """Embed a query text."""
+        return self._submit("query", [text]).result()[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Asynchronously embed search documents."""
+        return await asyncio.wrap_future(self._submit("document", texts))
+
+    async def aembed_query(self, text: str) -> list[float]:
+        """Asynchronously embed a query text."""
+        return (await asyncio.wrap_future(self._submit("query", [text])))[0]
+
+    def stats(self) -> LocalEmbeddingStats:
+        """Return the memory footprint, queue depth and throughput counters."""
+        return LocalEmbeddingStats(
+            model=self.model,
+            loaded=self._embeddings is not None,
+            load_seconds=self._load_seconds,
+            memory_bytes=self._memory_bytes,
+            queue_depth=self._queue.qsize() + len(self._deferred),
+            batches=self._batches,
+            embedded_texts=self._embedded_texts,
+        )
+
+    def close(self) -> None:
+        """Stop the worker thread after pending jobs are served.
+
+        Jobs submitted after the runtime is closed fail right away.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._worker.join()
+
+    def _submit(self, kind: _Kind, texts: list[str]) -> Future[list[list[float]]]:
+        job = _Job(kind, list(texts))
+        if not job.texts:
+            job.future.set_result([])
+            return job.future
+        with self._lock:
+            if self._closed or not self._worker.is_alive():
+                job.future.set_exception(
+                    RuntimeError("Local embedding runtime is closed.")
+                )
+            else:
+                self._queue.put(job)
+        return job.future
+
+    def _run(self) -> None:
+        while True:
+            job = self._deferred.popleft() if self._deferred else self._queue.get()
+            if job is None:
+                break
+            jobs = [job]
+            if job.kind == "query":
+                jobs += self._collect_queries(len(job.texts))
+            self._execute(jobs)
+        while self._deferred:
+            self._execute([self._deferred.popleft()])
+
+    def _collect_queries(self, size: int) -> list[_Job]:
+        """Gather queries queued shortly after the first one into the same batch."""
+        jobs: list[_Job] = []
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                job = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if job is None or job.kind != "query":
+                # Keep the order of other jobs and the shutdown sentinel.
+                self._deferred.append(job)  # type: ignore[arg-type]
+                break
+            jobs.append(job)
+            size += len(job.texts)
+        return jobs
+
+    def _execute(self, jobs: list[_Job]) -> None:
+        texts = [text for job in jobs for text in job.texts]
+        try:
+            embeddings = self._embed(jobs[0].kind, texts)
+        except BaseException as e:
+            for job in jobs:
+                job.future.set_exception(e)
+            return
+        self._batches += 1
+        self._embedded_texts += len(texts)
+        offset = 0
+        for job in jobs:
+            job.future.set_result(embeddings[offset : offset + len(job.texts)])
+            offset += len(job.texts)
+
+    def _embed(self, kind: _Kind, texts: list[str]) -> list[list[float]]:
+        model = self._load()
+        if kind == "document":
+            return model.embed_documents(texts)
+        embed = getattr(model, "embed", None)
+        if callable(embed):
+            # Nomic models embed queries with a dedicated task type.
+            return list(embed(texts, task_type="search_query"))
+        return [model.embed_query(text) for text in texts]
+
+    def _load(self) -> Embeddings:
+        if self._embeddings is None:
+            rss_before = _rss_bytes()
+            started = time.perf_counter()
+            self._embeddings = self._loader()
+            self._load_seconds = time.perf_counter() - started
+            self._memory_bytes = max(_rss_bytes() - rss_before, 0)
+            logger.info(
+                f"Loaded local embedding model {self.model} in "
+                f"{self._load_seconds:.2f}s ({self._memory_bytes / 2**20:.1f} MiB)"
+            )
+        return self._embeddings
+
+
+_runtimes: dict[str, LocalEmbeddingRuntime] = {}
+_runtimes_lock = threading.Lock()
+
+
+def get_local_embedder(model: str) -> LocalEmbeddingRuntime:
+    """Return the process-wide runtime for a local Nomic model."""
+    with _runtimes_lock:
+        runtime = _runtimes.get(model)
+        if runtime is None:
+            runtime = _runtimes[model] = LocalEmbeddingRuntime(model)
+        return runtime
+
+
+def local_embedding_stats() -> list[LocalEmbeddingStats]:
+    """Return the statistics of every local embedding runtime in this process."""
+    with _runtimes_lock:
+        return [runtime.stats() for runtime in _runtimes.values()]
+
+
+@atexit.register
+def shutdown_local_embedders() -> None:
+    """Stop every local embedding runtime."""
+    with _runtimes_lock:
+        runtimes = list(_runtimes.values())
+        _runtimes.clear()
+    for runtime in runtimes:
+        runtime.close()
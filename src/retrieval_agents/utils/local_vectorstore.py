@@ -0,0 +1,796 @@
+"""Embedded vector store backed by memory-mapped NumPy arrays.
+
+Vectors are normalized and stored as the rows of a memory-mapped float32,
+float16 or int8 matrix (int8 rows carry a float32 scale), so opening a store
+maps its files instead of reading them and a search only pages in the rows it
+scans. Texts and metadata live in a SQLite side table together with the row
+ranges of every user: rows are appended in per-user runs, so a search filtered
+on a user only scans that user's ranges. Search is an exact top-k by dot
+product over normalized vectors, i.e. cosine similarity.
+
+With ``index="ivfpq"``, a store of ``ANN_TRAIN_MIN_ROWS`` rows or more trains an
+IVF-PQ index (see ``ivfpq``) and then searches approximately: only the rows of
+the ``nprobe`` lists closest to the query are scored from their codes, and the
+best ``k * refine`` of them are re-scored exactly. Rows are assigned and encoded
+as they are appended, the index is retrained whenever the store has grown
+``ANN_RETRAIN_GROWTH``-fold since it was trained, and it is persisted next to
+the vectors.
+
+Deleting or overwriting a chunk tombstones its row; ``compact`` rewrites the
+store without tombstoned rows and with the rows of every user in a single
+range. The store assumes a single writing process.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from typing import Any, Callable, Iterable, Literal, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from retrieval_agents.utils.ivfpq import IvfPqIndex
+
+_Dtype = Literal["float32", "float16", "int8"]
+_Index = Literal["flat", "ivfpq"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    row INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    user_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ranges (
+    user_id TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    stop INTEGER NOT NULL,
+    PRIMARY KEY (user_id, start)
+);
+"""
+
+# SQLite limits the number of host parameters in a single statement.
+_MAX_PARAMS = 500
+
+# Rows scored at once; bounds the temporary float32 copy of float16/int8 rows.
+SCAN_BLOCK_ROWS = 4096
+
+_INITIAL_CAPACITY = 1024
+_COMPACTED_SUFFIX = ".compacted"
+_INDEX_FILE = "ivfpq.npz"
+
+ANN_TRAIN_MIN_ROWS = 20_000
+"""Number of rows from which an ``ivfpq`` store trains its index."""
+
+ANN_RETRAIN_GROWTH = 4
+"""Growth of the store since the index was trained from which it is retrained."""
+
+ANN_TRAIN_SAMPLE = 25_000
+"""Maximum number of rows the index is trained on."""
+
+DEFAULT_NPROBE = 16
+"""Number of lists searched, unless ``nprobe`` is passed to the search."""
+
+DEFAULT_REFINE = 16
+"""Ratio of candidates re-scored exactly to results, unless ``refine`` is passed."""
+
+
+class LocalVectorStore(VectorStore):
+    """Vector store kept in a local directory of memory-mapped files."""
+
+    def __init__(
+        self,
+        path: str,
+        embedding: Embeddings,
+        dtype: _Dtype = "float32",
+        index: _Index = "flat",
+    ) -> None:
+        """Open or create the store.
+
+        Args:
+            path (str): Directory of the store.
+            embedding (Embeddings): Encoder of texts and queries.
+            dtype (Literal["float32", "float16", "int8"]): Storage precision of
+                the vectors of a new store. An existing store keeps its own.
+            index (Literal["flat", "ivfpq"]): Exact search, or approximate
+                search once the store is large enough. Rows appended while the
+                store was opened ``flat`` are indexed when it is next opened
+                ``ivfpq``.
+        """
+        if dtype not in ("float32", "float16", "int8"):
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+        if index not in ("flat", "ivfpq"):
+            raise ValueError(f"Unsupported index: {index}")
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.embedding = embedding
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(
+            os.path.join(path, "meta.sqlite3"), check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        settings = self._settings()
+        self.dtype: _Dtype = settings.get("dtype", dtype)  # type: ignore[assignment]
+        self.dim: Optional[int] = int(settings["dim"]) if "dim" in settings else None
+        self._count = int(settings.get("count", 0))
+        self._ranges: dict[str, list[tuple[int, int]]] = {}
+        self._vectors: Optional[np.memmap] = None
+        self._scales: Optional[np.memmap] = None
+        self._alive: Optional[np.memmap] = None
+        self._lists: Optional[np.memmap] = None
+        self._codes: Optional[np.memmap] = None
+        self._capacity = 0
+        self.index = index
+        self._ivf: Optional[IvfPqIndex] = None
+        self._postings: Optional[list[np.ndarray]] = None
+        self._finish_compaction(settings.get("compacting") == "1")
+        if index == "ivfpq" and os.path.exists(self._file(_INDEX_FILE)):
+            self._ivf = IvfPqIndex.load(self._file(_INDEX_FILE))
+        if self.dim is not None:
+            row_bytes = self.dim * np.dtype(self.dtype).itemsize
+            on_disk = os.path.getsize(self._file("vectors.bin")) // row_bytes
+            self._map(max(on_disk, self._count))
+            if index == "ivfpq":
+                with self._conn:
+                    self._index_rows(int(settings.get("indexed", 0)))
+
+    @property
+    def embeddings(self) -> Embeddings:
+        """Encoder of texts and queries."""
+        return self.embedding
+
+    def __len__(self) -> int:
+        """Return the number of live chunks."""
+        with self._lock:
+            return int(self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0])
+
+    ## Writes
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[list[dict[str, Any]]] = None,
+        *,
+        ids: Optional[list[str]] = None,
+        **kwargs: Any,
+    ) -> list[str]:
+        """Embed and upsert texts."""
+        texts = list(texts)
+        if ids is None:
+            ids = [str(uuid.uuid4()) for _ in texts]
+        vectors = self.embedding.embed_documents(texts)
+        return self.add_vectors(ids, vectors, texts, metadatas)
+
+    def add_vectors(
+        self,
+        ids: Sequence[str],
+        vectors: Sequence[Sequence[float]],
+        texts: Sequence[str],
+        metadatas: Optional[Sequence[dict[str, Any]]] = None,
+    ) -> list[str]:
+        """Upsert embedded texts.
+
+        Rows are appended grouped by ``user_id`` metadata, so that the chunks of
+        a user written together form one range. The previous rows of the IDs
+        are tombstoned.
+
+        Args:
+            ids (Sequence[str]): IDs of the texts.
+            vectors (Sequence[Sequence[float]]): Embeddings of the texts.
+            texts (Sequence[str]): The texts.
+            metadatas (Optional[Sequence[dict]]): Metadata of the texts.
+
+        Returns:
+            list[str]: The IDs.
+        """
+        metadatas = metadatas or [{} for _ in ids]
+        # The last occurrence of an ID wins.
+        latest = {id_: i for i, id_ in enumerate(ids)}
+        order = sorted(
+            latest.values(), key=lambda i: (str(metadatas[i].get("user_id", "")), i)
+        )
+        if not order:
+            return []
+        matrix = np.asarray(vectors, dtype=np.float32)[order]
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1, norms)
+        with self._lock, self._conn:
+            if self.dim is None:
+                self.dim = matrix.shape[1]
+                self._set("dim", self.dim)
+                self._set("dtype", self.dtype)
+                self._map(_INITIAL_CAPACITY)
+            elif matrix.shape[1] != self.dim:
+                raise ValueError(
+                    f"Expected vectors of dimension {self.dim}, got {matrix.shape[1]}"
+                )
+            self._tombstone([ids[i] for i in order])
+            start, stop = self._count, self._count + len(order)
+            if stop > self._capacity:
+                self._map(max(stop, 2 * self._capacity))
+            assert self._vectors is not None and self._alive is not None
+            if self._scales is not None:
+                scales = np.abs(matrix).max(axis=1) / 127
+                scales[scales == 0] = 1
+                self._vectors[start:stop] = np.rint(matrix / scales[:, None])
+                self._scales[start:stop] = scales
+            else:
+                self._vectors[start:stop] = matrix
+            self._alive[start:stop] = 1
+            self._flush()
+            self._conn.executemany(
+                "INSERT INTO chunks (row, id, user_id, text, metadata) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (
+                        start + n,
+                        ids[i],
+                        str(metadatas[i].get("user_id", "")),
+                        texts[i],
+                        json.dumps(metadatas[i]),
+                    )
+                    for n, i in enumerate(order)
+                ],
+            )
+            run_start = start
+            for n in range(1, len(order) + 1):
+                user_id = str(metadatas[order[n - 1]].get("user_id", ""))
+                if (
+                    n == len(order)
+                    or str(metadatas[order[n]].get("user_id", "")) != user_id
+                ):
+                    self._add_range(user_id, run_start, start + n)
+                    run_start = start + n
+            self._count = stop
+            self._set("count", stop)
+            self._ranges.clear()
+            if self.index == "ivfpq":
+                self._index_rows(start)
+        return [ids[i] for i in order]
+
+    def delete(self, ids: Optional[list[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """Tombstone the rows of the given IDs."""
+        if ids is None:
+            raise ValueError("IDs of the chunks to delete are required.")
+        with self._lock, self._conn:
+            self._tombstone(ids)
+            self._flush()
+        return True
+
+    def compact(self) -> int:
+        """Rewrite the store without tombstoned rows, one range per user.
+
+        Returns:
+            int: The number of rows reclaimed.
+        """
+        with self._lock:
+            if self.dim is None:
+                return 0
+            assert self._vectors is not None
+            rows = self._conn.execute(
+                "SELECT row, user_id FROM chunks ORDER BY user_id, row"
+            ).fetchall()
+            old_rows = np.array([row for row, _ in rows], dtype=np.int64)
+            size = len(rows)
+            capacity = max(size, _INITIAL_CAPACITY)
+            for name, array in self._arrays().items():
+                if array is None:
+                    continue
+                compacted = np.memmap(
+                    self._file(name) + _COMPACTED_SUFFIX,
+                    dtype=array.dtype,
+                    mode="w+",
+                    shape=(capacity, *array.shape[1:]),
+                )
+                for i in range(0, size, SCAN_BLOCK_ROWS):
+                    block = old_rows[i : i + SCAN_BLOCK_ROWS]
+                    compacted[i : i + len(block)] = array[block]
+                compacted.flush()
+                del compacted
+            with self._conn:
+                self._set("compacting", 1)
+                self._conn.execute("CREATE TEMP TABLE remap (old INTEGER, new INTEGER)")
+                self._conn.executemany(
+                    "INSERT INTO remap VALUES (?, ?)",
+                    [(row, new) for new, (row, _) in enumerate(rows)],
+                )
+                # Negative rows avoid collisions while renumbering.
+                self._conn.execute(
+                    "UPDATE chunks SET row = "
+                    "(SELECT -1 - new FROM remap WHERE old = chunks.row)"
+                )
+                self._conn.execute("UPDATE chunks SET row = -1 - row")
+                self._conn.execute("DROP TABLE remap")
+                self._conn.execute("DELETE FROM ranges")
+                start = 0
+                for n in range(1, size + 1):
+                    if n == size or rows[n][1] != rows[n - 1][1]:
+                        self._add_range(rows[n - 1][1], start, n)
+                        start = n
+                reclaimed = self._count - size
+                self._count = size
+                self._set("count", size)
+                # Codes that were not mapped were not compacted either.
+                self._set("indexed", size if self._ivf is not None else 0)
+            self._vectors = self._scales = self._alive = None
+            self._lists = self._codes = None
+            self._postings = None
+            self._finish_compaction(True)
+            self._map(capacity)
+            self._ranges.clear()
+            return reclaimed
+
+    def build_index(self, nlist: Optional[int] = None) -> None:
+        """Train the IVF-PQ index on a sample of the live rows and encode every row.
+
+        An ``ivfpq`` store trains its index once it reaches
+        ``ANN_TRAIN_MIN_ROWS`` rows and as it grows; call this to retrain it
+        after many overwrites, or to choose the number of lists.
+
+        Args:
+            nlist (Optional[int]): Number of lists. Defaults to about four times
+                the square root of the number of live rows.
+        """
+        with self._lock, self._conn:
+            self._train_index(nlist)
+
+    def close(self) -> None:
+        """Flush the vectors and close the side table."""
+        with self._lock:
+            self._flush()
+            self._vectors = self._scales = self._alive = None
+            self._lists = self._codes = None
+            self._conn.close()
+
+    ## Reads
+
+    def get_by_ids(self, ids: Sequence[str], /) -> list[Document]:
+        """Return the chunks with the given IDs that are in the store."""
+        docs: list[Document] = []
+        with self._lock:
+            for start in range(0, len(ids), _MAX_PARAMS):
+                chunk = list(ids[start : start + _MAX_PARAMS])
+                rows = self._conn.execute(
+                    "SELECT id, text, metadata FROM chunks "
+                    f"WHERE id IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                docs.extend(
+                    Document(id=id_, page_content=text, metadata=json.loads(metadata))
+                    for id_, text, metadata in rows
+                )
+        return docs
+
+    def similarity_search(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> list[Document]:
+        """Return the chunks most similar to a query."""
+        return [
+            doc
+            for doc, _ in self.similarity_search_with_score(query, k, filter, **kwargs)
+        ]
+
+    def similarity_search_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> list[tuple[Document, float]]:
+        """Return the chunks most similar to a query with their cosine similarity."""
+        return self.similarity_search_with_score_by_vector(
+            self.embedding.embed_query(query), k, filter, **kwargs
+        )
+
+    def similarity_search_by_vector(
+        self,
+        embedding: list[float],
+        k: int = 4,
+        filter: Optional[dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> list[Document]:
+        """Return the chunks most similar to an embedding."""
+        return [
+            doc
+            for doc, _ in self.similarity_search_with_score_by_vector(
+                embedding, k, filter, **kwargs
+            )
+        ]
+
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: list[float],
+        k: int = 4,
+        filter: Optional[dict[str, Any]] = None,
+        *,
+        nprobe: int = DEFAULT_NPROBE,
+        refine: int = DEFAULT_REFINE,
+        exact: bool = False,
+        **kwargs: Any,
+    ) -> list[tuple[Document, float]]:
+        """Return the chunks most similar to an embedding with their scores.
+
+        Args:
+            embedding (list[float]): Query embedding.
+            k (int): Number of chunks to return.
+            filter (Optional[dict[str, Any]]): Metadata values the chunks must
+                have. ``user_id`` restricts the scan to the ranges of the user;
+                other keys are checked on the best candidates.
+            nprobe (int): Number of lists searched by the IVF-PQ index. More
+                lists raise recall and latency.
+            refine (int): Ratio of candidates re-scored exactly to ``k``.
+            exact (bool): Scan every row even if the store has an index.
+
+        Returns:
+            list[tuple[Document, float]]: Chunks by decreasing cosine similarity.
+        """
+        with self._lock:
+            return [
+                (doc, score)
+                for doc, score, _ in self._search(
+                    embedding, k, filter, nprobe, refine, exact
+                )
+            ]
+
+    def similarity_search_with_vectors(
+        self,
+        embedding: list[float],
+        k: int = 4,
+        filter: Optional[dict[str, Any]] = None,
+        *,
+        nprobe: int = DEFAULT_NPROBE,
+        refine: int = DEFAULT_REFINE,
+        exact: bool = False,
+        **kwargs: Any,
+    ) -> list[tuple[Document, np.ndarray]]:
+        """Return the chunks most similar to an embedding with their normalized vectors.
+
+        Takes the same arguments as ``similarity_search_with_score_by_vector``.
+        """
+        with self._lock:
+            results = self._search(embedding, k, filter, nprobe, refine, exact)
+            if not results:
+                return []
+            vectors = self._vectors_at(np.array([row for _, _, row in results]))
+        return [(doc, vector) for (doc, _, _), vector in zip(results, vectors)]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        # Map cosine similarity from [-1, 1] to [0, 1].
+        return lambda score: (score + 1) / 2
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: list[str],
+        embedding: Embeddings,
+        metadatas: Optional[list[dict[str, Any]]] = None,
+        *,
+        ids: Optional[list[str]] = None,
+        path: str = "",
+        dtype: _Dtype = "float32",
+        index: _Index = "flat",
+        **kwargs: Any,
+    ) -> LocalVectorStore:
+        """Create a store in ``path`` holding the texts."""
+        store = cls(path, embedding, dtype=dtype, index=index)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
+
+    ## Internals
+
+    def _search(
+        self,
+        embedding: list[float],
+        k: int,
+        filter: Optional[dict[str, Any]],
+        nprobe: int,
+        refine: int,
+        exact: bool,
+    ) -> list[tuple[Document, float, int]]:
+        """Return the best chunks passing the filter, their scores and rows."""
+        where = dict(filter or {})
+        user_id = where.pop("user_id", None)
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1
+        if self.dim is None or k <= 0:
+            return []
+        ranges = (
+            self._user_ranges(str(user_id))
+            if user_id is not None
+            else [(0, self._count)]
+        )
+        n_candidates = k
+        while True:
+            if self._ivf is None or exact:
+                rows, scores = self._top_rows(query, n_candidates, ranges)
+            else:
+                rows, scores = self._top_rows_ann(
+                    query, n_candidates, ranges, nprobe, refine
+                )
+            results = [
+                (doc, score, row)
+                for doc, score, row in zip(
+                    self._documents(rows), scores.tolist(), rows.tolist()
+                )
+                if doc is not None
+                and all(doc.metadata.get(key) == v for key, v in where.items())
+            ]
+            if len(results) >= k or len(rows) < n_candidates:
+                return results[:k]
+            n_candidates *= 4
+
+    def _top_rows(
+        self, query: np.ndarray, k: int, ranges: list[tuple[int, int]]
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Return the ``k`` best live rows of the ranges and their scores."""
+        assert self._vectors is not None and self._alive is not None
+        all_rows, all_scores = [], []
+        for start, stop in ranges:
+            for s in range(start, stop, SCAN_BLOCK_ROWS):
+                e = min(stop, s + SCAN_BLOCK_ROWS)
+                block = self._vectors[s:e]
+                if block.dtype != np.float32:
+                    block = block.astype(np.float32)
+                scores = block @ query
+                if self._scales is not None:
+                    scores *= self._scales[s:e]
+                scores[self._alive[s:e] == 0] = -np.inf
+                if e - s > k:
+                    best = np.argpartition(scores, -k)[-k:]
+                    all_rows.append(best + s)
+                    all_scores.append(scores[best])
+                else:
+                    all_rows.append(np.arange(s, e))
+                    all_scores.append(scores)
+        if not all_rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        rows = np.concatenate(all_rows)
+        scores = np.concatenate(all_scores)
+        order = np.argsort(-scores, kind="stable")[:k]
+        order = order[np.isfinite(scores[order])]
+        return rows[order], scores[order]
+
+    def _top_rows_ann(
+        self,
+        query: np.ndarray,
+        k: int,
+        ranges: list[tuple[int, int]],
+        nprobe: int,
+        refine: int,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Return about the ``k`` best live rows of the ranges and their scores.
+
+        Candidates are the rows of the probed lists, ranked by their approximate
+        scores; the best ``k * refine`` are re-scored exactly.
+        """
+        assert self._ivf is not None and self._alive is not None
+        assert self._codes is not None
+        postings = self._inverted_lists()
+        rows = np.concatenate([postings[p] for p in self._ivf.probe(query, nprobe)])
+        if ranges != [(0, self._count)]:
+            starts = np.array([start for start, _ in ranges], dtype=np.int64)
+            stops = np.array([stop for _, stop in ranges], dtype=np.int64)
+            i = np.searchsorted(starts, rows, side="right") - 1
+            rows = rows[(i >= 0) & (rows < stops[np.maximum(i, 0)])]
+        rows = rows[self._alive[rows] == 1]
+        n_candidates = k * max(refine, 1)
+        if len(rows) > n_candidates:
+            approximate = self._ivf.approximate_scores(
+                self._ivf.lookup_table(query), self._codes[rows]
+            )
+            rows = rows[np.argpartition(approximate, -n_candidates)[-n_candidates:]]
+        # Sorted rows read the memory map sequentially.
+        rows = np.sort(rows)
+        scores = self._vectors_at(rows) @ query
+        order = np.argsort(-scores, kind="stable")[:k]
+        return rows[order], scores[order]
+
+    def _vectors_at(self, rows: np.ndarray) -> np.ndarray:
+        """Return the normalized float32 vectors of the rows."""
+        assert self._vectors is not None
+        vectors = np.asarray(self._vectors[rows], dtype=np.float32)
+        if self._scales is not None:
+            vectors *= self._scales[rows, None]
+        return vectors
+
+    def _index_rows(self, start: int) -> None:
+        """Assign and encode the rows from ``start`` on, training the index if due."""
+        due = self._ivf is None or self._count >= ANN_RETRAIN_GROWTH * int(
+            self._settings().get("trained", 0)
+        )
+        if due and self._count >= ANN_TRAIN_MIN_ROWS:
+            self._train_index(None)
+            return
+        if self._ivf is None:
+            return
+        assert self._lists is not None and self._codes is not None
+        for s in range(start, self._count, SCAN_BLOCK_ROWS):
+            e = min(self._count, s + SCAN_BLOCK_ROWS)
+            block = self._vectors_at(np.arange(s, e))
+            self._lists[s:e] = self._ivf.assign(block)
+            self._codes[s:e] = self._ivf.encode(block)
+        self._flush()
+        if self._postings is not None and start < self._count:
+            new_rows = _group(self._lists[start : self._count], start, self._ivf.nlist)
+            for p, rows in enumerate(new_rows):
+                if len(rows):
+                    self._postings[p] = np.concatenate([self._postings[p], rows])
+        self._set("indexed", self._count)
+
+    def _train_index(self, nlist: Optional[int]) -> None:
+        if self.dim is None:
+            return
+        assert self._alive is not None
+        alive = np.flatnonzero(self._alive[: self._count])
+        if not len(alive):
+            return
+        sample = np.random.default_rng(0).choice(
+            alive, min(len(alive), ANN_TRAIN_SAMPLE), replace=False
+        )
+        if nlist is None:
+            # About 4 sqrt(n) lists, each with enough sample rows to train on.
+            nlist = int(min(4 * np.sqrt(len(alive)), len(sample) / 32, 65_536))
+        self._ivf = IvfPqIndex.train(self._vectors_at(np.sort(sample)), max(nlist, 1))
+        self._ivf.save(self._file(_INDEX_FILE))
+        self._set("trained", self._count)
+        self._postings = None
+        self._map(self._capacity)
+        self._index_rows(0)
+
+    def _inverted_lists(self) -> list[np.ndarray]:
+        """Return the rows of every list, grouped from the row-aligned list numbers."""
+        assert self._ivf is not None and self._lists is not None
+        if self._postings is None:
+            self._postings = _group(self._lists[: self._count], 0, self._ivf.nlist)
+        return self._postings
+
+    def _documents(self, rows: np.ndarray) -> list[Optional[Document]]:
+        found: dict[int, Document] = {}
+        for start in range(0, len(rows), _MAX_PARAMS):
+            chunk = rows[start : start + _MAX_PARAMS].tolist()
+            for row, id_, text, metadata in self._conn.execute(
+                "SELECT row, id, text, metadata FROM chunks "
+                f"WHERE row IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ):
+                found[row] = Document(
+                    id=id_, page_content=text, metadata=json.loads(metadata)
+                )
+        return [found.get(row) for row in rows.tolist()]
+
+    def _user_ranges(self, user_id: str) -> list[tuple[int, int]]:
+        ranges = self._ranges.get(user_id)
+        if ranges is None:
+            ranges = self._ranges[user_id] = self._conn.execute(
+                "SELECT start, stop FROM ranges WHERE user_id = ? ORDER BY start",
+                (user_id,),
+            ).fetchall()
+        return ranges
+
+    def _add_range(self, user_id: str, start: int, stop: int) -> None:
+        extended = self._conn.execute(
+            "UPDATE ranges SET stop = ? WHERE user_id = ? AND stop = ?",
+            (stop, user_id, start),
+        ).rowcount
+        if not extended:
+            self._conn.execute(
+                "INSERT INTO ranges (user_id, start, stop) VALUES (?, ?, ?)",
+                (user_id, start, stop),
+            )
+
+    def _tombstone(self, ids: Sequence[str]) -> None:
+        for start in range(0, len(ids), _MAX_PARAMS):
+            chunk = list(ids[start : start + _MAX_PARAMS])
+            placeholders = ",".join("?" * len(chunk))
+            rows = [
+                row
+                for (row,) in self._conn.execute(
+                    f"SELECT row FROM chunks WHERE id IN ({placeholders})", chunk
+                )
+            ]
+            if rows:
+                assert self._alive is not None
+                self._alive[rows] = 0
+                self._conn.execute(
+                    f"DELETE FROM chunks WHERE id IN ({placeholders})", chunk
+                )
+
+    def _set(self, key: str, value: Any) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+            (key, str(value)),
+        )
+
+    def _settings(self) -> dict[str, str]:
+        return dict(self._conn.execute("SELECT key, value FROM settings"))
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _arrays(self) -> dict[str, Optional[np.memmap]]:
+        return {
+            "vectors.bin": self._vectors,
+            "scales.bin": self._scales,
+            "alive.bin": self._alive,
+            "lists.bin": self._lists,
+            "codes.bin": self._codes,
+        }
+
+    def _map(self, capacity: int) -> None:
+        """Map the files with room for ``capacity`` rows, growing them if needed."""
+        assert self.dim is not None
+        self._flush()
+        specs: dict[str, tuple[Any, tuple[int, ...]]] = {
+            "vectors.bin": (np.dtype(self.dtype), (capacity, self.dim)),
+            "alive.bin": (np.dtype(np.uint8), (capacity,)),
+        }
+        if self.dtype == "int8":
+            specs["scales.bin"] = (np.dtype(np.float32), (capacity,))
+        if self._ivf is not None:
+            specs["lists.bin"] = (np.dtype(np.int32), (capacity,))
+            specs["codes.bin"] = (np.dtype(np.uint8), (capacity, self._ivf.m))
+        arrays = {}
+        for name, (dtype, shape) in specs.items():
+            size = int(np.prod(shape)) * dtype.itemsize
+            with open(self._file(name), "ab") as f:
+                if f.tell() < size:
+                    # Sparse on most file systems: pages are allocated on write.
+                    f.truncate(size)
+            arrays[name] = np.memmap(
+                self._file(name), dtype=dtype, mode="r+", shape=shape
+            )
+        self._vectors = arrays["vectors.bin"]
+        self._alive = arrays["alive.bin"]
+        self._scales = arrays.get("scales.bin")
+        self._lists = arrays.get("lists.bin")
+        self._codes = arrays.get("codes.bin")
+        self._capacity = capacity
+
+    def _flush(self) -> None:
+        for array in self._arrays().values():
+            if array is not None:
+                array.flush()
+
+    def _finish_compaction(self, committed: bool) -> None:
+        """Swap in compacted files, or discard them if compaction did not commit."""
+        for name in self._arrays():
+            compacted = self._file(name) + _COMPACTED_SUFFIX
+            if not os.path.exists(compacted):
+                continue
+            if committed:
+                os.replace(compacted, self._file(name))
+            else:
+                os.remove(compacted)
+        if committed:
+            with self._conn:
+                self._conn.execute("DELETE FROM settings WHERE key = 'compacting'")
+
+
+def _group(lists: np.ndarray, offset: int, nlist: int) -> list[np.ndarray]:
+    """Return the rows of every list, given the list of every row from ``offset``.
+
+    >>> _group(np.array([2, 0, 2]), 10, 3)
+    [array([11]), array([], dtype=int64), array([10, 12])]
+    """
+    order = np.argsort(lists, kind="stable")
+    bounds = np.searchsorted(lists[order], np.arange(nlist + 1))
+    return [
+        order[bounds[p] : bounds[p + 1]].astype(np.int64) + offset for p in range(nlist)
+    ]
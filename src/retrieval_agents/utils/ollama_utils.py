@@ -1,15 +1,224 @@
-"""Utilities for Ollama."""
+"""Utilities for Ollama.
 
+The Ollama server is managed once per process: an already running server is
+reused, otherwise ``ollama serve`` is started on first use and stopped at exit.
+The models present locally are cached, so a model is pulled at most once even
+when several requests need it concurrently. Everything goes through the
+``ollama`` command line, so a stub binary on ``PATH`` can stand in for it.
+"""
 
-def run_ollama() -> int:
+from __future__ import annotations
+
+import atexit
+import logging
+import subprocess
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class OllamaError(RuntimeError):
+    """Raised when the Ollama server cannot be started or a model cannot be pulled."""
+
+
+def _normalize(model: str) -> str:
+    """Return the model name with its tag, as listed by ``ollama list``.
+
+    >>> _normalize("llama3.1")
+    'llama3.1:latest'
+    >>> _normalize("llama3.1:8b")
+    'llama3.1:8b'
+    """
+    return model if ":" in model else f"{model}:latest"
+
+
+class OllamaManager:
+    """Process-wide manager of an Ollama server and its local models."""
+
+    def __init__(
+        self,
+        binary: str = "ollama",
+        startup_timeout: float = 30.0,
+        command_timeout: float = 10.0,
+        poll_interval: float = 0.1,
+    ) -> None:
+        """Initialize the manager without starting anything.
+
+        Args:
+            binary (str): Name or path of the ``ollama`` executable.
+            startup_timeout (float): Seconds to wait for a started server to respond.
+            command_timeout (float): Timeout of health checks in seconds.
+            poll_interval (float): Seconds between health checks during startup.
+        """
+        self.binary = binary
+        self.startup_timeout = startup_timeout
+        self.command_timeout = command_timeout
+        self.poll_interval = poll_interval
+        self._process: Optional[subprocess.Popen[bytes]] = None
+        self._ready = False
+        self._server_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._models: set[str] = set()
+        self._pull_locks: dict[str, threading.Lock] = {}
+
+    @property
+    def pid(self) -> Optional[int]:
+        """PID of the server started by this manager, if any."""
+        return self._process.pid if self._process is not None else None
+
+    def is_healthy(self) -> bool:
+        """Return whether the server responds to ``ollama list``."""
+        return self._list_models() is not None
+
+    def ensure_server(self) -> None:
+        """Make sure that a server is running, starting one if needed.
+
+        Raises:
+            OllamaError: If the started server exits or does not become healthy.
+        """
+        with self._server_lock:
+            if self._ready and (self._process is None or self._process.poll() is None):
+                return
+            self._ready = False
+            models = self._list_models()
+            if models is None:
+                models = self._start()
+            with self._lock:
+                self._models = models
+            self._ready = True
+
+    def ensure_model(self, model: str) -> None:
+        """Make sure that ``model`` is available locally, pulling it on first use.
+
+        Raises:
+            OllamaError: If the server cannot be started or the pull fails.
+        """
+        self.ensure_server()
+        name = _normalize(model)
+        with self._lock:
+            if name in self._models:
+                return
+            pull_lock = self._pull_locks.setdefault(name, threading.Lock())
+        with pull_lock:
+            with self._lock:
+                if name in self._models:
+                    return
+            logger.info(f"Pulling ollama model {model}")
+            result = subprocess.run(
+                [self.binary, "pull", model], capture_output=True, text=True
+            )
+            if result.returncode != 0:
+                raise OllamaError(
+                    f"Failed to pull ollama model {model}: {result.stderr.strip()}"
+                )
+            with self._lock:
+                self._models.add(name)
+                self._pull_locks.pop(name, None)
+
+    def local_models(self) -> set[str]:
+        """Return the cached names of the models present locally."""
+        with self._lock:
+            return set(self._models)
+
+    def shutdown(self, timeout: float = 10.0) -> None:
+        """Stop the server if this manager started it."""
+        with self._server_lock:
+            self._ready = False
+            self._stop(timeout)
+
+    def _start(self) -> set[str]:
+        logger.info("Starting ollama serve")
+        try:
+            self._process = subprocess.Popen(
+                [self.binary, "serve"],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        except OSError as e:
+            raise OllamaError(f"Failed to start ollama serve: {e}") from e
+        deadline = time.monotonic() + self.startup_timeout
+        while True:
+            models = self._list_models()
+            if models is not None:
+                logger.info(f"Ollama server started with PID {self._process.pid}")
+                return models
+            returncode = self._process.poll()
+            if returncode is not None:
+                self._process = None
+                raise OllamaError(f"ollama serve exited with code {returncode}")
+            if time.monotonic() > deadline:
+                self._stop()
+                raise OllamaError(
+                    f"ollama serve did not respond within {self.startup_timeout}s"
+                )
+            time.sleep(self.poll_interval)
+
+    def _stop(self, timeout: float = 10.0) -> None:
+        process, self._process = self._process, None
+        if process is None or process.poll() is not None:
+            return
+        logger.info(f"Stopping ollama server with PID {process.pid}")
+        process.terminate()
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    def _list_models(self) -> Optional[set[str]]:
+        """Return the local models, or None if the server is not reachable."""
+        try:
+            result = subprocess.run(
+                [self.binary, "list"],
+                capture_output=True,
+                text=True,
+                timeout=self.command_timeout,
+            )
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+        if result.returncode != 0:
+            return None
+        # The first line is the header: NAME  ID  SIZE  MODIFIED
+        return {
+            _normalize(line.split()[0])
+            for line in result.stdout.splitlines()[1:]
+            if line.strip()
+        }
+
+
+_manager: Optional[OllamaManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_ollama_manager() -> OllamaManager:
+    """Return the process-wide Ollama manager."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = OllamaManager()
+        return _manager
+
+
+def run_ollama() -> Optional[int]:
     """Run Ollama.
 
+    Starts the server at most once per process; an already running server is
+    reused.
+
     Returns:
-        int: PID
+        Optional[int]: PID of the server started by this process, if any.
     """
-    import subprocess
+    manager = get_ollama_manager()
+    manager.ensure_server()
+    return manager.pid
+
 
-    process = subprocess.Popen(
-        ["ollama", "serve"], stdout=subprocess.PIPE, stderr=subprocess.PIPE
-    )
-    return process.pid
+@atexit.register
+def shutdown_ollama() -> None:
+    """Stop the Ollama server started by this process, if any."""
+    with _manager_lock:
+        manager = _manager
+    if manager is not None:
+        manager.shutdown()
@@ -0,0 +1,196 @@
+"""Building blocks for streaming pipelines over bounded asyncio queues.
+
+A pipeline is a chain of stages connected by bounded queues. Each stage runs
+one or more workers that take items from their inbox and put results into
+their outbox; a full outbox blocks the producing stage, so memory use is
+bounded by the queue sizes instead of by the size of the input. Every stage
+counts the items and bytes it handled and the time it was active.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import asdict, dataclass, field
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Generic,
+    Iterable,
+    Optional,
+    TypeVar,
+)
+
+T = TypeVar("T")
+U = TypeVar("U")
+
+
+@dataclass
+class StageStats:
+    """Counters of a pipeline stage."""
+
+    name: str
+    items_in: int = 0
+    items_out: int = 0
+    bytes: int = 0
+    errors: int = 0
+    skipped: int = 0
+    seconds: float = 0.0
+    """Wall time between the first item taken and the last item completed."""
+    _started_at: Optional[float] = field(default=None, repr=False)
+
+    @property
+    def items_per_second(self) -> float:
+        """Throughput of the stage in output items per second."""
+        return self.items_out / self.seconds if self.seconds else 0.0
+
+    def _start(self) -> None:
+        if self._started_at is None:
+            self._started_at = time.monotonic()
+
+    def _stop(self) -> None:
+        if self._started_at is not None:
+            self.seconds = time.monotonic() - self._started_at
+
+
+@dataclass
+class PipelineSummary:
+    """Final counters of a pipeline run."""
+
+    stages: list[StageStats]
+    seconds: float
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the summary as a JSON-serializable dictionary."""
+        return {
+            "seconds": self.seconds,
+            "stages": {
+                s.name: {k: v for k, v in asdict(s).items() if not k.startswith("_")}
+                for s in self.stages
+            },
+        }
+
+    def __str__(self) -> str:
+        """Return a one line per stage report."""
+        lines = [f"pipeline finished in {self.seconds:.2f}s"]
+        for s in self.stages:
+            lines.append(
+                f"  {s.name}: {s.items_in} in, {s.items_out} out, {s.bytes} bytes, "
+                f"{s.errors} errors, {s.skipped} skipped, {s.seconds:.2f}s "
+                f"({s.items_per_second:.1f} items/s)"
+            )
+        return "\n".join(lines)
+
+
+class Channel(Generic[T]):
+    """Bounded queue between two stages that is closed by its producers."""
+
+    def __init__(self, maxsize: int) -> None:
+        """Create a channel holding at most ``maxsize`` items."""
+        self._queue: asyncio.Queue[Any] = asyncio.Queue(maxsize)
+
+    async def put(self, item: T) -> None:
+        """Put an item, waiting while the channel is full."""
+        await self._queue.put(item)
+
+    async def close(self) -> None:
+        """Signal consumers that no more items will be put."""
+        await self._queue.put(_CLOSED)
+
+    async def __aiter__(self) -> AsyncIterator[T]:
+        """Iterate over the items until the channel is closed."""
+        while True:
+            item = await self._queue.get()
+            if item is _CLOSED:
+                # Leave the marker for the other consumers of the channel.
+                await self._queue.put(_CLOSED)
+                return
+            yield item
+
+    def qsize(self) -> int:
+        """Return the number of items waiting in the channel."""
+        return self._queue.qsize()
+
+
+_CLOSED = object()
+
+
+async def run_stage(
+    stats: StageStats,
+    inbox: AsyncIterator[T] | Channel[T],
+    process: Callable[[T], Awaitable[Iterable[U]]],
+    outbox: Optional[Channel[U]] = None,
+    concurrency: int = 1,
+    measure: Callable[[T], int] = lambda _: 0,
+) -> None:
+    """Run ``concurrency`` workers that apply ``process`` to every inbox item.
+
+    The results of ``process`` are put into ``outbox``, which is closed once
+    every worker is done.
+
+    Args:
+        stats (StageStats): Counters updated by the stage.
+        inbox (AsyncIterator[T] | Channel[T]): Items to process.
+        process (Callable[[T], Awaitable[Iterable[U]]]): Coroutine returning the
+            results of one item.
+        outbox (Optional[Channel[U]]): Channel the results are put into.
+        concurrency (int): Number of workers.
+        measure (Callable[[T], int]): Size in bytes of an input item.
+    """
+    iterator = inbox.__aiter__()
+    lock = asyncio.Lock()
+
+    async def next_item() -> tuple[bool, Any]:
+        # Async iterators cannot be advanced concurrently.
+        async with lock:
+            try:
+                return True, await iterator.__anext__()
+            except StopAsyncIteration:
+                return False, None
+
+    async def worker() -> None:
+        while True:
+            ok, item = await next_item()
+            if not ok:
+                return
+            stats._start()
+            stats.items_in += 1
+            stats.bytes += measure(item)
+            results = await process(item)
+            for result in results:
+                stats.items_out += 1
+                if outbox is not None:
+                    await outbox.put(result)
+            stats._stop()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    if outbox is not None:
+        await outbox.close()
+
+
+async def abatched(
+    items: AsyncIterator[T] | Channel[T], size: int
+) -> AsyncIterator[list[T]]:
+    """Group the items of an async iterable into lists of at most ``size`` items."""
+    batch: list[T] = []
+    async for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def run_pipeline(*stages: Awaitable[None]) -> None:
+    """Run the stages concurrently; if one fails, cancel the others and re-raise."""
+    tasks = [asyncio.ensure_future(stage) for stage in stages]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
@@ -0,0 +1,128 @@
+"""Local reranking of retrieved candidates.
+
+A retriever tuned for recall returns more candidates than are worth sending to
+the graders and the response model. The rerankers in this module reorder the
+candidates of a query on the CPU and keep the best few, so that the expensive
+LLM calls see fewer and more relevant tokens:
+
+* ``bm25`` scores the candidates by BM25, with term statistics computed over the
+  candidate set itself in NumPy. It needs no model and takes a few
+  milliseconds for a few dozen chunks, mostly spent splitting them into words.
+* ``cross_encoder`` scores every (query, candidate) pair with a small
+  ``sentence-transformers`` cross-encoder, loaded once per process and run on
+  the blocking I/O executor.
+
+The rerank score of a document is kept in its ``rerank_score`` metadata, next
+to the retrieval ``score``.
+"""
+
+from __future__ import annotations
+
+import logging
+import re
+from typing import Any, Literal, Sequence, cast
+
+import numpy as np
+from langchain_core.documents import Document
+
+from retrieval_agents.utils.blocking import run_blocking
+from retrieval_agents.utils.resource_pool import ResourcePool
+
+logger = logging.getLogger(__name__)
+
+RerankMethod = Literal["none", "bm25", "cross_encoder"]
+
+_cross_encoders: ResourcePool[str, Any] = ResourcePool("cross_encoders", max_size=2)
+
+
+def terms(text: str) -> list[str]:
+    """Return the lowercased words of a text.
+
+    >>> terms("Why does ERR-42 fail?")
+    ['why', 'does', 'err', '42', 'fail']
+    """
+    return re.findall(r"[^\W_]+", text.lower())
+
+
+def bm25_scores(
+    query: str, texts: Sequence[str], k1: float = 1.5, b: float = 0.75
+) -> np.ndarray:
+    """Return the BM25 score of every text for the query.
+
+    Document frequencies and the average length are those of ``texts``: the
+    candidates are scored against each other, not against the whole corpus.
+
+    >>> bm25_scores("disk full", ["disk is full", "disk", "cpu load"]).round(3)
+    array([1.184, 0.606, 0.   ])
+    """
+    vocabulary = {term: i for i, term in enumerate(dict.fromkeys(terms(query)))}
+    if not vocabulary or not texts:
+        return np.zeros(len(texts))
+    tokens = [terms(text) for text in texts]
+    lengths = np.array([len(t) for t in tokens])
+    term_ids = np.array(
+        [vocabulary.get(t, -1) for words in tokens for t in words], dtype=np.int64
+    )
+    doc_ids = np.repeat(np.arange(len(texts)), lengths)
+    hits = term_ids >= 0
+    # Term frequencies of the query terms, one row per text.
+    tf = np.bincount(
+        doc_ids[hits] * len(vocabulary) + term_ids[hits],
+        minlength=len(texts) * len(vocabulary),
+    ).reshape(len(texts), len(vocabulary))
+    df = np.count_nonzero(tf, axis=0)
+    idf = np.log1p((len(texts) - df + 0.5) / (df + 0.5))
+    norm = k1 * (1 - b + b * lengths / max(lengths.mean(), 1))
+    return cast(np.ndarray, (tf * (k1 + 1) / (tf + norm[:, None])) @ idf)
+
+
+def _load_cross_encoder(model: str) -> Any:
+    from sentence_transformers import CrossEncoder
+
+    return CrossEncoder(model, device="cpu")
+
+
+async def cross_encoder_scores(
+    query: str, texts: Sequence[str], model: str
+) -> np.ndarray:
+    """Return the score of every text for the query given by a cross-encoder."""
+    encoder = await _cross_encoders.aget(model, lambda: _load_cross_encoder(model))
+    scores = await run_blocking(encoder.predict, [(query, text) for text in texts])
+    return np.asarray(scores, dtype=np.float64)
+
+
+async def arerank(
+    query: str,
+    documents: Sequence[Document],
+    method: RerankMethod,
+    top_m: int,
+    model: str = "",
+) -> list[Document]:
+    """Return the ``top_m`` documents that best match the query, best first.
+
+    Args:
+        query (str): The search query.
+        documents (Sequence[Document]): The candidates to rerank.
+        method (RerankMethod): The reranker; ``none`` keeps the first ``top_m``
+            documents in their order.
+        top_m (int): The number of documents to keep.
+        model (str): The cross-encoder model, for ``cross_encoder``.
+
+    Returns:
+        list[Document]: The kept documents, with their ``rerank_score`` metadata.
+    """
+    if method == "none" or not documents:
+        return list(documents[:top_m])
+    texts = [doc.page_content for doc in documents]
+    if method == "bm25":
+        scores = bm25_scores(query, texts)
+    else:
+        scores = await cross_encoder_scores(query, texts, model)
+    # A stable sort keeps the retrieval order between equal scores.
+    order = np.argsort(-scores, kind="stable")[:top_m]
+    logger.debug(f"RERANK: KEPT {len(order)} OF {len(documents)} DOCUMENTS")
+    kept = []
+    for i in order.tolist():
+        documents[i].metadata["rerank_score"] = float(scores[i])
+        kept.append(documents[i])
+    return kept
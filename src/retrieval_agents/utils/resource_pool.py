@@ -0,0 +1,220 @@
+"""Process-wide pool of reusable resources.
+
+Clients for embedding providers and vector stores are expensive to build
+(HTTP clients, connection pools, on-disk collections), so they are kept in a
+bounded LRU pool and shared between requests.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Generator, Generic, Hashable, Optional, TypeVar
+
+from retrieval_agents.utils.blocking import run_blocking
+
+logger = logging.getLogger(__name__)
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+@dataclass(frozen=True)
+class PoolStats:
+    """Snapshot of the counters of a resource pool."""
+
+    name: str
+    size: int
+    max_size: int
+    hits: int
+    misses: int
+    evictions: int
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of lookups served from the pool."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class _Entry(Generic[V]):
+    __slots__ = ("value", "leases", "evicted")
+
+    def __init__(self, value: V) -> None:
+        self.value = value
+        self.leases = 0
+        self.evicted = False
+
+
+class ResourcePool(Generic[K, V]):
+    """Keyed, bounded LRU pool that is safe to use from threads and coroutines.
+
+    Values are built lazily by a factory on the first lookup of a key. Concurrent
+    lookups of the same key wait for a single build instead of racing. When the
+    pool grows beyond ``max_size`` the least recently used entry is evicted and
+    closed; entries that are still leased are closed once the last lease ends.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_size: int,
+        close: Optional[Callable[[V], None]] = None,
+    ) -> None:
+        """Initialize the pool.
+
+        Args:
+            name (str): Name used in logs and statistics.
+            max_size (int): Maximum number of entries kept in the pool.
+            close (Optional[Callable[[V], None]]): Called to release an evicted value.
+        """
+        if max_size < 1:
+            raise ValueError("max_size must be a positive integer.")
+        self.name = name
+        self.max_size = max_size
+        self._close = close
+        self._entries: OrderedDict[K, _Entry[V]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._build_locks: dict[K, threading.Lock] = {}
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key: K, factory: Callable[[], V]) -> V:
+        """Return the pooled value for ``key``, building it with ``factory`` if needed."""
+        with self._acquire(key, factory) as value:
+            return value
+
+    async def aget(self, key: K, factory: Callable[[], V]) -> V:
+        """Asynchronously return the pooled value for ``key``.
+
+        Cache hits are served directly; builds run on the blocking I/O executor so
+        that the event loop is not blocked by client construction.
+        """
+        with self._lock:
+            entry = self._hit(key)
+        if entry is not None:
+            return entry.value
+        return await run_blocking(self.get, key, factory)
+
+    @contextmanager
+    def lease(self, key: K, factory: Callable[[], V]) -> Generator[V, None, None]:
+        """Borrow the pooled value for ``key`` for the duration of the block.
+
+        A leased value is never closed while in use, even if it is evicted.
+        """
+        with self._acquire(key, factory, lease=True) as value:
+            yield value
+
+    def stats(self) -> PoolStats:
+        """Return a snapshot of the pool counters."""
+        with self._lock:
+            return PoolStats(
+                name=self.name,
+                size=len(self._entries),
+                max_size=self.max_size,
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+            )
+
+    def close(self) -> None:
+        """Evict and close every entry in the pool."""
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+            self._build_locks.clear()
+            to_close = [e for e in entries if self._mark_evicted(e)]
+        for entry in to_close:
+            self._close_value(entry.value)
+
+    def __len__(self) -> int:
+        """Return the number of pooled entries."""
+        with self._lock:
+            return len(self._entries)
+
+    @contextmanager
+    def _acquire(
+        self, key: K, factory: Callable[[], V], lease: bool = False
+    ) -> Generator[V, None, None]:
+        entry = self._lookup(key, factory, lease)
+        if not lease:
+            yield entry.value
+            return
+        try:
+            yield entry.value
+        finally:
+            with self._lock:
+                entry.leases -= 1
+                release = entry.evicted and entry.leases == 0
+            if release:
+                self._close_value(entry.value)
+
+    def _lookup(self, key: K, factory: Callable[[], V], lease: bool) -> _Entry[V]:
+        # Leases are taken under the pool lock so that a concurrent eviction
+        # cannot close the value between the lookup and the lease.
+        with self._lock:
+            entry = self._hit(key, lease)
+            if entry is not None:
+                return entry
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+
+        with build_lock:
+            with self._lock:
+                entry = self._hit(key, lease)
+                if entry is not None:
+                    return entry
+                self._misses += 1
+            value = factory()
+            entry = _Entry(value)
+            with self._lock:
+                entry.leases += int(lease)
+                self._entries[key] = entry
+                self._build_locks.pop(key, None)
+                evicted = self._evict_overflow()
+        for old in evicted:
+            self._close_value(old.value)
+        return entry
+
+    def _hit(self, key: K, lease: bool = False) -> Optional[_Entry[V]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self._hits += 1
+            entry.leases += int(lease)
+        return entry
+
+    def _evict_overflow(self) -> list[_Entry[V]]:
+        to_close = []
+        while len(self._entries) > self.max_size:
+            key, entry = self._entries.popitem(last=False)
+            self._evictions += 1
+            logger.debug(f"Evicting {key!r} from pool {self.name}")
+            if self._mark_evicted(entry):
+                to_close.append(entry)
+        return to_close
+
+    @staticmethod
+    def _mark_evicted(entry: _Entry[V]) -> bool:
+        entry.evicted = True
+        return entry.leases == 0
+
+    def _close_value(self, value: V) -> None:
+        if self._close is None:
+            return
+        try:
+            self._close(value)
+        except Exception:
+            logger.warning(
+                f"Failed to close a resource of pool {self.name}", exc_info=True
+            )
+
+
+def fingerprint(*values: Optional[str]) -> str:
+    """Return a short digest identifying a set of credentials without storing them."""
+    digest = hashlib.sha256("\0".join(v or "" for v in values).encode("utf-8"))
+    return digest.hexdigest()[:16]
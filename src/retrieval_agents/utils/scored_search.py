@@ -0,0 +1,255 @@
+"""Vector search that keeps scores and selects candidates in-process.
+
+``ScoredRetriever`` embeds the query once, fetches ``fetch_k`` candidates with
+their vectors in a single search and scores them by cosine similarity in NumPy,
+so the score of a document means the same whichever store it came from. The
+score is kept in the ``score`` metadata of every document. The final documents
+are selected from the candidates by a score threshold, an adaptive ``k`` that
+drops candidates far behind the best one, and maximal marginal relevance, all
+computed on the vectors already fetched instead of a second round-trip.
+
+The embeddings of the latest queries are kept per encoder, so that later stages
+of a request, such as context compression, reuse the query embedding of the
+search instead of embedding the query again.
+"""
+
+from __future__ import annotations
+
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Sequence
+
+import numpy as np
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStoreRetriever
+
+from retrieval_agents.utils.blocking import run_blocking
+
+Candidates = list[tuple[Document, Optional[Sequence[float]]]]
+"""Documents found by a vector search, with their vectors if the store returned them."""
+
+VectorSearch = Callable[[list[float], int, dict[str, Any]], Candidates]
+"""Blocking search of the ``k`` nearest documents of a query vector, given search kwargs."""
+
+QUERY_EMBEDDING_CACHE_SIZE = 256
+
+# Keyed by encoder identity: encoders are pooled, so the search of a query and
+# the later stages of the same request share one encoder instance. The id of an
+# encoder evicted from the pool can be reused by another one, so every entry
+# keeps a weak reference to its encoder, checked on lookup.
+_query_embeddings: OrderedDict[
+    tuple[int, str], tuple[weakref.ref[Embeddings], list[float]]
+] = OrderedDict()
+_query_embeddings_lock = threading.Lock()
+
+
+def recall_query_embedding(embeddings: Embeddings, query: str) -> Optional[list[float]]:
+    """Return the embedding of a recently searched query, if it is still kept."""
+    key = (id(embeddings), query)
+    with _query_embeddings_lock:
+        entry = _query_embeddings.get(key)
+        if entry is None:
+            return None
+        encoder, vector = entry
+        if encoder() is not embeddings:
+            del _query_embeddings[key]
+            return None
+        _query_embeddings.move_to_end(key)
+        return vector
+
+
+def remember_query_embedding(
+    embeddings: Embeddings, query: str, vector: list[float]
+) -> None:
+    """Keep the embedding of a query for the later stages of the request."""
+    key = (id(embeddings), query)
+    with _query_embeddings_lock:
+        _query_embeddings[key] = (weakref.ref(embeddings), vector)
+        _query_embeddings.move_to_end(key)
+        while len(_query_embeddings) > QUERY_EMBEDDING_CACHE_SIZE:
+            _query_embeddings.popitem(last=False)
+
+
+def embed_query(embeddings: Embeddings, query: str) -> list[float]:
+    """Embed a query, reusing the embedding of a recent search of the same query."""
+    vector = recall_query_embedding(embeddings, query)
+    if vector is None:
+        vector = embeddings.embed_query(query)
+        remember_query_embedding(embeddings, query, vector)
+    return vector
+
+
+async def aembed_query(embeddings: Embeddings, query: str) -> list[float]:
+    """Asynchronously embed a query, reusing the embedding of a recent search."""
+    vector = recall_query_embedding(embeddings, query)
+    if vector is None:
+        vector = await embeddings.aembed_query(query)
+        remember_query_embedding(embeddings, query, vector)
+    return vector
+
+
+def cosine_similarities(query: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    """Return the cosine similarity of the query with every row of ``vectors``.
+
+    >>> cosine_similarities(np.array([1.0, 0.0]), np.array([[2.0, 0.0], [1.0, 1.0]]))
+    array([1.        , 0.70710678])
+    """
+    norms = np.linalg.norm(vectors, axis=1) * (np.linalg.norm(query) or 1)
+    return np.asarray(vectors @ query / np.where(norms == 0, 1, norms))
+
+
+def maximal_marginal_relevance(
+    scores: np.ndarray, vectors: np.ndarray, k: int, lambda_mult: float
+) -> np.ndarray:
+    """Return the indices of ``k`` candidates chosen by maximal marginal relevance.
+
+    Candidates are picked greedily, each maximizing ``lambda_mult`` times its
+    score minus ``1 - lambda_mult`` times its highest cosine similarity with
+    the candidates already picked.
+
+    Args:
+        scores (np.ndarray): Similarity of every candidate with the query.
+        vectors (np.ndarray): Vectors of the candidates, one per row.
+        k (int): Number of candidates to pick.
+        lambda_mult (float): 1 for relevance only, 0 for diversity only.
+
+    Returns:
+        np.ndarray: Indices of the picked candidates, in the order picked.
+
+    >>> vectors = np.array([[1.0, 0.0], [0.99, 0.14], [0.6, 0.8]])
+    >>> scores = np.array([0.9, 0.89, 0.7])
+    >>> maximal_marginal_relevance(scores, vectors, 2, 1.0).tolist()
+    [0, 1]
+    >>> maximal_marginal_relevance(scores, vectors, 2, 0.5).tolist()
+    [0, 2]
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    unit = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    similarity = unit @ unit.T
+    first = int(np.argmax(scores))
+    picked = [first]
+    redundancy = similarity[first].copy()
+    available = np.ones(len(scores), dtype=bool)
+    available[first] = False
+    while len(picked) < k:
+        objective = lambda_mult * scores - (1 - lambda_mult) * redundancy
+        objective[~available] = -np.inf
+        best = int(np.argmax(objective))
+        picked.append(best)
+        available[best] = False
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return np.array(picked)
+
+
+def select_candidates(
+    scores: np.ndarray,
+    vectors: Optional[np.ndarray],
+    k: int,
+    score_threshold: Optional[float] = None,
+    score_margin: Optional[float] = None,
+    mmr_lambda: Optional[float] = None,
+) -> np.ndarray:
+    """Return the indices of the candidates to keep, best first.
+
+    Args:
+        scores (np.ndarray): Similarity of every candidate with the query.
+        vectors (Optional[np.ndarray]): Vectors of the candidates, needed for MMR.
+        k (int): Maximum number of candidates to keep.
+        score_threshold (Optional[float]): Drop candidates scoring lower.
+        score_margin (Optional[float]): Drop candidates scoring more than this
+            below the best one, so that fewer than ``k`` are kept when only a
+            few stand out.
+        mmr_lambda (Optional[float]): Pick the candidates left by maximal
+            marginal relevance with this trade-off instead of by score.
+
+    >>> scores = np.array([0.5, 0.9, 0.85, 0.4])
+    >>> select_candidates(scores, None, 3).tolist()
+    [1, 2, 0]
+    >>> select_candidates(scores, None, 3, score_threshold=0.6).tolist()
+    [1, 2]
+    >>> select_candidates(scores, None, 3, score_margin=0.1).tolist()
+    [1, 2]
+    """
+    keep = np.argsort(-scores, kind="stable")
+    if score_threshold is not None:
+        keep = keep[scores[keep] >= score_threshold]
+    if score_margin is not None and len(keep):
+        keep = keep[scores[keep] >= scores[keep[0]] - score_margin]
+    if mmr_lambda is not None and vectors is not None:
+        return np.asarray(
+            keep[maximal_marginal_relevance(scores[keep], vectors[keep], k, mmr_lambda)]
+        )
+    return keep[:k]
+
+
+class ScoredRetriever(VectorStoreRetriever):
+    """Retriever that scores, filters and diversifies candidates in-process.
+
+    Each document returned carries its cosine similarity with the query in its
+    ``score`` metadata. Stores whose search does not return vectors are
+    searched by vector and their documents returned unscored.
+    """
+
+    vector_search: VectorSearch
+    """Search of the store returning candidates with their vectors."""
+    fetch_k: int = 20
+    """Number of candidates fetched before selecting ``k`` of them."""
+    score_threshold: Optional[float] = None
+    score_margin: Optional[float] = None
+    mmr_lambda: Optional[float] = None
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun, **kwargs: Any
+    ) -> list[Document]:
+        embedding = embed_query(self.vectorstore.embeddings, query)  # type: ignore[arg-type]
+        k, search_kwargs = self._search_kwargs(kwargs)
+        candidates = self.vector_search(embedding, max(k, self.fetch_k), search_kwargs)
+        return self._select(embedding, candidates, k)
+
+    async def _aget_relevant_documents(
+        self,
+        query: str,
+        *,
+        run_manager: AsyncCallbackManagerForRetrieverRun,
+        **kwargs: Any,
+    ) -> list[Document]:
+        embedding = await aembed_query(self.vectorstore.embeddings, query)  # type: ignore[arg-type]
+        k, search_kwargs = self._search_kwargs(kwargs)
+        candidates = await run_blocking(
+            self.vector_search, embedding, max(k, self.fetch_k), search_kwargs
+        )
+        return self._select(embedding, candidates, k)
+
+    def _search_kwargs(self, kwargs: dict[str, Any]) -> tuple[int, dict[str, Any]]:
+        search_kwargs = self.search_kwargs | kwargs
+        return search_kwargs.pop("k", 4), search_kwargs
+
+    def _select(
+        self, embedding: list[float], candidates: Candidates, k: int
+    ) -> list[Document]:
+        if not candidates or any(vector is None for _, vector in candidates):
+            return [doc for doc, _ in candidates[:k]]
+        vectors = np.asarray([vector for _, vector in candidates], dtype=np.float32)
+        scores = cosine_similarities(np.asarray(embedding, dtype=np.float32), vectors)
+        selected = select_candidates(
+            scores,
+            vectors,
+            k,
+            self.score_threshold,
+            self.score_margin,
+            self.mmr_lambda,
+        )
+        docs = []
+        for i in selected.tolist():
+            doc = candidates[i][0]
+            doc.metadata["score"] = float(scores[i])
+            docs.append(doc)
+        return docs
@@ -0,0 +1,150 @@
+"""Token-aware text splitting shared by the indexers.
+
+The tiktoken encoding is loaded once per process and splitters are cached per
+chunk size and overlap, so splitting a batch never reloads the tokenizer. Small
+batches are split on the blocking I/O executor; large batches are sharded
+across a process pool. Every chunk gets its length in tokens in its
+``token_count`` metadata, so later stages can budget prompts without
+tokenizing again.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import atexit
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Optional, Sequence
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from retrieval_agents.utils.blocking import run_blocking
+
+ENCODING_NAME = "gpt2"
+"""The encoding ``RecursiveCharacterTextSplitter.from_tiktoken_encoder`` uses by default."""
+
+PARALLEL_MIN_CHARS = 1_000_000
+"""Batches with fewer characters are split in-process."""
+
+_encoding: Any = None
+_encoding_lock = threading.Lock()
+_process_pool: Optional[Executor] = None
+_process_pool_lock = threading.Lock()
+
+
+def _get_encoding() -> Any:
+    global _encoding
+    with _encoding_lock:
+        if _encoding is None:
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding(ENCODING_NAME)
+        return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Return the number of tokens of a text."""
+    return len(_get_encoding().encode(text, disallowed_special=()))
+
+
+@functools.lru_cache(maxsize=16)
+def get_text_splitter(
+    chunk_size: int, chunk_overlap: int
+) -> RecursiveCharacterTextSplitter:
+    """Return the cached splitter measuring chunks in tokens."""
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size, chunk_overlap=chunk_overlap, length_function=count_tokens
+    )
+
+
+def split_documents(
+    docs: Sequence[Document], chunk_size: int, chunk_overlap: int
+) -> list[Document]:
+    """Split documents into chunks of at most ``chunk_size`` tokens.
+
+    Args:
+        docs (Sequence[Document]): Documents to split.
+        chunk_size (int): Maximum number of tokens of a chunk.
+        chunk_overlap (int): Number of tokens shared by consecutive chunks.
+
+    Returns:
+        list[Document]: The chunks in document order, with ``token_count`` set.
+    """
+    chunks = get_text_splitter(chunk_size, chunk_overlap).split_documents(docs)
+    for chunk in chunks:
+        chunk.metadata["token_count"] = count_tokens(chunk.page_content)
+    return chunks
+
+
+async def asplit_documents(
+    docs: Sequence[Document], chunk_size: int, chunk_overlap: int
+) -> list[Document]:
+    """Split documents off the event loop, across processes for large batches.
+
+    The chunks are returned in document order whichever way they were split, so
+    that chunk positions (and hence chunk IDs) do not depend on it.
+    """
+    if len(docs) < 2 or sum(len(d.page_content) for d in docs) < PARALLEL_MIN_CHARS:
+        return await run_blocking(split_documents, docs, chunk_size, chunk_overlap)
+    pool = _get_process_pool()
+    loop = asyncio.get_running_loop()
+    shards = _shard(docs, 2 * _process_pool_size())
+    results = await asyncio.gather(
+        *(
+            loop.run_in_executor(
+                pool, split_documents, shard, chunk_size, chunk_overlap
+            )
+            for shard in shards
+        )
+    )
+    return [chunk for result in results for chunk in result]
+
+
+def _shard(docs: Sequence[Document], n: int) -> list[list[Document]]:
+    """Cut documents into at most ``n`` contiguous shards of similar length.
+
+    >>> docs = [Document(page_content="x" * size) for size in (5, 1, 1, 1, 2)]
+    >>> [[len(d.page_content) for d in shard] for shard in _shard(docs, 2)]
+    [[5], [1, 1, 1, 2]]
+    """
+    target = sum(len(d.page_content) for d in docs) / n
+    shards: list[list[Document]] = [[]]
+    size = 0
+    for doc in docs:
+        if shards[-1] and size >= target:
+            shards.append([])
+            size = 0
+        shards[-1].append(doc)
+        size += len(doc.page_content)
+    return shards
+
+
+def _process_pool_size() -> int:
+    return int(os.environ.get("TEXT_SPLIT_MAX_WORKERS", str(os.cpu_count() or 1)))
+
+
+def _get_process_pool() -> Executor:
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            # Forking a process that runs an event loop and executor threads can
+            # deadlock.
+            _process_pool = ProcessPoolExecutor(
+                max_workers=_process_pool_size(),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _process_pool
+
+
+@atexit.register
+def shutdown_process_pool() -> None:
+    """Stop the worker processes, if any were started."""
+    global _process_pool
+    with _process_pool_lock:
+        pool, _process_pool = _process_pool, None
+    if pool is not None:
+        pool.shutdown(cancel_futures=True)
@@ -0,0 +1,28 @@
+from typing import Any, Generator
+from unittest.mock import patch
+
+from pytest import fixture
+
+from retrieval_agents.modules.utils import clear_chain_cache
+from retrieval_agents.utils import text_splitting
+
+
+@fixture(autouse=True)
+def _clear_chain_cache() -> Generator[None, None, None]:
+    # Tests patch the prompt and model factories of each node, so chains built
+    # by one test must not be served to the next.
+    clear_chain_cache()
+    yield
+    clear_chain_cache()
+
+
+class _CharEncoding:
+    def encode(self, text: str, **kwargs: Any) -> list[str]:
+        return list(text)
+
+
+@fixture
+def char_tokens() -> Generator[None, None, None]:
+    # tiktoken is not a test dependency: count one token per character instead.
+    with patch.object(text_splitting, "_get_encoding", return_value=_CharEncoding()):
+        yield
@@ -7,6 +7,7 @@ from pytest import fixture, mark
 from retrieval_agents import RunnableConfig
 from retrieval_agents.modules.adaptive_rag import (
     ContextualAnswerGeneratorState,
+    graph,
     retrieve,
     route_question,
     transform_query,
@@ -132,3 +133,54 @@ async def test_route_question(
     mock_question_router.ainvoke.assert_awaited_once_with(
         {"question": "agent memory", "topics": "test topics"}
     )
+
+
+### Graph ###
+@mark.asyncio
+@patch("retrieval_agents.modules.contextual_answer_generator._grade_generation")
+@patch(
+    "retrieval_agents.modules.contextual_answer_generator._grade_documents_individually"
+)
+@patch("retrieval_agents.modules.contextual_answer_generator.ChatPromptTemplate")
+@patch("retrieval_agents.modules.contextual_answer_generator.load_chat_model")
+@patch("retrieval_agents.modules.adaptive_rag.retrieval.make_retriever")
+@patch("retrieval_agents.modules.adaptive_rag.ChatPromptTemplate")
+@patch("retrieval_agents.modules.adaptive_rag.load_chat_model")
+async def test_graph_stops_when_budget_is_exhausted(
+    mock_load_chat_model: MagicMock,
+    mock_prompt_cls: MagicMock,
+    mock_make_retriever: MagicMock,
+    mock_generator_load_chat_model: MagicMock,
+    mock_generator_prompt_cls: MagicMock,
+    mock_grade_documents_individually: AsyncMock,
+    mock_grade_generation: AsyncMock,
+) -> None:
+    # route_question -> vectorstore; transform_query -> "better question"
+    question_router = mock_prompt_cls.from_messages.return_value.__or__.return_value
+    question_router.ainvoke = AsyncMock(return_value={"datasource": "vectorstore"})
+    question_router.__or__.return_value.ainvoke = AsyncMock(
+        return_value="better question"
+    )
+
+    mock_retriever = MagicMock()
+    mock_retriever.ainvoke = AsyncMock(return_value=[Document(page_content="doc")])
+    mock_make_retriever.return_value.__enter__.return_value = mock_retriever
+
+    rag_chain = mock_generator_prompt_cls.from_messages.return_value.__or__.return_value.__or__.return_value
+    rag_chain.ainvoke = AsyncMock(return_value="answer")
+    mock_grade_documents_individually.side_effect = lambda q, docs, c: (
+        [True] * len(docs)
+    )
+    # Grounded but never useful: the graph would loop forever without a budget.
+    mock_grade_generation.return_value = (True, False)
+
+    result = await graph.ainvoke(
+        {"question": "agent memory"},
+        {"configurable": {"user_id": "test_user", "max_llm_calls": 8}},
+    )
+
+    assert result["finish_reason"] == "budget_exhausted"
+    assert result["generation"] == "answer"
+    assert result["llm_calls"] == 8
+    assert result["elapsed_seconds"] >= 0
+    assert mock_grade_generation.await_count == 1
@@ -0,0 +1,56 @@
+import asyncio
+import time
+from typing import Any
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from langchain_core.documents import Document
+from pytest import mark
+
+from retrieval_agents.modules.simple_rag import SimpleRagState, retrieve
+from retrieval_agents.utils.blocking import (
+    BlockingCallError,
+    detect_blocking,
+    run_blocking,
+)
+
+
+@mark.asyncio
+async def test_detect_blocking_reports_stall() -> None:
+    with pytest.raises(BlockingCallError) as excinfo:
+        async with detect_blocking(threshold=0.05):
+            time.sleep(0.2)
+    assert excinfo.value.events[0].duration >= 0.05
+    assert "time.sleep(0.2)" in excinfo.value.events[0].stack
+
+
+@mark.asyncio
+async def test_detect_blocking_allows_awaiting() -> None:
+    async with detect_blocking(threshold=0.05) as events:
+        await asyncio.sleep(0.1)
+        await run_blocking(time.sleep, 0.1)
+    assert events == []
+
+
+@mark.asyncio
+@patch("retrieval_agents.modules.simple_rag.retrieval.make_retriever")
+async def test_retrieve_offloads_retriever_setup(
+    mock_make_retriever: MagicMock,
+) -> None:
+    mock_retriever = MagicMock()
+    doc = Document(page_content="doc")
+    mock_retriever.ainvoke = AsyncMock(return_value=[doc])
+
+    def slow_enter(*args: Any) -> MagicMock:
+        time.sleep(0.2)  # e.g. opening the Chroma persist directory
+        return mock_retriever
+
+    mock_make_retriever.return_value.__enter__.side_effect = slow_enter
+    mock_make_retriever.return_value.__exit__.return_value = None
+
+    async with detect_blocking(threshold=0.1):
+        result = await retrieve(
+            SimpleRagState(messages=[], queries=["query"]),
+            config={"configurable": {"user_id": "test_user"}},
+        )
+    assert result == {"retrieved_docs": [doc]}
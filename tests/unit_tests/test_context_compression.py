@@ -0,0 +1,98 @@
+import time
+from typing import cast
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from pytest import MonkeyPatch, mark
+
+from retrieval_agents.modules import retrieval
+from retrieval_agents.modules.contextual_answer_generator import (
+    ContextualAnswerGeneratorState,
+    compress_context,
+    grade_context,
+)
+from retrieval_agents.utils.scored_search import aembed_query
+
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    queries: int = 0
+
+    def embed_query(self, text: str) -> list[float]:
+        self.queries += 1
+        return super().embed_query(text)
+
+
+@mark.asyncio
+async def test_compress_context_keeps_the_sentences_closest_to_the_question(
+    monkeypatch: MonkeyPatch,
+) -> None:
+    question = "How long do retries wait?"
+    encoder = CountingEmbedding(size=32)
+    monkeypatch.setattr(retrieval, "get_text_encoder", lambda model: encoder)
+    # The retriever embedded the question for its search.
+    await aembed_query(encoder, question)
+    filler = " ".join(f"Sentence number {i} is unrelated." for i in range(40))
+    documents = [
+        Document(
+            page_content=f"{filler} {question} {filler}",
+            metadata={"source": "a", "token_count": 300},
+        ),
+        Document(page_content="Short enough.", metadata={"source": "b"}),
+    ]
+
+    update = await compress_context(
+        ContextualAnswerGeneratorState(question=question, documents=documents),
+        config={
+            "configurable": {
+                "user_id": "test_user",
+                "compress_context": True,
+                "compressed_document_tokens": 20,
+            }
+        },
+    )
+
+    compressed = cast(list[Document], update["documents"])
+    assert "How long do retries wait?" in compressed[0].page_content
+    assert len(compressed[0].page_content) < 120
+    assert compressed[0].metadata["source"] == "a"
+    assert "token_count" not in compressed[0].metadata
+    assert compressed[0].metadata["compressed_from_tokens"] > 300
+    assert compressed[1] == documents[1]
+    assert encoder.queries == 1
+
+
+@mark.asyncio
+async def test_compress_context_stops_after_deadline(monkeypatch: MonkeyPatch) -> None:
+    def get_text_encoder(model: str) -> DeterministicFakeEmbedding:
+        raise AssertionError("the encoder should not be built")
+
+    monkeypatch.setattr(retrieval, "get_text_encoder", get_text_encoder)
+    update = await compress_context(
+        ContextualAnswerGeneratorState(
+            question="q",
+            documents=[Document(page_content="d")],
+            started_at=time.time() - 11,
+            best_generation="best so far",
+        ),
+        config={"configurable": {"user_id": "test_user", "deadline_seconds": 10}},
+    )
+
+    assert update["finish_reason"] == "budget_exhausted"
+    assert update["generation"] == "best so far"
+
+
+@mark.asyncio
+async def test_grade_context_routes_relevant_documents_to_compression() -> None:
+    actual = await grade_context(
+        ContextualAnswerGeneratorState(
+            question="q", documents=[Document(page_content="d", metadata={"score": 1})]
+        ),
+        config={
+            "configurable": {
+                "user_id": "test_user",
+                "compress_context": True,
+                "grade_keep_score": 0.5,
+            }
+        },
+    )
+    assert actual.goto == "compress_context"
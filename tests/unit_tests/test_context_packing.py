@@ -0,0 +1,71 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from langchain_core.documents import Document
+from pytest import mark
+
+from retrieval_agents.modules.context_packing import pack_context
+from retrieval_agents.modules.contextual_answer_generator import (
+    ContextualAnswerGeneratorState,
+    generate,
+)
+from retrieval_agents.modules.utils import estimate_tokens
+
+SHARED = "the retry budget is shared by every request of a session. "
+
+
+def test_pack_context_dedupes_orders_and_fits_the_budget() -> None:
+    documents = [
+        Document(page_content="filler " * 200, metadata={"score": 0.1}),
+        Document(
+            page_content="Retries back off. " + SHARED,
+            metadata={"source": "doc", "score": 0.9, "token_count": 20},
+        ),
+        # Overlaps the end of the chunk before it.
+        Document(
+            page_content=SHARED + "Timeouts are per attempt.",
+            metadata={"source": "doc", "score": 0.8, "token_count": 20},
+        ),
+        Document(page_content=SHARED, metadata={"source": "doc", "score": 0.7}),
+        Document(page_content="x" * 2000, metadata={"score": 0.5}),
+    ]
+
+    context = pack_context(documents, budget=150)
+
+    assert [d.metadata["score"] for d in context.documents] == [0.9, 0.8, 0.5]
+    assert context.duplicates == 1
+    assert (context.truncated, context.dropped) == (1, 1)
+    assert context.text.count(SHARED.strip()) == 1
+    assert "Timeouts are per attempt." in context.text
+    assert "token_count" not in context.documents[1].metadata
+    assert '<document index="1" source="doc">' in context.text
+    assert context.tokens <= 150
+    assert context.tokens_saved > 400
+    assert pack_context([], 100).text == "<documents>\n</documents>"
+
+
+@mark.asyncio
+@patch("retrieval_agents.modules.contextual_answer_generator.ChatPromptTemplate")
+@patch("retrieval_agents.modules.contextual_answer_generator.load_chat_model")
+async def test_generate_sends_the_context_packed_for_its_model(
+    mock_load_chat_model: MagicMock, mock_prompt_cls: MagicMock
+) -> None:
+    mock_rag_chain = MagicMock()
+    mock_rag_chain.ainvoke = AsyncMock(return_value="generated text")
+    mock_prompt_cls.from_messages.return_value.__or__.return_value.__or__.return_value = mock_rag_chain
+    documents = [Document(page_content=f"fact {i} " * 100) for i in range(10)]
+
+    await generate(
+        state=ContextualAnswerGeneratorState(question="q", documents=documents),
+        config={
+            "configurable": {
+                "user_id": "test_user",
+                "generate_model": "openai/gpt-4o-mini",
+                "model_context_token_budgets": {"openai/gpt-4o-mini": 500},
+            }
+        },
+    )
+
+    context = mock_rag_chain.ainvoke.await_args.args[0]["context"]
+    assert context.startswith('<documents>\n<document index="1">\nfact 0')
+    assert estimate_tokens(context) <= 500
+    assert "Document(" not in context
@@ -1,3 +1,5 @@
+import asyncio
+import time
 from typing import Sequence, cast
 from unittest.mock import AsyncMock, MagicMock, patch
 
@@ -13,7 +15,9 @@ from retrieval_agents.modules.contextual_answer_generator import (
     generate,
     grade_context,
     grade_generation,
+    graph,
 )
+from retrieval_agents.modules.utils import chain_cache_stats
 
 
 @fixture
@@ -114,6 +118,312 @@ async def test_grade_context(
     )
 
 
+@mark.asyncio
+@patch("retrieval_agents.modules.contextual_answer_generator.ChatPromptTemplate")
+@patch("retrieval_agents.modules.contextual_answer_generator.load_chat_model")
+async def test_grade_context_concurrent_preserves_order(
+    mock_load_chat_model: MagicMock,
+    mock_prompt_cls: MagicMock,
+    runnable_config: RunnableConfig,
+) -> None:
+    running = 0
+    max_running = 0
+
+    async def response(arg: dict[str, str]) -> dict[str, str]:
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        # Later documents finish first.
+        await asyncio.sleep(0.01 * (10 - int(arg["document"].split()[-1])))
+        running -= 1
+        return {"binary_score": "yes" if "relevant" in arg["document"] else "no"}
+
+    mock_retrieval_grader = MagicMock()
+    mock_retrieval_grader.ainvoke = AsyncMock(side_effect=response)
+    mock_prompt_cls.from_messages.return_value.__or__.return_value = (
+        mock_retrieval_grader
+    )
+
+    documents = [
+        Document(page_content=f"{'relevant' if i % 2 else 'other'} {i}")
+        for i in range(8)
+    ]
+    runnable_config["configurable"]["grade_documents_max_concurrency"] = 3
+    actual = await grade_context(
+        state=ContextualAnswerGeneratorState(question="q", documents=documents),
+        config=runnable_config,
+    )
+    assert cast(dict[str, Sequence[Document]], actual.update)["documents"] == [
+        documents[1],
+        documents[3],
+        documents[5],
+        documents[7],
+    ]
+    assert max_running == 3
+
+
+@mark.asyncio
+@patch("retrieval_agents.modules.contextual_answer_generator.ChatPromptTemplate")
+@patch("retrieval_agents.modules.contextual_answer_generator.load_chat_model")
+async def test_grade_context_concurrency_is_shared_across_runs(
+    mock_load_chat_model: MagicMock,
+    mock_prompt_cls: MagicMock,
+    runnable_config: RunnableConfig,
+) -> None:
+    running = 0
+    max_running = 0
+
+    async def response(arg: dict[str, str]) -> dict[str, str]:
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return {"binary_score": "yes"}
+
+    mock_retrieval_grader = MagicMock()
+    mock_retrieval_grader.ainvoke = AsyncMock(side_effect=response)
+    mock_prompt_cls.from_messages.return_value.__or__.return_value = (
+        mock_retrieval_grader
+    )
+
+    runnable_config["configurable"]["grade_documents_max_concurrency"] = 2
+    states = [
+        ContextualAnswerGeneratorState(
+            question="q",
+            documents=[Document(page_content=f"{run} {i}") for i in range(4)],
+        )
+        for run in range(3)
+    ]
+    await asyncio.gather(
+        *(grade_context(state=state, config=runnable_config) for state in states)
+    )
+    assert max_running == 2
+
+
+@mark.asyncio
+@patch("retrieval_agents.modules.contextual_answer_generator.ChatPromptTemplate")
+@patch("retrieval_agents.modules.contextual_answer_generator.load_chat_model")
+@mark.parametrize(
+    "policy, expected_contents",
+    [("keep", ["fast", "slow"]), ("drop", ["fast"])],
+)
+async def test_grade_context_timeout_policy(
+    mock_load_chat_model: MagicMock,
+    mock_prompt_cls: MagicMock,
+    runnable_config: RunnableConfig,
+    policy: str,
+    expected_contents: list[str],
+) -> None:
+    async def response(arg: dict[str, str]) -> dict[str, str]:
+        if arg["document"] == "slow":
+            await asyncio.sleep(1)
+        return {"binary_score": "yes"}
+
+    mock_retrieval_grader = MagicMock()
+    mock_retrieval_grader.ainvoke = AsyncMock(side_effect=response)
+    mock_prompt_cls.from_messages.return_value.__or__.return_value = (
+        mock_retrieval_grader
+    )
+
+    runnable_config["configurable"]["grade_documents_timeout"] = 0.05
+    runnable_config["configurable"]["grade_documents_timeout_policy"] = policy
+    actual = await grade_context(
+        state=ContextualAnswerGeneratorState(
+            question="q",
+            documents=[Document(page_content="fast"), Document(page_content="slow")],
+        ),
+        config=runnable_config,
+    )
+    documents = cast(dict[str, Sequence[Document]], actual.update)["documents"]
+    assert [d.page_content for d in documents] == expected_contents
+
+
+@mark.asyncio
+@patch("retrieval_agents.modules.contextual_answer_generator.ChatPromptTemplate")
+@patch("retrieval_agents.modules.contextual_answer_generator.load_chat_model")
+async def test_grade_context_listwise(
+    mock_load_chat_model: MagicMock,
+    mock_prompt_cls: MagicMock,
+    runnable_config: RunnableConfig,
+) -> None:
+    async def response(arg: dict[str, str]) -> dict[str, object]:
+        if "documents" in arg:
+            # The listwise grader skips index 2, which is graded individually.
+            return {
+                "grades": [
+                    {"index": 0, "binary_score": "no"},
+                    {"index": 1, "binary_score": "yes"},
+                ]
+            }
+        return {"binary_score": "yes"}
+
+    mock_grader = MagicMock()
+    mock_grader.ainvoke = AsyncMock(side_effect=response)
+    mock_prompt_cls.from_messages.return_value.__or__.return_value = mock_grader
+
+    documents = [Document(page_content=f"doc {i}") for i in range(3)]
+    runnable_config["configurable"]["grade_documents_mode"] = "listwise"
+    actual = await grade_context(
+        state=ContextualAnswerGeneratorState(question="q", documents=documents),
+        config=runnable_config,
+    )
+
+    assert cast(dict[str, Sequence[Document]], actual.update)["documents"] == [
+        documents[1],
+        documents[2],
+    ]
+    listwise_input = mock_grader.ainvoke.await_args_list[0].args[0]
+    assert '<document index="2">\ndoc 2\n</document>' in listwise_input["documents"]
+    assert mock_grader.ainvoke.await_count == 2
+
+
+@mark.asyncio
+@patch("retrieval_agents.modules.contextual_answer_generator.ChatPromptTemplate")
+@patch("retrieval_agents.modules.contextual_answer_generator.load_chat_model")
+async def test_grade_context_listwise_falls_back_over_budget(
+    mock_load_chat_model: MagicMock,
+    mock_prompt_cls: MagicMock,
+    runnable_config: RunnableConfig,
+) -> None:
+    mock_grader = MagicMock()
+    mock_grader.ainvoke = AsyncMock(return_value={"binary_score": "yes"})
+    mock_prompt_cls.from_messages.return_value.__or__.return_value = mock_grader
+
+    documents = [Document(page_content="x" * 400) for _ in range(3)]
+    runnable_config["configurable"]["grade_documents_mode"] = "listwise"
+    runnable_config["configurable"]["listwise_grading_token_budget"] = 100
+    await grade_context(
+        state=ContextualAnswerGeneratorState(question="q", documents=documents),
+        config=runnable_config,
+    )
+
+    assert mock_grader.ainvoke.await_count == 3
+    assert all("document" in c.args[0] for c in mock_grader.ainvoke.await_args_list)
+
+
+@mark.asyncio
+@patch("retrieval_agents.modules.contextual_answer_generator.ChatPromptTemplate")
+@patch("retrieval_agents.modules.contextual_answer_generator.load_chat_model")
+@mark.parametrize("mode", ["per_document", "listwise"])
+async def test_grade_context_grades_only_the_uncertain_scores(
+    mock_load_chat_model: MagicMock,
+    mock_prompt_cls: MagicMock,
+    runnable_config: RunnableConfig,
+    mode: str,
+) -> None:
+    async def response(arg: dict[str, str]) -> dict[str, object]:
+        if "documents" in arg:
+            return {"grades": [{"index": 0, "binary_score": "yes"}]}
+        return {"binary_score": "yes"}
+
+    mock_grader = MagicMock()
+    mock_grader.ainvoke = AsyncMock(side_effect=response)
+    mock_prompt_cls.from_messages.return_value.__or__.return_value = mock_grader
+
+    documents = [
+        Document(page_content="high", metadata={"score": 0.9}),
+        Document(page_content="low", metadata={"score": 0.1}),
+        Document(page_content="middle", metadata={"score": 0.5}),
+        Document(page_content="unscored"),
+    ]
+    runnable_config["configurable"].update(
+        grade_documents_mode=mode, grade_keep_score=0.8, grade_drop_score=0.2
+    )
+    actual = await grade_context(
+        state=ContextualAnswerGeneratorState(question="q", documents=documents),
+        config=runnable_config,
+    )
+
+    update = cast(dict[str, object], actual.update)
+    assert update["documents"] == [documents[0], documents[2], documents[3]]
+    graded = "".join(
+        str(c.args[0].get("document", c.args[0].get("documents")))
+        for c in mock_grader.ainvoke.await_args_list
+    )
+    assert "middle" in graded and "unscored" in graded
+    assert "high" not in graded and "low" not in graded
+    assert update["llm_calls"] == mock_grader.ainvoke.await_count
+
+
+@mark.asyncio
+@patch("retrieval_agents.modules.contextual_answer_generator.ChatPromptTemplate")
+@patch("retrieval_agents.modules.contextual_answer_generator.load_chat_model")
+@mark.parametrize(
+    "listwise_grading_token_budget, expected_contents, expected_llm_calls",
+    [
+        # Too few calls are left to grade each document, so they are graded listwise.
+        (6000, ["doc 1", "doc 3", "doc 5"], 3),
+        # The listwise prompt is too large, so only the affordable documents are graded.
+        (1, ["doc 0", "doc 1", "doc 2"], 5),
+    ],
+)
+async def test_grade_context_stays_within_the_call_budget(
+    mock_load_chat_model: MagicMock,
+    mock_prompt_cls: MagicMock,
+    runnable_config: RunnableConfig,
+    listwise_grading_token_budget: int,
+    expected_contents: list[str],
+    expected_llm_calls: int,
+) -> None:
+    async def response(arg: dict[str, str]) -> dict[str, object]:
+        if "documents" in arg:
+            return {
+                "grades": [
+                    {"index": i, "binary_score": "yes" if i % 2 else "no"}
+                    for i in range(6)
+                ]
+            }
+        return {"binary_score": "yes"}
+
+    mock_grader = MagicMock()
+    mock_grader.ainvoke = AsyncMock(side_effect=response)
+    mock_prompt_cls.from_messages.return_value.__or__.return_value = mock_grader
+
+    runnable_config["configurable"].update(
+        max_llm_calls=5,
+        listwise_grading_token_budget=listwise_grading_token_budget,
+        grade_documents_timeout_policy="drop",
+    )
+    documents = [Document(page_content=f"doc {i}") for i in range(6)]
+    actual = await grade_context(
+        state=ContextualAnswerGeneratorState(
+            question="q", documents=documents, llm_calls=2
+        ),
+        config=runnable_config,
+    )
+
+    update = cast(dict[str, object], actual.update)
+    contents = [d.page_content for d in cast(list[Document], update["documents"])]
+    assert contents == expected_contents
+    assert update["llm_calls"] == expected_llm_calls
+    assert update["llm_calls"] == 2 + mock_grader.ainvoke.await_count
+
+
+@mark.asyncio
+@patch("retrieval_agents.modules.contextual_answer_generator.load_chat_model")
+async def test_grade_context_stops_after_deadline(
+    mock_load_chat_model: MagicMock,
+    runnable_config: RunnableConfig,
+) -> None:
+    runnable_config["configurable"]["deadline_seconds"] = 10
+    state = ContextualAnswerGeneratorState(
+        question="q",
+        documents=[Document(page_content="doc")],
+        started_at=time.time() - 11,
+        llm_calls=3,
+        best_generation="best so far",
+    )
+    actual = await grade_context(state=state, config=runnable_config)
+
+    update = cast(dict[str, object], actual.update)
+    assert actual.goto == "__end__"
+    assert update["finish_reason"] == "budget_exhausted"
+    assert update["generation"] == "best so far"
+    assert update["llm_calls"] == 3
+    mock_load_chat_model.assert_not_called()
+
+
 @mark.asyncio
 @patch("retrieval_agents.modules.contextual_answer_generator.ChatPromptTemplate")
 @patch("retrieval_agents.modules.contextual_answer_generator.load_chat_model")
@@ -139,6 +449,87 @@ async def test_generate(
     assert response["generation"] == "generated text"
 
 
+@mark.asyncio
+@patch("retrieval_agents.modules.contextual_answer_generator.ChatPromptTemplate")
+@patch("retrieval_agents.modules.contextual_answer_generator.load_chat_model")
+async def test_generate_reuses_compiled_chain(
+    mock_load_chat_model: MagicMock,
+    mock_prompt_cls: MagicMock,
+    runnable_config: RunnableConfig,
+) -> None:
+    mock_rag_chain = MagicMock()
+    mock_rag_chain.ainvoke = AsyncMock(return_value="generated text")
+    mock_prompt_cls.from_messages.return_value.__or__.return_value.__or__.return_value = mock_rag_chain
+    state = ContextualAnswerGeneratorState(question="agent memory", documents=[])
+    before = chain_cache_stats()
+
+    await generate(state=state, config=runnable_config)
+    await generate(state=state, config=runnable_config)
+    runnable_config["configurable"]["generate_model"] = "openai/gpt-4o-mini"
+    await generate(state=state, config=runnable_config)
+
+    assert mock_load_chat_model.call_count == 2
+    assert mock_rag_chain.ainvoke.await_count == 3
+    after = chain_cache_stats()
+    assert after.size == 2
+    assert (after.hits - before.hits, after.misses - before.misses) == (1, 2)
+
+
+@mark.asyncio
+@patch("retrieval_agents.modules.contextual_answer_generator.ChatPromptTemplate")
+@patch("retrieval_agents.modules.contextual_answer_generator.load_chat_model")
+async def test_generate_is_bounded_by_deadline(
+    mock_load_chat_model: MagicMock,
+    mock_prompt_cls: MagicMock,
+    runnable_config: RunnableConfig,
+) -> None:
+    async def slow_generation(arg: dict[str, str]) -> str:
+        await asyncio.sleep(1)
+        return "late"
+
+    mock_rag_chain = MagicMock()
+    mock_rag_chain.ainvoke = AsyncMock(side_effect=slow_generation)
+    mock_prompt_cls.from_messages.return_value.__or__.return_value.__or__.return_value = mock_rag_chain
+    runnable_config["configurable"]["deadline_seconds"] = 10
+    state = ContextualAnswerGeneratorState(
+        question="q",
+        documents=[],
+        started_at=time.time() - 9.95,
+        llm_calls=3,
+        best_generation="best so far",
+    )
+
+    started_at = time.monotonic()
+    response = await generate(state=state, config=runnable_config)
+
+    assert time.monotonic() - started_at < 0.5
+    assert response["finish_reason"] == "budget_exhausted"
+    assert response["generation"] == "best so far"
+    assert response["llm_calls"] == 3
+
+
+@mark.asyncio
+@patch(
+    "retrieval_agents.modules.contextual_answer_generator._grade_documents_individually"
+)
+async def test_graph_clock_starts_at_entry(
+    mock_grade_documents_individually: AsyncMock,
+    runnable_config: RunnableConfig,
+) -> None:
+    async def slow_grading(*args: object) -> list[bool]:
+        await asyncio.sleep(0.05)
+        return [False]
+
+    mock_grade_documents_individually.side_effect = slow_grading
+    result = await graph.ainvoke(
+        {"question": "q", "documents": [Document(page_content="doc")]},
+        runnable_config,
+    )
+
+    assert result["finish_reason"] == "no_relevant_documents"
+    assert result["elapsed_seconds"] >= 0.05
+
+
 ### Edges ###
 
 
@@ -184,6 +575,112 @@ async def test_grade_generation(
     )
 
 
+@mark.asyncio
+@patch(
+    "retrieval_agents.modules.contextual_answer_generator._grade_generation_v_documents_and_question_hallucination",
+)
+@patch(
+    "retrieval_agents.modules.contextual_answer_generator._grade_generation_v_docuemnts_and_question_answer",
+)
+@mark.parametrize(
+    "hallucination_grade, answer_grade, expected_goto, expected_finish_reason",
+    [
+        (True, True, "__end__", "complete"),
+        (True, False, "__end__", "not_useful"),
+        (False, True, "generate", None),
+    ],
+)
+async def test_grade_generation_parallel(
+    mock_grade_generation_v_docuemnts_and_question_answer: MagicMock,
+    mock_grade_generation_v_documents_and_question_hallucination: MagicMock,
+    runnable_config: RunnableConfig,
+    hallucination_grade: bool,
+    answer_grade: bool,
+    expected_goto: str,
+    expected_finish_reason: str | None,
+) -> None:
+    answer_started = asyncio.Event()
+    answer_cancelled = False
+
+    async def grade_answer(**kwargs: object) -> bool:
+        nonlocal answer_cancelled
+        answer_started.set()
+        try:
+            await asyncio.sleep(0.05)
+        except asyncio.CancelledError:
+            answer_cancelled = True
+            raise
+        return answer_grade
+
+    async def grade_hallucination(**kwargs: object) -> bool:
+        # Both graders run concurrently.
+        await asyncio.wait_for(answer_started.wait(), timeout=1)
+        return hallucination_grade
+
+    mock_grade_generation_v_docuemnts_and_question_answer.side_effect = grade_answer
+    mock_grade_generation_v_documents_and_question_hallucination.side_effect = (
+        grade_hallucination
+    )
+    runnable_config["configurable"]["generation_grading_mode"] = "parallel"
+    actual = await grade_generation(
+        state=ContextualAnswerGeneratorState(question="", documents=[]),
+        config=runnable_config,
+    )
+    assert actual.goto == expected_goto
+    assert (
+        cast(dict[str, str], actual.update).get("finish_reason")
+        == expected_finish_reason
+    )
+    assert answer_cancelled == (not hallucination_grade)
+    # The cancelled answer grader call is not counted.
+    assert cast(dict[str, int], actual.update)["llm_calls"] == (
+        2 if hallucination_grade else 1
+    )
+
+
+@mark.asyncio
+@patch("retrieval_agents.modules.contextual_answer_generator.ChatPromptTemplate")
+@patch("retrieval_agents.modules.contextual_answer_generator.load_chat_model")
+@mark.parametrize(
+    "grounded, addresses_question, expected_goto, expected_finish_reason",
+    [
+        ("yes", "yes", "__end__", "complete"),
+        ("yes", "no", "__end__", "not_useful"),
+        ("no", "yes", "generate", None),
+    ],
+)
+async def test_grade_generation_combined(
+    mock_load_chat_model: MagicMock,
+    mock_prompt_cls: MagicMock,
+    runnable_config: RunnableConfig,
+    grounded: str,
+    addresses_question: str,
+    expected_goto: str,
+    expected_finish_reason: str | None,
+) -> None:
+    generation_grader = MagicMock()
+    generation_grader.ainvoke = AsyncMock(
+        return_value={"grounded": grounded, "addresses_question": addresses_question}
+    )
+    mock_prompt_cls.from_messages.return_value.__or__.return_value = generation_grader
+
+    runnable_config["configurable"]["generation_grading_mode"] = "combined"
+    actual = await grade_generation(
+        state=ContextualAnswerGeneratorState(
+            question="q", documents=[], generation="g"
+        ),
+        config=runnable_config,
+    )
+    assert actual.goto == expected_goto
+    assert (
+        cast(dict[str, str], actual.update).get("finish_reason")
+        == expected_finish_reason
+    )
+    generation_grader.ainvoke.assert_awaited_once_with(
+        {"documents": "<documents>\n</documents>", "question": "q", "generation": "g"}
+    )
+
+
 @mark.asyncio
 @patch("retrieval_agents.modules.contextual_answer_generator.ChatPromptTemplate")
 @patch(
@@ -0,0 +1,81 @@
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Any, cast
+from unittest.mock import MagicMock, patch
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.vectorstores import InMemoryVectorStore
+from pytest import mark
+
+from retrieval_agents.modules import directory_indexer as directory_indexer_graph
+
+directory_indexer = sys.modules["retrieval_agents.modules.directory_indexer"]
+
+
+@mark.asyncio
+@mark.usefixtures("char_tokens")
+async def test_re_runs_only_index_changed_files(tmp_path: Path) -> None:
+    docs = tmp_path / "docs"
+    (docs / "nested").mkdir(parents=True)
+    for i in range(3):
+        (docs / f"{i}.txt").write_text(f"file {i}\n\nsecond paragraph")
+    (docs / "nested" / "deep.txt").write_text("deep file")
+    (docs / "ignored.bin").write_bytes(b"\0")
+    store = InMemoryVectorStore(DeterministicFakeEmbedding(size=4))
+    retriever = MagicMock(vectorstore=store)
+    config: Any = {
+        "configurable": {
+            "user_id": "test_user",
+            "manifest_path": str(tmp_path / "manifest.db"),
+            "workers": 2,
+            "index_batch_size": 2,
+            "chunk_size": 10,
+        }
+    }
+
+    async def run() -> dict[str, Any]:
+        with (
+            patch.object(
+                directory_indexer.retrieval,
+                "make_retriever",
+                side_effect=lambda config: nullcontext(retriever),
+            ),
+            patch.object(
+                directory_indexer,
+                "_make_pool",
+                side_effect=lambda workers: ThreadPoolExecutor(workers),
+            ),
+        ):
+            result = await directory_indexer_graph.ainvoke({"path": str(docs)}, config)
+        return cast(dict[str, Any], result["summary"])
+
+    first = await run()
+    assert first["stages"]["parse"]["items_out"] == 4
+    assert first["dedupe"]["upserted"] == len(store.store) == 10
+    assert {d["metadata"]["user_id"] for d in store.store.values()} == {"test_user"}
+
+    second = await run()
+    assert second["stages"]["parse"]["skipped"] == 4
+    assert second["dedupe"]["submitted"] == 0
+
+    (docs / "0.txt").write_text("rewritten")
+    stat = (docs / "1.txt").stat()
+    os.utime(docs / "1.txt", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    third = await run()
+    assert third["stages"]["parse"]["items_out"] == 1
+    assert third["stages"]["parse"]["skipped"] == 3
+    assert third["dedupe"]["upserted"] == 1
+    assert len(store.store) == 8
+    assert "rewritten" in {d["text"] for d in store.store.values()}
+
+    (docs / "2.txt").unlink()
+    removed = [
+        i for i, d in store.store.items() if d["metadata"]["source"].endswith("2.txt")
+    ]
+    await run()
+    assert removed
+    assert len(store.store) == 8 - len(removed)
+    assert not set(removed) & set(store.store)
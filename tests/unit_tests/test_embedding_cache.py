@@ -0,0 +1,137 @@
+import sqlite3
+import time
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from pytest import MonkeyPatch, fixture, mark, raises
+
+from retrieval_agents.utils.embedding_cache import (
+    CachedEmbeddings,
+    EmbeddingCache,
+    get_embedding_cache,
+)
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self) -> None:
+        self.embedded: list[str] = []
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.embedded.extend(texts)
+        return [[float(len(t)), 0.5] for t in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        self.embedded.append(text)
+        return [float(len(text)), -0.5]
+
+
+@fixture
+def cache(tmp_path: Path) -> EmbeddingCache:
+    return EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_entries=100)
+
+
+def test_only_misses_go_to_provider(cache: EmbeddingCache) -> None:
+    provider = CountingEmbeddings()
+    cached = CachedEmbeddings(provider, "fake/model", cache)
+
+    assert cached.embed_documents(["a", "bb"]) == [[1.0, 0.5], [2.0, 0.5]]
+    assert cached.embed_documents(["bb", "ccc", "ccc"]) == [
+        [2.0, 0.5],
+        [3.0, 0.5],
+        [3.0, 0.5],
+    ]
+
+    assert provider.embedded == ["a", "bb", "ccc"]
+    stats = cache.stats()
+    assert (stats.hits, stats.misses, stats.size) == (1, 4, 3)
+
+
+def test_queries_and_documents_are_cached_separately(cache: EmbeddingCache) -> None:
+    provider = CountingEmbeddings()
+    cached = CachedEmbeddings(provider, "fake/model", cache)
+
+    cached.embed_documents(["abc"])
+    assert cached.embed_query("abc") == [3.0, -0.5]
+    assert cached.embed_query("abc") == [3.0, -0.5]
+    assert provider.embedded == ["abc", "abc"]
+
+
+def test_vectors_are_stored_as_packed_floats(tmp_path: Path) -> None:
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), dtype="float16")
+    cache.put_many("m", "document", ["x"], [[0.1, 0.2, 0.3]])
+    blob = cache._conn.execute("SELECT vector FROM embeddings").fetchone()[0]
+    assert len(blob) == 3 * 2
+    [vector] = cache.get_many("m", "document", ["x"])
+    assert vector is not None
+    np.testing.assert_allclose(vector, [0.1, 0.2, 0.3], atol=1e-3)
+
+
+def test_lru_eviction(tmp_path: Path) -> None:
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_entries=2)
+    cache.put_many("m", "document", ["a"], [[1.0]])
+    time.sleep(0.01)
+    cache.put_many("m", "document", ["b"], [[2.0]])
+    time.sleep(0.01)
+    cache.get_many("m", "document", ["a"])
+    time.sleep(0.01)
+    cache.put_many("m", "document", ["c"], [[3.0]])
+
+    assert cache.get_many("m", "document", ["a", "b", "c"]) == [[1.0], None, [3.0]]
+    assert cache.stats().evictions == 1
+
+
+def test_ttl_expiry(tmp_path: Path) -> None:
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=0.01)
+    cache.put_many("m", "document", ["a"], [[1.0]])
+    time.sleep(0.02)
+    assert cache.get_many("m", "document", ["a"]) == [None]
+    assert cache.evict_expired() == 1
+
+
+def test_expired_entry_is_replaced(tmp_path: Path) -> None:
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=0.05)
+    cache.put_many("m", "document", ["a"], [[1.0]])
+    time.sleep(0.06)
+    assert cache.get_many("m", "document", ["a"]) == [None]
+    cache.put_many("m", "document", ["a"], [[2.0]])
+
+    assert cache.get_many("m", "document", ["a"]) == [[2.0]]
+    assert cache.stats().size == 1
+
+
+def test_reconfigured_cache_closes_the_previous_one(
+    tmp_path: Path, monkeypatch: MonkeyPatch
+) -> None:
+    monkeypatch.setenv("EMBEDDING_CACHE_PATH", str(tmp_path / "first.sqlite3"))
+    first = get_embedding_cache()
+    monkeypatch.setenv("EMBEDDING_CACHE_PATH", str(tmp_path / "second.sqlite3"))
+    second = get_embedding_cache()
+
+    assert first is not None and second is not None and second is not first
+    with raises(sqlite3.ProgrammingError):
+        first.get_many("m", "query", ["q"])
+    second.close()
+
+
+def test_cache_persists_across_instances(tmp_path: Path) -> None:
+    path = str(tmp_path / "cache.sqlite3")
+    EmbeddingCache(path).put_many("m", "query", ["q"], [[1.0, 2.0]])
+    assert EmbeddingCache(path).get_many("m", "query", ["q"]) == [[1.0, 2.0]]
+
+
+@mark.asyncio
+async def test_async_embeddings_use_cache(cache: EmbeddingCache) -> None:
+    provider = MagicMock(spec=Embeddings)
+
+    async def aembed_documents(texts: list[str]) -> list[list[float]]:
+        return [[1.0] for _ in texts]
+
+    provider.aembed_documents.side_effect = aembed_documents
+    cached = CachedEmbeddings(provider, "fake/model", cache)
+
+    await cached.aembed_documents(["a", "b"])
+    await cached.aembed_documents(["a", "b", "c"])
+
+    assert provider.aembed_documents.await_args_list[1].args == (["c"],)
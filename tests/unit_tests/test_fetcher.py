@@ -0,0 +1,108 @@
+import asyncio
+import time
+from typing import AsyncGenerator
+
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from pytest import mark
+
+from retrieval_agents.utils.fetcher import FetchError, HttpFetcher
+
+
+class Server:
+    def __init__(self) -> None:
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.hits: dict[str, int] = {}
+        self.url = ""
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        name = request.match_info["name"]
+        self.hits[name] = self.hits.get(name, 0) + 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.02)
+            if name == "flaky" and self.hits[name] < 3:
+                return web.Response(status=503, headers={"Retry-After": "0"})
+            if name == "down":
+                return web.Response(status=500)
+            if name == "missing":
+                return web.Response(status=404)
+            return web.Response(text=f"héllo {name}", charset="utf-8")
+        finally:
+            self.in_flight -= 1
+
+
+@pytest_asyncio.fixture
+async def server() -> AsyncGenerator[Server, None]:
+    server = Server()
+    app = web.Application()
+    app.router.add_get("/{name}", server.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]  # type: ignore[union-attr]
+    server.url = f"http://127.0.0.1:{port}"
+    yield server
+    await runner.cleanup()
+
+
+@mark.asyncio
+async def test_per_host_concurrency_is_bounded(server: Server) -> None:
+    async with HttpFetcher(per_host_concurrency=2) as fetcher:
+        results = await asyncio.gather(
+            *(fetcher.fetch(f"{server.url}/{i}") for i in range(8))
+        )
+    assert [r.text for r in results] == [f"héllo {i}" for i in range(8)]
+    assert server.max_in_flight == 2
+
+
+@mark.asyncio
+async def test_per_host_rate_is_limited(server: Server) -> None:
+    started_at = time.monotonic()
+    async with HttpFetcher(per_host_rate=20) as fetcher:
+        await asyncio.gather(*(fetcher.fetch(f"{server.url}/{i}") for i in range(5)))
+    assert time.monotonic() - started_at >= 4 / 20
+
+
+@mark.asyncio
+async def test_transient_errors_are_retried(server: Server) -> None:
+    async with HttpFetcher(backoff=0.01) as fetcher:
+        result = await fetcher.fetch(f"{server.url}/flaky")
+        missing = await fetcher.fetch(f"{server.url}/missing")
+        with pytest.raises(FetchError, match="HTTP 500"):
+            await fetcher.fetch(f"{server.url}/down")
+    assert (result.status, result.attempts) == (200, 3)
+    assert missing.status == 404
+    assert server.hits["missing"] == 1
+    assert server.hits["down"] == 4
+    assert (fetcher.stats.retries, fetcher.stats.failures) == (5, 1)
+
+
+@mark.asyncio
+async def test_body_is_decoded_incrementally(server: Server) -> None:
+    # A chunk size of one byte splits the two-byte "é" across chunks.
+    async with HttpFetcher(chunk_size=1) as fetcher:
+        full = await fetcher.fetch(f"{server.url}/page")
+    async with HttpFetcher(max_bytes=4) as fetcher:
+        truncated = await fetcher.fetch(f"{server.url}/page")
+    assert full.text == "héllo page"
+    assert truncated.text == "hél"
+
+
+@mark.asyncio
+async def test_rate_limited_host_does_not_hold_global_slots(server: Server) -> None:
+    other_url = server.url.replace("127.0.0.1", "localhost")
+    async with HttpFetcher(max_concurrency=1, per_host_rate=4) as fetcher:
+        slow = [
+            asyncio.create_task(fetcher.fetch(f"{server.url}/{i}")) for i in range(4)
+        ]
+        await asyncio.sleep(0)
+        started_at = time.monotonic()
+        await fetcher.fetch(f"{other_url}/other")
+        other_seconds = time.monotonic() - started_at
+        await asyncio.gather(*slow)
+    assert other_seconds < 0.25
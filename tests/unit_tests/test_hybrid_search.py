@@ -0,0 +1,75 @@
+from pathlib import Path
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.runnables import RunnableConfig
+from pytest import MonkeyPatch, mark
+
+from retrieval_agents.modules import retrieval
+from retrieval_agents.utils.hybrid_search import HybridRetriever, LexicalIndex
+
+
+def test_lexical_index_upserts_deletes_and_filters_by_user(tmp_path: Path) -> None:
+    index = LexicalIndex(str(tmp_path / "lexical" / "index.sqlite3"))
+    index.upsert(
+        [
+            Document(id="1", page_content="disk full", metadata={"user_id": "a"}),
+            Document(id="2", page_content="ERR-42 disk", metadata={"user_id": "a"}),
+            Document(id="3", page_content="ERR-42", metadata={"user_id": "b"}),
+        ]
+    )
+    index.upsert(
+        [Document(id="1", page_content="err 42 again", metadata={"user_id": "a"})]
+    )
+
+    found = index.search("What is ERR-42?", k=5, user_id="a")
+    assert [doc.id for doc, _ in found] == ["2", "1"]
+    assert found[0][1] >= found[1][1] > 0
+    assert {doc.id for doc, _ in index.search("err", k=5)} == {"1", "2", "3"}
+    assert index.search("full", user_id="a") == []
+    assert index.search("?!") == []
+
+    index.delete(["2"])
+    assert [doc.id for doc, _ in index.search("disk err", user_id="a")] == ["1"]
+    index.close()
+
+
+@mark.asyncio
+async def test_hybrid_mode_finds_exact_terms_the_embeddings_miss(
+    tmp_path: Path, monkeypatch: MonkeyPatch
+) -> None:
+    monkeypatch.setenv("LOCAL_VECTORSTORE_DIR", str(tmp_path / "vectors"))
+    monkeypatch.setenv("LEXICAL_INDEX_DIR", str(tmp_path / "lexical"))
+    monkeypatch.setattr(
+        retrieval, "get_text_encoder", lambda model: DeterministicFakeEmbedding(size=8)
+    )
+    config: RunnableConfig = {
+        "configurable": {
+            "user_id": "alice",
+            "retriever_provider": "local",
+            "retrieval_mode": "hybrid",
+            "search_kwargs": {"k": 2},
+        }
+    }
+    texts = [f"release notes {i}" for i in range(30)] + ["retry on E1042 timeouts"]
+    docs = retrieval.with_chunk_ids(
+        [Document(page_content=t, metadata={"user_id": "alice"}) for t in texts],
+        "alice",
+    )
+
+    async with retrieval.amake_retriever(config) as retriever:
+        assert isinstance(retriever, HybridRetriever)
+        lexical_index = retrieval.lexical_index_of(retriever)
+        await retrieval.aupsert_documents(
+            retriever.vectorstore, docs, lexical_index=lexical_index
+        )
+        found = await retriever.ainvoke("E1042")
+        assert len(found) == 2
+        assert found[0].page_content == "retry on E1042 timeouts"
+
+        await retrieval.adelete_documents(
+            retriever.vectorstore, [str(docs[-1].id)], lexical_index=lexical_index
+        )
+        found = await retriever.ainvoke("E1042")
+        assert "retry on E1042 timeouts" not in {d.page_content for d in found}
+    retrieval.close_pools()
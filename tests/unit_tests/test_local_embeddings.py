@@ -0,0 +1,102 @@
+import asyncio
+import threading
+
+from langchain_core.embeddings import Embeddings
+from pytest import fixture, mark
+
+from retrieval_agents.utils.local_embeddings import LocalEmbeddingRuntime
+
+
+class FakeEmbeddings(Embeddings):
+    def __init__(self) -> None:
+        self.batches: list[list[str]] = []
+        self.threads: set[str] = set()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.batches.append(list(texts))
+        self.threads.add(threading.current_thread().name)
+        return [[float(len(t)), 0.0] for t in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+    def embed(self, texts: list[str], *, task_type: str) -> list[list[float]]:
+        assert task_type == "search_query"
+        return self.embed_documents(texts)
+
+
+@fixture
+def fake() -> FakeEmbeddings:
+    return FakeEmbeddings()
+
+
+def test_model_is_loaded_once(fake: FakeEmbeddings) -> None:
+    loads = 0
+
+    def loader() -> Embeddings:
+        nonlocal loads
+        loads += 1
+        return fake
+
+    runtime = LocalEmbeddingRuntime("fake", loader=loader)
+    try:
+        assert runtime.embed_query("abc") == [3.0, 0.0]
+        assert runtime.embed_documents(["a", "bb"]) == [[1.0, 0.0], [2.0, 0.0]]
+        assert loads == 1
+        assert fake.threads == {"local-embeddings-fake"}
+        stats = runtime.stats()
+        assert stats.loaded and stats.batches == 2 and stats.embedded_texts == 3
+        assert stats.memory_bytes >= 0
+    finally:
+        runtime.close()
+
+
+@mark.asyncio
+async def test_concurrent_queries_are_batched(fake: FakeEmbeddings) -> None:
+    runtime = LocalEmbeddingRuntime("fake", loader=lambda: fake, max_wait=0.05)
+    try:
+        texts = ["q" * i for i in range(1, 11)]
+        results = await asyncio.gather(*(runtime.aembed_query(t) for t in texts))
+        assert results == [[float(len(t)), 0.0] for t in texts]
+        assert len(fake.batches) < len(texts)
+        assert runtime.stats().queue_depth == 0
+    finally:
+        runtime.close()
+
+
+@mark.asyncio
+async def test_errors_are_propagated(fake: FakeEmbeddings) -> None:
+    def broken_loader() -> Embeddings:
+        raise RuntimeError("no weights")
+
+    runtime = LocalEmbeddingRuntime("fake", loader=broken_loader)
+    try:
+        try:
+            await runtime.aembed_query("abc")
+        except RuntimeError as e:
+            assert str(e) == "no weights"
+        else:
+            raise AssertionError("expected RuntimeError")
+    finally:
+        runtime.close()
+
+
+def test_jobs_racing_close_are_answered(fake: FakeEmbeddings) -> None:
+    runtime = LocalEmbeddingRuntime("fake", loader=lambda: fake, max_wait=0.01)
+    futures = []
+
+    def submit() -> None:
+        for i in range(200):
+            futures.append(runtime._submit("query", [f"q{i}"]))
+
+    submitter = threading.Thread(target=submit)
+    submitter.start()
+    runtime.close()
+    submitter.join()
+
+    for future in futures:
+        # Every job is either served or rejected, never left pending.
+        error = future.exception(timeout=1)
+        assert error is None or isinstance(error, RuntimeError)
+    late = runtime._submit("query", ["late"])
+    assert isinstance(late.exception(timeout=1), RuntimeError)
@@ -0,0 +1,163 @@
+import os
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.runnables import RunnableConfig
+from pytest import MonkeyPatch, mark
+
+from retrieval_agents.modules import retrieval
+from retrieval_agents.utils import local_vectorstore
+from retrieval_agents.utils.local_vectorstore import LocalVectorStore
+
+DIM = 16
+
+
+def _add(store: LocalVectorStore, n: int, user_id: str, seed: int) -> np.ndarray:
+    vectors = np.random.default_rng(seed).normal(size=(n, DIM))
+    store.add_vectors(
+        [f"{user_id}-{i}" for i in range(n)],
+        vectors.tolist(),
+        [f"{user_id} text {i}" for i in range(n)],
+        [{"user_id": user_id, "i": i} for i in range(n)],
+    )
+    normalized: np.ndarray = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return normalized
+
+
+@mark.parametrize("dtype", ["float32", "float16", "int8"])
+def test_search_is_exact_top_k_within_the_user(
+    tmp_path: Path, monkeypatch: MonkeyPatch, dtype: str
+) -> None:
+    monkeypatch.setattr(local_vectorstore, "SCAN_BLOCK_ROWS", 7)
+    store = LocalVectorStore(str(tmp_path), DeterministicFakeEmbedding(size=DIM), dtype)  # type: ignore[arg-type]
+    alice = _add(store, 50, "alice", seed=0)
+    _add(store, 50, "bob", seed=1)
+    query = np.random.default_rng(2).normal(size=DIM)
+
+    results = store.similarity_search_with_score_by_vector(
+        query.tolist(), k=5, filter={"user_id": "alice"}
+    )
+
+    expected = np.argsort(-(alice @ query))[:5]
+    assert [doc.id for doc, _ in results] == [f"alice-{i}" for i in expected]
+    scores = [score for _, score in results]
+    assert scores == sorted(scores, reverse=True)
+    tolerance = {"float32": 1e-5, "float16": 1e-2, "int8": 5e-2}[dtype]
+    np.testing.assert_allclose(
+        scores, (alice[expected] @ query) / np.linalg.norm(query), atol=tolerance
+    )
+    assert all(doc.metadata["user_id"] == "alice" for doc, _ in results)
+
+
+def test_tombstones_upserts_compaction_and_reopening(tmp_path: Path) -> None:
+    embedding = DeterministicFakeEmbedding(size=DIM)
+    store = LocalVectorStore(str(tmp_path), embedding)
+    _add(store, 30, "alice", seed=0)
+    _add(store, 30, "bob", seed=1)
+    _add(store, 30, "alice", seed=3)  # Overwrites every chunk of alice.
+    store.delete([f"bob-{i}" for i in range(10)])
+    query = np.random.default_rng(4).normal(size=DIM).tolist()
+    before = store.similarity_search_with_score_by_vector(query, k=100)
+
+    assert len(store) == 50
+    assert len(before) == 50
+    assert store.get_by_ids(["bob-0", "bob-10"])[0].id == "bob-10"
+
+    assert store.compact() == 40
+    after = store.similarity_search_with_score_by_vector(query, k=100)
+    assert [d.id for d, _ in after] == [d.id for d, _ in before]
+    assert store._user_ranges("alice") == [(0, 30)]
+    assert store._user_ranges("bob") == [(30, 50)]
+    store.close()
+
+    reopened = LocalVectorStore(str(tmp_path), embedding)
+    assert [
+        d.id for d, _ in reopened.similarity_search_with_score_by_vector(query, k=100)
+    ] == [d.id for d, _ in before]
+    assert reopened.similarity_search_by_vector(
+        query, k=3, filter={"user_id": "bob", "i": 12}
+    ) == [
+        Document(
+            id="bob-12",
+            page_content="bob text 12",
+            metadata={"user_id": "bob", "i": 12},
+        )
+    ]
+    reopened.close()
+
+
+@mark.asyncio
+async def test_local_provider_upserts_through_the_retriever(
+    tmp_path: Path, monkeypatch: MonkeyPatch
+) -> None:
+    monkeypatch.setenv("LOCAL_VECTORSTORE_DIR", str(tmp_path))
+    monkeypatch.setattr(
+        retrieval, "get_text_encoder", lambda model: DeterministicFakeEmbedding(size=8)
+    )
+    config: RunnableConfig = {
+        "configurable": {"user_id": "alice", "retriever_provider": "local"}
+    }
+    docs = retrieval.with_chunk_ids(
+        [Document(page_content=t, metadata={"user_id": "alice"}) for t in "abc"],
+        "alice",
+    )
+
+    async with retrieval.amake_retriever(config) as retriever:
+        report = await retrieval.aupsert_documents(retriever.vectorstore, docs)
+        again = await retrieval.aupsert_documents(retriever.vectorstore, docs)
+        found = await retriever.ainvoke("a")
+
+    assert (report.upserted, again.unchanged) == (3, 3)
+    assert {d.page_content for d in found} == {"a", "b", "c"}
+    assert os.listdir(tmp_path) == ["openai_text-embedding-3-small"]
+    retrieval.close_pools()
+
+
+def test_ivfpq_index_is_trained_extended_and_reopened(
+    tmp_path: Path, monkeypatch: MonkeyPatch
+) -> None:
+    monkeypatch.setattr(local_vectorstore, "ANN_TRAIN_MIN_ROWS", 1000)
+    embedding = DeterministicFakeEmbedding(size=DIM)
+    store = LocalVectorStore(str(tmp_path), embedding, index="ivfpq")
+    _add(store, 600, "alice", seed=0)
+    assert store._ivf is None
+    alice = np.concatenate(
+        [_add(store, 600, "bob", seed=1), _add(store, 600, "alice", seed=2)]
+    )
+    ids = [f"bob-{i}" for i in range(600)] + [f"alice-{i}" for i in range(600)]
+    assert store._ivf is not None and os.path.exists(tmp_path / "ivfpq.npz")
+    queries = np.random.default_rng(3).normal(size=(20, DIM))
+
+    def search(query: np.ndarray, **kwargs: Any) -> list[str]:
+        results = store.similarity_search_by_vector(query.tolist(), k=10, **kwargs)
+        return [str(doc.id) for doc in results]
+
+    exact = [search(q, exact=True) for q in queries]
+    assert exact == [[ids[i] for i in np.argsort(-(alice @ q))[:10]] for q in queries]
+    recall = np.mean(
+        [
+            len(set(search(q, nprobe=32, refine=10)) & set(e)) / 10
+            for q, e in zip(queries, exact)
+        ]
+    )
+    assert recall >= 0.8
+    nlist = store._ivf.nlist
+    assert [search(q, nprobe=nlist, refine=1000) for q in queries] == exact
+    filtered = store.similarity_search_by_vector(
+        queries[0].tolist(), k=5, filter={"user_id": "bob"}, nprobe=nlist
+    )
+    assert [doc.metadata["user_id"] for doc in filtered] == ["bob"] * 5
+    store.close()
+
+    store = LocalVectorStore(str(tmp_path), embedding, index="ivfpq")
+    assert store._ivf is not None and store._ivf.nlist == nlist
+    assert [search(q, nprobe=nlist, refine=1000) for q in queries] == exact
+    # Appended rows are assigned to lists without retraining.
+    store.add_vectors(
+        ["new"], [queries[0].tolist()], ["new text"], [{"user_id": "bob"}]
+    )
+    assert search(queries[0])[0] == "new"
+    store.close()
@@ -0,0 +1,98 @@
+import os
+import stat
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+from pytest import MonkeyPatch, fixture
+
+from retrieval_agents.utils.ollama_utils import OllamaError, OllamaManager
+
+STUB = """\
+#!{python}
+import os, signal, sys, time
+from pathlib import Path
+
+state = Path(os.environ["STUB_OLLAMA_STATE"])
+serving, models = state / "serving", state / "models"
+command = sys.argv[1]
+if command == "serve":
+    with open(state / "serve.log", "a") as f:
+        f.write("serve\\n")
+    if os.environ.get("STUB_OLLAMA_FAIL"):
+        sys.exit(3)
+    signal.signal(signal.SIGTERM, lambda *_: (serving.unlink(), sys.exit(0)))
+    serving.touch()
+    while True:
+        time.sleep(0.05)
+elif command == "list":
+    if not serving.exists():
+        sys.exit(1)
+    print("NAME  ID  SIZE  MODIFIED")
+    for name in models.read_text().split() if models.exists() else []:
+        print(f"{{name}}  abc  1 GB  now")
+elif command == "pull":
+    time.sleep(0.1)
+    with open(models, "a") as f:
+        f.write(sys.argv[2] + "\\n")
+    with open(state / "pull.log", "a") as f:
+        f.write(sys.argv[2] + "\\n")
+"""
+
+
+@fixture
+def state(tmp_path: Path, monkeypatch: MonkeyPatch) -> Path:
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    binary = bin_dir / "ollama"
+    binary.write_text(STUB.format(python=sys.executable))
+    binary.chmod(binary.stat().st_mode | stat.S_IEXEC)
+    state = tmp_path / "state"
+    state.mkdir()
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("STUB_OLLAMA_STATE", str(state))
+    return state
+
+
+def _lines(path: Path) -> list[str]:
+    return path.read_text().split() if path.exists() else []
+
+
+def test_server_started_once_and_model_pulled_once(state: Path) -> None:
+    manager = OllamaManager(startup_timeout=10)
+    try:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(manager.ensure_model, ["llama3.1"] * 4))
+        manager.ensure_model("llama3.1:latest")
+
+        assert _lines(state / "serve.log") == ["serve"]
+        assert _lines(state / "pull.log") == ["llama3.1"]
+        assert manager.local_models() == {"llama3.1:latest"}
+        assert manager.pid is not None
+    finally:
+        manager.shutdown()
+    assert not (state / "serving").exists()
+    assert manager.pid is None
+
+
+def test_running_server_is_reused(state: Path) -> None:
+    (state / "serving").touch()
+    (state / "models").write_text("qwen2.5:7b\n")
+    manager = OllamaManager()
+
+    manager.ensure_model("qwen2.5:7b")
+    manager.shutdown()
+
+    assert not (state / "serve.log").exists()
+    assert not (state / "pull.log").exists()
+    assert (state / "serving").exists()
+
+
+def test_server_that_exits_is_reported(state: Path, monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setenv("STUB_OLLAMA_FAIL", "1")
+    manager = OllamaManager(startup_timeout=10)
+
+    with pytest.raises(OllamaError, match="exited with code 3"):
+        manager.ensure_server()
+    assert _lines(state / "serve.log") == ["serve"]
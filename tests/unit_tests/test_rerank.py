@@ -0,0 +1,64 @@
+from typing import Any
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from langchain_core.documents import Document
+from pytest import MonkeyPatch, mark
+
+from retrieval_agents.modules.simple_rag import SimpleRagState, retrieve
+from retrieval_agents.utils import rerank
+
+
+def test_bm25_scores_prefer_rare_terms_and_short_texts() -> None:
+    texts = [
+        "timeout",
+        "disk timeout",
+        "E1042 retry timeout",
+        "E1042 retry timeout " + "padding " * 20,
+        "",
+    ]
+    scores = rerank.bm25_scores("retry E1042 timeout", texts)
+    assert scores.argsort()[::-1].tolist()[:2] == [2, 3]
+    assert scores[4] == 0
+    assert rerank.bm25_scores("?!", texts).tolist() == [0.0] * 5
+
+
+@mark.asyncio
+@patch("retrieval_agents.modules.simple_rag.retrieval.make_retriever")
+@mark.parametrize("method", ["bm25", "cross_encoder"])
+async def test_retrieve_over_fetches_and_keeps_the_reranked_top_m(
+    mock_make_retriever: MagicMock, monkeypatch: MonkeyPatch, method: str
+) -> None:
+    candidates = [Document(page_content=f"note {i}") for i in range(9)]
+    candidates.append(Document(page_content="retry on E1042 timeouts"))
+    mock_retriever = MagicMock()
+    mock_retriever.ainvoke = AsyncMock(return_value=candidates)
+    mock_make_retriever.return_value.__enter__.return_value = mock_retriever
+    mock_make_retriever.return_value.__exit__.return_value = None
+
+    class FakeCrossEncoder:
+        def predict(self, pairs: list[tuple[str, str]]) -> list[float]:
+            return [float("E1042" in text) for _, text in pairs]
+
+    def load(model: str) -> Any:
+        assert model == "tiny"
+        return FakeCrossEncoder()
+
+    monkeypatch.setattr(rerank, "_load_cross_encoder", load)
+    result = await retrieve(
+        SimpleRagState(messages=[], queries=["E1042 timeouts"]),
+        config={
+            "configurable": {
+                "user_id": "test_user",
+                "rerank": method,
+                "rerank_fetch_k": 10,
+                "rerank_top_m": 2,
+                "rerank_model": "tiny",
+            }
+        },
+    )
+
+    docs = result["retrieved_docs"]
+    assert mock_retriever.ainvoke.await_args.kwargs == {"k": 10}
+    assert len(docs) == 2
+    assert docs[0].page_content == "retry on E1042 timeouts"
+    assert docs[0].metadata["rerank_score"] > docs[1].metadata["rerank_score"]
@@ -0,0 +1,136 @@
+import sys
+import threading
+import time
+from types import ModuleType
+from typing import Any, Iterator
+from unittest.mock import MagicMock, patch
+
+from langchain_core.runnables import RunnableConfig
+from langchain_core.vectorstores import VectorStore
+from pytest import fixture, mark
+
+from retrieval_agents.modules import retrieval
+from retrieval_agents.utils.resource_pool import ResourcePool, fingerprint
+
+
+def test_get_counts_hits_and_misses() -> None:
+    pool: ResourcePool[str, object] = ResourcePool("test", max_size=2)
+    factory = MagicMock(side_effect=lambda: object())
+
+    first = pool.get("a", factory)
+    second = pool.get("a", factory)
+
+    assert first is second
+    assert factory.call_count == 1
+    stats = pool.stats()
+    assert (stats.hits, stats.misses, stats.size) == (1, 1, 1)
+    assert stats.hit_rate == 0.5
+
+
+def test_lru_eviction_closes_least_recently_used() -> None:
+    closed: list[str] = []
+    pool: ResourcePool[str, str] = ResourcePool("test", max_size=2, close=closed.append)
+
+    pool.get("a", lambda: "A")
+    pool.get("b", lambda: "B")
+    pool.get("a", lambda: "A2")  # "a" becomes most recently used
+    pool.get("c", lambda: "C")
+
+    assert closed == ["B"]
+    assert pool.get("a", lambda: "A3") == "A"
+    assert pool.stats().evictions == 1
+
+
+def test_leased_value_is_closed_after_release() -> None:
+    closed: list[str] = []
+    pool: ResourcePool[str, str] = ResourcePool("test", max_size=1, close=closed.append)
+
+    with pool.lease("a", lambda: "A") as value:
+        pool.get("b", lambda: "B")
+        assert value == "A"
+        assert closed == []
+    assert closed == ["A"]
+
+
+def test_concurrent_lookups_build_once() -> None:
+    pool: ResourcePool[str, object] = ResourcePool("test", max_size=4)
+    calls = 0
+
+    def slow_factory() -> object:
+        nonlocal calls
+        calls += 1
+        time.sleep(0.05)
+        return object()
+
+    results: list[object] = []
+    threads = [
+        threading.Thread(target=lambda: results.append(pool.get("k", slow_factory)))
+        for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert calls == 1
+    assert all(r is results[0] for r in results)
+
+
+@mark.asyncio
+async def test_aget_reuses_value() -> None:
+    pool: ResourcePool[str, object] = ResourcePool("test", max_size=1)
+    value = await pool.aget("a", object)
+    assert await pool.aget("a", object) is value
+    assert pool.stats().hits == 1
+
+
+def test_close_releases_all_entries() -> None:
+    closed: list[str] = []
+    pool: ResourcePool[str, str] = ResourcePool("test", max_size=4, close=closed.append)
+    pool.get("a", lambda: "A")
+    pool.get("b", lambda: "B")
+
+    pool.close()
+
+    assert sorted(closed) == ["A", "B"]
+    assert len(pool) == 0
+
+
+def test_fingerprint_does_not_leak_secret() -> None:
+    digest = fingerprint("sk-secret")
+    assert "sk-secret" not in digest
+    assert digest == fingerprint("sk-secret")
+    assert digest != fingerprint("sk-other")
+
+
+@fixture
+def fake_chroma(monkeypatch: Any, tmp_path: Any) -> Iterator[MagicMock]:
+    monkeypatch.setenv("CHROMA_DIR", str(tmp_path))
+    module = ModuleType("langchain_chroma")
+    # Retrievers validate that they wrap a vector store.
+    chroma_cls = MagicMock(return_value=MagicMock(spec=VectorStore))
+    module.Chroma = chroma_cls  # type: ignore[attr-defined]
+    with patch.dict(sys.modules, {"langchain_chroma": module}):
+        yield chroma_cls
+    retrieval.close_pools()
+
+
+@patch("retrieval_agents.modules.retrieval.make_text_encoder")
+def test_make_retriever_reuses_encoder_and_store(
+    mock_make_text_encoder: MagicMock, fake_chroma: MagicMock
+) -> None:
+    config: RunnableConfig = {
+        "configurable": {
+            "user_id": "test_user",
+            "retriever_provider": "chroma",
+            "embedding_model": "openai/test-pool-model",
+        }
+    }
+    with retrieval.make_retriever(config):
+        pass
+    with retrieval.make_retriever(config):
+        pass
+
+    assert mock_make_text_encoder.call_count == 1
+    assert fake_chroma.call_count == 1
+    assert retrieval.pool_stats()["vectorstores"].hits >= 1
@@ -0,0 +1,136 @@
+from typing import Any
+from unittest.mock import AsyncMock, MagicMock
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.vectorstores import InMemoryVectorStore
+from pytest import mark, raises
+
+from retrieval_agents.modules.retrieval import (
+    BulkOptions,
+    IngestError,
+    aupsert_documents,
+    with_chunk_ids,
+)
+
+
+def test_chunk_ids_depend_on_owner_source_position_and_content() -> None:
+    docs = [
+        Document(page_content="a", metadata={"source": "x"}),
+        Document(page_content="a", metadata={"source": "x"}),
+        Document(page_content="a", metadata={"source": "y"}),
+    ]
+    ids = [d.id for d in with_chunk_ids(docs, "user")]
+
+    assert len(set(ids)) == 3
+    assert [d.id for d in with_chunk_ids(docs, "user")] == ids
+    assert [d.id for d in with_chunk_ids(docs, "other")] != ids
+    assert docs[0].id is None
+
+
+def test_chunk_ids_without_source_depend_on_content_only() -> None:
+    first = with_chunk_ids([Document(page_content=t) for t in ["a", "b"]], "user")
+    second = with_chunk_ids([Document(page_content=t) for t in ["c", "b"]], "user")
+
+    assert first[1].id == second[1].id
+    assert first[0].id != first[1].id
+
+
+@mark.asyncio
+async def test_resubmitted_chunks_are_not_duplicated() -> None:
+    store = InMemoryVectorStore(DeterministicFakeEmbedding(size=4))
+    docs = with_chunk_ids([Document(page_content=t) for t in ["a", "b"]], "user")
+
+    first = await aupsert_documents(store, docs)
+    more = with_chunk_ids([Document(page_content=t) for t in ["a", "b", "c"]], "user")
+    second = await aupsert_documents(store, more + more[:1])
+
+    assert (first.upserted, first.unchanged) == (2, 0)
+    assert (second.submitted, second.duplicates) == (4, 1)
+    assert (second.unchanged, second.upserted) == (2, 1)
+    assert len(store.store) == 3
+
+
+@mark.asyncio
+async def test_known_ids_skip_the_store_lookup() -> None:
+    store = MagicMock()
+    store.aget_by_ids = AsyncMock(side_effect=NotImplementedError)
+    store.aadd_documents = AsyncMock()
+    docs = with_chunk_ids([Document(page_content=t) for t in ["a", "b"]], "user")
+
+    report = await aupsert_documents(store, docs, known_ids={docs[0].id or ""})
+
+    store.aget_by_ids.assert_awaited_once_with([docs[1].id])
+    store.aadd_documents.assert_awaited_once_with([docs[1]], ids=[docs[1].id])
+    assert (report.unchanged, report.upserted) == (1, 1)
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    embedded: list[str] = []
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.embedded.extend(texts)
+        return self.embed_documents(texts)
+
+
+class Chroma:
+    """Stands in for ``langchain_chroma.Chroma``, dispatched by class name."""
+
+    def __init__(self, failures: int) -> None:
+        self.embeddings = CountingEmbeddings(size=4, embedded=[])
+        self._collection = MagicMock()
+        self.rows: dict[str, list[float]] = {}
+        self.failures = failures
+
+        def upsert(
+            ids: list[str],
+            embeddings: list[list[float]],
+            metadatas: list[dict[str, Any]],
+            documents: list[str],
+        ) -> None:
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError("write failed")
+            self.rows.update(zip(ids, embeddings))
+
+        self._collection.upsert.side_effect = upsert
+
+    async def aget_by_ids(self, ids: list[str]) -> list[Document]:
+        return []
+
+
+OPTIONS = BulkOptions(
+    embedding_batch_size=2,
+    embedding_concurrency=2,
+    write_batch_size=3,
+    max_retries=2,
+    backoff=0,
+)
+
+
+@mark.asyncio
+async def test_bulk_writes_are_retried_without_re_embedding() -> None:
+    store = Chroma(failures=1)
+    docs = with_chunk_ids([Document(page_content=str(i)) for i in range(7)], "user")
+
+    report = await aupsert_documents(store, docs, options=OPTIONS)  # type: ignore[arg-type]
+
+    assert sorted(store.embeddings.embedded) == [str(i) for i in range(7)]
+    assert set(store.rows) == {d.id for d in docs}
+    writes = [len(c.kwargs["ids"]) for c in store._collection.upsert.call_args_list]
+    assert writes == [3, 3, 3, 1]
+    assert (report.upserted, report.retries, report.failed) == (7, 1, 0)
+    assert report.as_dict()["docs_per_second"] > 0
+
+
+@mark.asyncio
+async def test_chunks_failing_every_retry_are_reported() -> None:
+    store = Chroma(failures=100)
+    docs = with_chunk_ids([Document(page_content=str(i)) for i in range(4)], "user")
+
+    with raises(IngestError) as info:
+        await aupsert_documents(store, docs, options=OPTIONS)  # type: ignore[arg-type]
+
+    assert sorted(info.value.failed_ids) == sorted(str(d.id) for d in docs)
+    assert (info.value.report.upserted, info.value.report.failed) == (0, 4)
+    assert len(store.embeddings.embedded) == 4
@@ -0,0 +1,80 @@
+from pathlib import Path
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.runnables import RunnableConfig
+from pytest import MonkeyPatch, mark
+
+from retrieval_agents.modules import retrieval
+from retrieval_agents.utils import scored_search
+from retrieval_agents.utils.scored_search import (
+    ScoredRetriever,
+    embed_query,
+    recall_query_embedding,
+)
+
+
+@mark.asyncio
+async def test_retriever_scores_thresholds_and_diversifies(
+    tmp_path: Path, monkeypatch: MonkeyPatch
+) -> None:
+    monkeypatch.setenv("LOCAL_VECTORSTORE_DIR", str(tmp_path))
+    embedding = DeterministicFakeEmbedding(size=16)
+    monkeypatch.setattr(retrieval, "get_text_encoder", lambda model: embedding)
+    # Three copies of the query text in different sources, and unrelated chunks.
+    texts = ["disk full"] * 3 + [f"note {i}" for i in range(20)]
+    docs = retrieval.with_chunk_ids(
+        [
+            Document(
+                page_content=t, metadata={"user_id": "alice", "n": i, "source": str(i)}
+            )
+            for i, t in enumerate(texts)
+        ],
+        "alice",
+    )
+
+    def config(**configurable: object) -> RunnableConfig:
+        return {
+            "configurable": {
+                "user_id": "alice",
+                "retriever_provider": "local",
+                "search_kwargs": {"k": 3},
+                **configurable,
+            }
+        }
+
+    async with retrieval.amake_retriever(config()) as retriever:
+        assert isinstance(retriever, ScoredRetriever)
+        await retrieval.aupsert_documents(retriever.vectorstore, docs)
+        found = await retriever.ainvoke("disk full")
+    assert [d.page_content for d in found] == ["disk full"] * 3
+    assert [round(d.metadata["score"], 4) for d in found] == [1.0] * 3
+
+    async with retrieval.amake_retriever(config(score_threshold=0.99)) as retriever:
+        assert len(await retriever.ainvoke("disk full")) == 3
+        assert await retriever.ainvoke("unrelated query") == []
+
+    async with retrieval.amake_retriever(config(score_margin=0.01)) as retriever:
+        found = await retriever.ainvoke("note 7")
+    assert [d.page_content for d in found] == ["note 7"]
+
+    async with retrieval.amake_retriever(config(mmr_lambda=0.5)) as retriever:
+        found = await retriever.ainvoke("disk full")
+    assert [d.page_content for d in found].count("disk full") == 1
+    assert found[0].metadata["score"] > found[1].metadata["score"]
+    retrieval.close_pools()
+
+
+def test_query_embeddings_are_not_shared_across_encoders_with_the_same_id(
+    monkeypatch: MonkeyPatch,
+) -> None:
+    # An encoder evicted from the pool and its replacement can share an id.
+    monkeypatch.setattr(scored_search, "id", lambda obj: 0, raising=False)
+    first = DeterministicFakeEmbedding(size=4)
+    second = DeterministicFakeEmbedding(size=8)
+
+    embed_query(first, "q")
+
+    assert recall_query_embedding(second, "q") is None
+    assert len(embed_query(second, "q")) == 8
+    assert recall_query_embedding(second, "q") == embed_query(second, "q")
@@ -0,0 +1,31 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from langchain_core.documents import Document
+from pytest import mark
+
+from retrieval_agents.utils import text_splitting
+
+
+@mark.asyncio
+@mark.usefixtures("char_tokens")
+async def test_parallel_split_keeps_document_order() -> None:
+    docs = [
+        Document(page_content=f"doc {i} " + "word " * i, metadata={"source": str(i)})
+        for i in range(20)
+    ]
+    expected = text_splitting.split_documents(docs, 12, 4)
+
+    with (
+        patch.object(text_splitting, "PARALLEL_MIN_CHARS", 0),
+        patch.object(
+            text_splitting, "_get_process_pool", return_value=ThreadPoolExecutor(4)
+        ),
+    ):
+        chunks = await text_splitting.asplit_documents(docs, 12, 4)
+
+    assert chunks == expected
+    assert [c.metadata["token_count"] for c in chunks] == [
+        len(c.page_content) for c in chunks
+    ]
+    assert max(c.metadata["token_count"] for c in chunks) <= 12
@@ -0,0 +1,199 @@
+import asyncio
+import sys
+from pathlib import Path
+from typing import Any, AsyncGenerator
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest_asyncio
+from aiohttp import web
+from langchain_core.documents import Document
+from pytest import mark
+
+from retrieval_agents.modules import web_indexer as web_indexer_graph
+from retrieval_agents.utils.fetcher import FetchError
+
+web_indexer = sys.modules["retrieval_agents.modules.web_indexer"]
+
+
+def _page(url: str) -> Document:
+    return Document(page_content="alpha\n\nbeta", metadata={"source": url})
+
+
+@mark.asyncio
+@mark.usefixtures("char_tokens")
+@patch.object(web_indexer.retrieval, "make_retriever")
+async def test_streaming_indexes_before_the_crawl_finishes(
+    mock_make_retriever: MagicMock,
+) -> None:
+    first_batch_indexed = asyncio.Event()
+    batches: list[list[Document]] = []
+
+    async def aadd_documents(docs: list[Document], ids: list[str]) -> None:
+        batches.append(docs)
+        first_batch_indexed.set()
+
+    mock_retriever = MagicMock()
+    mock_retriever.vectorstore.aget_by_ids = AsyncMock(return_value=[])
+    mock_retriever.vectorstore.aadd_documents = AsyncMock(side_effect=aadd_documents)
+    mock_make_retriever.return_value.__enter__.return_value = mock_retriever
+    mock_make_retriever.return_value.__exit__.return_value = None
+
+    async def fetch_page(fetcher: Any, url: str, crawl: Any) -> list[Document]:
+        if url == "https://example.com/broken":
+            raise ConnectionError("boom")
+        if url == "https://example.com/last":
+            # Only completes if chunks of earlier pages were already indexed.
+            await asyncio.wait_for(first_batch_indexed.wait(), timeout=5)
+        return [_page(url)]
+
+    urls = [f"https://example.com/{i}" for i in range(4)]
+    urls += ["https://example.com/broken", "https://example.com/last"]
+    config: Any = {
+        "configurable": {
+            "user_id": "test_user",
+            "streaming": True,
+            "fetch_concurrency": 2,
+            "queue_size": 1,
+            "index_batch_size": 2,
+            "chunk_size": 5,
+        }
+    }
+    with patch.object(web_indexer, "_fetch_page", side_effect=fetch_page):
+        result = await web_indexer_graph.ainvoke({"urls": urls}, config)
+
+    stages = result["summary"]["stages"]
+    assert stages["fetch"]["items_in"] == 6
+    assert stages["fetch"]["items_out"] == 5
+    assert stages["fetch"]["errors"] == 1
+    assert stages["split"]["items_in"] == 5
+    assert stages["split"]["items_out"] == 10
+    assert stages["index"]["items_out"] == 10
+    assert [len(b) for b in batches] == [2, 2, 2, 2, 2]
+    assert all(d.metadata["user_id"] == "test_user" for b in batches for d in b)
+    assert all(d.metadata["token_count"] <= 5 for b in batches for d in b)
+    mock_make_retriever.assert_called_once()
+
+
+@mark.asyncio
+async def test_load_web_skips_failed_pages() -> None:
+    async def fetch_page(fetcher: Any, url: str, crawl: Any) -> list[Document]:
+        if url == "https://example.com/missing":
+            raise FetchError(url, "HTTP 404")
+        return [_page(url)]
+
+    urls = ["https://example.com/0", "https://example.com/missing"]
+    urls += ["https://example.com/1"]
+    config: Any = {"configurable": {"user_id": "test_user"}}
+    with patch.object(web_indexer, "_fetch_page", side_effect=fetch_page):
+        result = await web_indexer.load_web(
+            web_indexer.WebIndexerState(urls=urls, docs=[]), config=config
+        )
+
+    assert [d.metadata["source"] for d in result["docs"]] == [
+        "https://example.com/0",
+        "https://example.com/1",
+    ]
+
+
+class Site:
+    def __init__(self) -> None:
+        self.pages = {
+            "etag": ("alpha\n\nbeta", "v1"),
+            "static": ("gamma", None),
+            "changing": ("delta\n\nepsilon", None),
+        }
+        self.requests: list[tuple[str, int]] = []
+        self.url = ""
+
+    async def handle(self, request: web.Request) -> web.Response:
+        name = request.match_info["name"]
+        text, etag = self.pages[name]
+        if etag is not None and request.headers.get("If-None-Match") == etag:
+            self.requests.append((name, 304))
+            return web.Response(status=304, headers={"ETag": etag})
+        self.requests.append((name, 200))
+        return web.Response(text=text, headers={"ETag": etag} if etag else {})
+
+
+@pytest_asyncio.fixture
+async def site() -> AsyncGenerator[Site, None]:
+    site = Site()
+    app = web.Application()
+    app.router.add_get("/{name}", site.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    tcp_site = web.TCPSite(runner, "127.0.0.1", 0)
+    await tcp_site.start()
+    port = tcp_site._server.sockets[0].getsockname()[1]  # type: ignore[union-attr]
+    site.url = f"http://127.0.0.1:{port}"
+    yield site
+    await runner.cleanup()
+
+
+@mark.asyncio
+@mark.parametrize("streaming", [True, False])
+@mark.usefixtures("char_tokens")
+@patch.object(web_indexer.retrieval, "make_retriever")
+async def test_recrawl_only_replaces_changed_pages(
+    mock_make_retriever: MagicMock, site: Site, tmp_path: Path, streaming: bool
+) -> None:
+    mock_retriever = MagicMock()
+    mock_retriever.vectorstore.aget_by_ids = AsyncMock(return_value=[])
+    mock_retriever.vectorstore.aadd_documents = AsyncMock()
+    mock_retriever.vectorstore.adelete = AsyncMock()
+    mock_make_retriever.return_value.__enter__.return_value = mock_retriever
+    mock_make_retriever.return_value.__exit__.return_value = None
+    config: Any = {
+        "configurable": {
+            "user_id": "test_user",
+            "streaming": streaming,
+            "crawl_state_path": str(tmp_path / "crawl.sqlite3"),
+            "chunk_size": 10,
+        }
+    }
+    urls = [f"{site.url}/{name}" for name in site.pages]
+
+    def parse_html(url: str, html: str) -> Document:
+        return Document(page_content=html, metadata={"source": url})
+
+    with patch.object(web_indexer, "_parse_html", side_effect=parse_html):
+        await web_indexer_graph.ainvoke({"urls": urls}, config)
+        [first] = mock_retriever.vectorstore.aadd_documents.await_args_list
+        first_ids = dict(zip(first.kwargs["ids"], first.args[0]))
+        mock_retriever.vectorstore.aadd_documents.reset_mock()
+        site.requests.clear()
+
+        site.pages["changing"] = ("zeta", None)
+        await web_indexer_graph.ainvoke({"urls": urls}, config)
+
+    assert sorted(site.requests) == [("changing", 200), ("etag", 304), ("static", 200)]
+    [second] = mock_retriever.vectorstore.aadd_documents.await_args_list
+    assert [d.page_content for d in second.args[0]] == ["zeta"]
+    [delete] = mock_retriever.vectorstore.adelete.await_args_list
+    assert sorted(first_ids[i].page_content for i in delete.kwargs["ids"]) == [
+        "delta",
+        "epsilon",
+    ]
+
+
+@mark.asyncio
+@patch.object(
+    web_indexer.retrieval,
+    "aupsert_documents",
+    AsyncMock(return_value=web_indexer.retrieval.UpsertReport()),
+)
+async def test_concurrent_adds_finish_each_page_once() -> None:
+    store = MagicMock()
+    crawl = web_indexer._Crawl(
+        store, "test_user", {}, web_indexer.retrieval.BulkOptions()
+    )
+    chunks = []
+    for url in ["a", "b"]:
+        crawl.expect(
+            Document(page_content="", metadata={"source": url, "content_hash": url}), 1
+        )
+        chunks.append(Document(id=url, page_content="", metadata={"source": url}))
+
+    await asyncio.gather(crawl.add(MagicMock(), chunks), crawl.add(MagicMock(), []))
+
+    assert sorted(c.args[1] for c in store.put.call_args_list) == ["a", "b"]